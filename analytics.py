@@ -0,0 +1,163 @@
+# analytics.py
+#
+# Dashboard series computed with NumPy. Ledger and sales columns are read as
+# plain integers (day number, ids, sen) straight from the cursor into arrays,
+# a partition at a time; no ORM object or Decimal is built per row. numpy is
+# an optional dependency, imported only when these functions are called.
+
+import itertools
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import select, func, cast, type_coerce, Integer
+
+from models import db, Ledger, Transaction, TransactionItem, Product, account_id_of
+from ledger import _day_after
+
+ANALYTICS_CHUNK = 100000
+
+CASH_ACCOUNTS   = ('Kas Tunai',)
+MA_WINDOW       = 7       # days in the cash-flow moving average
+SALES_WINDOW    = 30      # days of sales behind sell-through and stock-days
+TOP_PRODUCTS    = 20
+
+_EPOCH = date(1970, 1, 1)
+
+
+def _numpy():
+    import numpy    # optional dependency, only needed for analytics
+    return numpy
+
+
+def _day_number(column):
+    # whole days since 1970-01-01, computed by SQLite
+    return cast(func.julianday(func.date(column)) - 2440587.5, Integer)
+
+
+def _sen(column):
+    # the raw integer behind a Money column, without the Decimal conversion
+    return type_coerce(column, Integer)
+
+
+def load_columns(stmt, chunk=ANALYTICS_CHUNK):
+    """Run ``stmt`` (integer columns only) and return one int64 array per column."""
+    np = _numpy()
+    width  = len(stmt.selected_columns)
+    parts  = []
+    result = db.session.execute(stmt.execution_options(yield_per=chunk))
+    for rows in result.partitions(chunk):
+        flat = np.fromiter(itertools.chain.from_iterable(rows), dtype=np.int64,
+                           count=len(rows) * width)
+        parts.append(flat.reshape(-1, width))
+    block = np.concatenate(parts) if parts else np.zeros((0, width), dtype=np.int64)
+    return [block[:, i] for i in range(width)]
+
+
+def moving_average(values, window):
+    """Trailing mean over ``window`` points; the first window-1 points are NaN."""
+    np = _numpy()
+    values = np.asarray(values, dtype=np.float64)
+    out    = np.full(values.shape, np.nan)
+    if window > 0 and len(values) >= window:
+        csum = np.cumsum(np.concatenate(([0.0], values)))
+        out[window - 1:] = (csum[window:] - csum[:-window]) / window
+    return out
+
+
+def _rupiah(sen):
+    return [None if v != v else round(float(v) / 100, 2) for v in sen]    # NaN -> None
+
+
+# ------------------------------------------------------------------------------
+# Cash flow
+# ------------------------------------------------------------------------------
+
+def cash_flow(start, end, accounts=CASH_ACCOUNTS, window=MA_WINDOW):
+    """Daily inflow/outflow/net and closing balance of the cash accounts.
+
+    Days without postings are included with zeros, so the series can be
+    charted as is. Amounts are rupiah floats.
+    """
+    np = _numpy()
+    ids = [i for i in (account_id_of(a, create=False) for a in accounts) if i is not None]
+    day0    = (start - _EPOCH).days
+    n_days  = (end - start).days + 1
+    in_cash = Ledger.account_id.in_(ids)
+    since   = datetime.combine(start, datetime.min.time())
+
+    opening = db.session.execute(
+        select(func.coalesce(func.sum(_sen(Ledger.debit) - _sen(Ledger.kredit)), 0))
+        .where(in_cash, Ledger.tanggal < since)).scalar_one()
+    days, debit, kredit = load_columns(
+        select(_day_number(Ledger.tanggal), _sen(Ledger.debit), _sen(Ledger.kredit))
+        .where(in_cash, Ledger.tanggal >= since, Ledger.tanggal < _day_after(end)))
+
+    # float64 sums stay exact below 2**53 sen per day
+    idx     = days - day0
+    inflow  = np.bincount(idx, weights=debit,  minlength=n_days)
+    outflow = np.bincount(idx, weights=kredit, minlength=n_days)
+    net     = inflow - outflow
+    balance = opening + np.cumsum(net)
+
+    return {
+        'dates':   [(start + timedelta(days=i)).isoformat() for i in range(n_days)],
+        'inflow':  _rupiah(inflow),
+        'outflow': _rupiah(outflow),
+        'net':     _rupiah(net),
+        'net_ma':  _rupiah(moving_average(net, window)),
+        'balance': _rupiah(balance),
+        'window':  window,
+    }
+
+
+# ------------------------------------------------------------------------------
+# Stock
+# ------------------------------------------------------------------------------
+
+def stock_outlook(end, days=SALES_WINDOW, limit=TOP_PRODUCTS):
+    """Sell-through and stock-days remaining per product over the last ``days``.
+
+    sell_through = sold / (sold + stock); stock_days = stock / average daily
+    units sold. Only products that sold anything are returned, fewest stock
+    days first.
+    """
+    np = _numpy()
+    start = datetime.combine(end - timedelta(days=days - 1), datetime.min.time())
+    product_ids, stock = load_columns(select(Product.id, Product.stock))
+    sold_pid, qty = load_columns(
+        select(TransactionItem.product_id, TransactionItem.quantity)
+        .join(Transaction, Transaction.id == TransactionItem.transaction_id)
+        .where(Transaction.date >= start, Transaction.date < _day_after(end)))
+    if not len(product_ids):
+        return []
+
+    size = int(max(product_ids.max(), sold_pid.max() if len(sold_pid) else 0)) + 1
+    sold = np.bincount(sold_pid, weights=qty, minlength=size)[product_ids]
+    stock = np.maximum(stock, 0).astype(np.float64)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sell_through = np.where(sold + stock > 0, sold / (sold + stock), 0.0)
+        stock_days   = stock / (sold / days)
+
+    picked = np.flatnonzero(sold > 0)
+    picked = picked[np.lexsort((-sold[picked], stock_days[picked]))][:limit]
+    names  = dict(db.session.execute(
+        select(Product.id, Product.name).where(Product.id.in_(product_ids[picked].tolist()))).all())
+    return [{
+        'product_id':   int(product_ids[i]),
+        'name':         names.get(int(product_ids[i])),
+        'stock':        int(stock[i]),
+        'sold':         int(sold[i]),
+        'sell_through': round(float(sell_through[i]), 4),
+        'stock_days':   round(float(stock_days[i]), 1),
+    } for i in picked]
+
+
+def dashboard(start, end, window=MA_WINDOW, days=SALES_WINDOW, limit=TOP_PRODUCTS):
+    """Everything the admin index charts, as one JSON-ready dict."""
+    return {
+        'start':        start.isoformat(),
+        'end':          end.isoformat(),
+        'cash_flow':    cash_flow(start, end, window=window),
+        'stock':        stock_outlook(end, days=days, limit=limit),
+        'sales_window': days,
+    }
@@ -1,48 +1,111 @@
 # app.py
 
-from flask import Flask, session, redirect, url_for, flash, request
+import click
+import os
+import json
+import importlib.util
+from flask import (Flask, session, redirect, url_for, flash, request, jsonify,
+                   Response, stream_with_context)
 from flask_sqlalchemy import SQLAlchemy
 from flask_admin import Admin, BaseView, expose, AdminIndexView
 from flask_admin.contrib.sqla import ModelView
+from flask_admin.contrib.sqla.form import AdminModelConverter
+from flask_admin.contrib.sqla.ajax import QueryAjaxModelLoader
+from flask_admin.model.ajax import DEFAULT_PAGE_SIZE
+from flask_admin.model.form import converts
 from flask_admin.form.widgets import DatePickerWidget
 from wtforms import Form, StringField, PasswordField, validators
-from wtforms.fields import SelectField, DateField, HiddenField
+from wtforms.fields import SelectField, DateField, HiddenField, DecimalField, IntegerField
 from flask_admin.model.form import InlineFormAdmin
-from sqlalchemy import text
+from flask_admin.menu import MenuLink
+from flask_admin.actions import action
+from markupsafe import Markup
+from sqlalchemy import text, update, inspect
 from sqlalchemy.exc import SQLAlchemyError
 from decimal import Decimal
-from datetime import datetime
+from datetime import datetime, date, timedelta
 from jinja2 import Template
 # filterequal
-from flask_admin.contrib.sqla.filters import FilterEqual
+from flask_admin.contrib.sqla.filters import FilterEqual, IntEqualFilter
 
+from config import Config
 from models import (
     db,
+    install_sqlite_pragmas,
+    Account,
     Product,
     Transaction,
     TransactionItem,
+    SalesDaily,
     Ledger,
     JurnalUmum,
     NeracaSaldoAwal,
     NeracaSaldo,
-    get_last_saldo,
-    LedgerMerged
+    LedgerMerged,
+    AccountBalance,
+    ACCOUNT_CATEGORIES,
+    DEFAULT_ACCOUNTS,
+    account_names,
+    account_choices,
+    invalidate_accounts,
+    ensure_accounts,
+    migrate_account_ids,
+    migrate_money_columns,
+    post_journal,
+    JournalEntry,
+    StockMovement,
+    backfill_journal_entries,
+    SOURCE_TYPES,
+    rebuild_account_balances, rebuild_ledger_saldo,
+    ensure_columns,
+    ensure_indexes,
+    ensure_ledger_merged,
+    drop_ledger_merged_view,
+    rebuild_ledger_merged,
+    check_query_plans
 )
+from sales import (post_sales_batch, sale_journal_entry, reserve_stock, record_daily_sales,
+                   rebuild_sales_daily, sales_vs_last_week)
+from export import (ledger_rows, sales_rows, merged_rows, stream_csv, stream_xlsx,
+                    LEDGER_HEADER, SALES_HEADER, MERGED_HEADER)
+from reports import financial_statements
+from inventory import (issue_stock, receive_stock, inventory_journal_entry, revalue_inventory,
+                       product_margins, COSTING_METHODS, ADJUSTMENT_ACCOUNT)
+from idempotency import (IDEMPOTENCY_HEADER, IdempotencyConflict, DuplicateRequest,
+                         new_idempotency_key, fingerprint, check_key, replay, record,
+                         purge_idempotency_keys)
+from catalog import product_by_id, product_by_sku, invalidate_catalog
+from analytics import dashboard, MA_WINDOW, SALES_WINDOW, TOP_PRODUCTS
+from search import (ensure_search_index, rebuild_search_index, matching_ids, search_ledger,
+                    search_products, SEARCH_LIMIT, MAX_SEARCH_LIMIT)
+from importer import import_csv, import_upload, IMPORTERS
+from outbox import (post_or_enqueue, outbox_enabled, drain_outbox, purge_outbox,
+                    render_outbox_metrics, start_outbox_worker, OutboxWorker)
+from integrity import verify_ledger, VERIFY_CHUNK_ROWS, DIFF_LIMIT
+from metrics import metrics, install_sql_metrics, init_request_metrics
+from ledger import (ledger_page, ledger_count, trial_balance, checkpoint_trial_balance,
+                    close_period, journal_for_source, reverse_journal)
 
 # --- Flask Setup ---
 app = Flask(__name__)
-app.config['SECRET_KEY']               = 'secret123'
-app.config['SQLALCHEMY_DATABASE_URI']  = 'sqlite:///database.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config.from_object(Config)
 db.init_app(app)
+with app.app_context():
+    install_sqlite_pragmas(db.engine, app.config['SQLITE_PRAGMAS'])
+    install_sql_metrics(db.engine, app.config['SLOW_QUERY_MS'], app.config['SLOW_QUERY_LOG'])
+init_request_metrics(app)
 
 
-# --- Helper for LedgerMerged filter ---
+# --- Helpers for account filters (served from the cached chart of accounts) ---
 def get_account_name_choices():
-    names1 = db.session.query(NeracaSaldoAwal.account_name).distinct().all()
-    names2 = db.session.query(Ledger.account_name).distinct().all()
-    unique = sorted({n[0] for n in names1 + names2 if n[0]})
-    return [(n, n) for n in unique]
+    return [(n, n) for n in account_names()]
+
+class AccountChoices:
+    # filter options are read when views are built; this defers them per request
+    def __bool__(self):
+        return True
+    def __iter__(self):
+        return iter(account_choices())
 
 
 # --- Auth Forms & Views ---
@@ -74,7 +137,121 @@ class LogoutView(BaseView):
         flash('Logout berhasil.','info')
         return redirect(url_for('login.index'))
 
+class MoneyModelConverter(AdminModelConverter):
+    # Money columns are Integer underneath; edit them as rupiah with 2 places
+    @converts('Money')
+    def conv_Money(self, field_args, **extra):
+        field_args.setdefault('places', 2)
+        return DecimalField(**field_args)
+
 class SecureModelView(ModelView):
+    model_form_converter = MoneyModelConverter
+
+    def is_accessible(self):
+        return session.get('logged_in', False)
+    def inaccessible_callback(self, name, **kwargs):
+        return redirect(url_for('login.index'))
+
+class FullTextSearchMixin:
+    """Admin search box backed by an FTS5 index instead of LIKE '%...%'.
+
+    column_searchable_list only switches the search box on; the filter is
+    an id IN (SELECT rowid FROM <fts_table> WHERE MATCH ...) on prefixes.
+    """
+    fts_table = None
+
+    def search_placeholder(self):
+        return 'Cari kata / awalan kata'
+
+    def _apply_search(self, query, count_query, joins, count_joins, search):
+        ids   = matching_ids(self.fts_table, search)
+        query = query.filter(self.model.id.in_(ids))
+        if count_query is not None:
+            count_query = count_query.filter(self.model.id.in_(ids))
+        return query, count_query, joins, count_joins
+
+
+class ProductAjaxLoader(QueryAjaxModelLoader):
+    """Product picker that asks the server as the cashier types.
+
+    A scanned SKU / barcode matches exactly through the catalogue cache;
+    anything else is a word-prefix search on products_fts. Only one page
+    of products is ever sent, instead of the whole table as <option>s.
+    """
+    def format(self, model):
+        if not model:
+            return None
+        label = f"{model.name} [{model.sku}]" if model.sku else model.name
+        return model.id, f"{label} @ {model.price}/{model.satuan or 'pcs'}"
+
+    def get_list(self, term, offset=0, limit=DEFAULT_PAGE_SIZE):
+        query   = self.get_query()
+        wanted  = Product.id.in_(matching_ids('products_fts', term or ''))
+        scanned = product_by_sku(term)
+        if scanned:
+            wanted = wanted | (Product.id == scanned.id)
+            query  = query.order_by((Product.id == scanned.id).desc())
+        return query.filter(wanted).order_by(Product.name).offset(offset).limit(limit).all()
+
+
+class IdempotentCreateMixin:
+    """Create forms that a till can resubmit without posting twice.
+
+    Every rendered form carries a fresh key in a hidden field; the key is
+    recorded with the new row's id in the same commit (idempotency.py). A
+    resubmission of the same form finds the key and is answered with the row
+    created the first time.
+    """
+    idempotency_scope = None
+
+    def scaffold_form(self):
+        form_class = super().scaffold_form()
+        form_class.idempotency_key = HiddenField(default=new_idempotency_key)
+        return form_class
+
+    def _idempotency(self, form):
+        field = getattr(form, 'idempotency_key', None)
+        key   = check_key(field.data if field else None)
+        if not key:
+            return None
+        data = sorted((k, v) for k, v in request.form.items(multi=True) if k != 'idempotency_key')
+        return key, fingerprint(data)
+
+    def _replayed(self, result):
+        flash('Data ini sudah tersimpan sebelumnya; pengiriman ulang tidak diposting lagi.', 'info')
+        return self.get_one(str(result['id']))
+
+    def create_model(self, form):
+        try:
+            idem  = self._idempotency(form)
+            prior = replay(self.idempotency_scope, *idem) if idem else None
+        except ValueError as e:
+            flash(str(e), 'error')
+            return False
+        if prior is not None:
+            return self._replayed(prior)
+
+        model = super().create_model(form)
+        if model is False and idem:
+            # a copy of this submission may have committed while we were working
+            prior = replay(self.idempotency_scope, *idem)
+            if prior is not None:
+                return self._replayed(prior)
+        return model
+
+    def on_model_change(self, form, model, is_created):
+        super().on_model_change(form, model, is_created)
+        idem = self._idempotency(form) if is_created else None
+        if idem:
+            db.session.flush()
+            record(self.idempotency_scope, *idem, {'id': model.id})
+
+    def handle_view_exception(self, exc):
+        # DuplicateRequest is answered by create_model's replay, not an error
+        return isinstance(exc, DuplicateRequest) or super().handle_view_exception(exc)
+
+
+class SecureBaseView(BaseView):
     def is_accessible(self):
         return session.get('logged_in', False)
     def inaccessible_callback(self, name, **kwargs):
@@ -85,59 +262,63 @@ class SecureModelView(ModelView):
 class TransactionItemInline(InlineFormAdmin):
     form_overrides = {'id': HiddenField}
     form_columns   = ['id','product','quantity']
+    form_ajax_refs = {
+        'product': ProductAjaxLoader('product', db.session, Product, fields=['name']),
+    }
 
-class TransactionView(SecureModelView):
+class TransactionView(IdempotentCreateMixin, SecureModelView):
+    idempotency_scope = 'sale'
     inline_models = [TransactionItemInline(TransactionItem)]
     form_columns   = ['date','items']
 
     def on_model_change(self, form, model, is_created):
-        # only compute totals & adjust stock here
+        # totals, stock, cost of goods and postings; one transaction with the sale
         if is_created:
             total = Decimal('0.00')
             with db.session.no_autoflush:
+                # products were already loaded by the inline ajax field
                 for item in model.items:
-                    prod = item.product
-                    if prod.stock < item.quantity:
-                        raise ValueError(f"Stok '{prod.name}' tidak cukup.")
-                    prod.stock    -= item.quantity
-                    item.subtotal  = prod.price * item.quantity
+                    item.subtotal  = item.product.price * item.quantity
                     total         += item.subtotal
-            model.total = total
 
+                failed = reserve_stock([(i.product.id, i.quantity) for i in model.items])
+                if failed:
+                    names = ', '.join(sorted({model.items[i].product.name for i in failed}))
+                    raise ValueError(f"Stok '{names}' tidak cukup.")
 
-    def create_model(self, form):
-        model = super().create_model(form)
-        total = sum(i.subtotal for i in model.items)
-        now   = model.date or datetime.utcnow()
-        saldo0 = Decimal(get_last_saldo())
-
-        # Debit Kas Tunai
-        db.session.add(Ledger(
-            tanggal=now,
-            keterangan=f"Penjualan Transaksi #{model.id}",
-            account_name="Kas Tunai",
-            debit=total, kredit=Decimal('0.00'),
-            saldo=saldo0 + total
-        ))
-        # Credit Penjualan
-        db.session.add(Ledger(
-            tanggal=now,
-            keterangan=f"Penjualan Transaksi #{model.id}",
-            account_name="Penjualan",
-            debit=Decimal('0.00'), kredit=total,
-            saldo=saldo0
-        ))
-        db.session.commit()
-        return model
+                model.date  = model.date or datetime.utcnow()
+                model.total = total
+            db.session.flush()    # model.id for the stock movements and the entry
+
+            costs = issue_stock([{'tanggal': model.date, 'product_id': i.product.id,
+                                  'quantity': i.quantity, 'source_type': 'transaction',
+                                  'source_id': model.id} for i in model.items])
+            record_daily_sales([(model.date, [(i.product.id, i.quantity, i.subtotal, cost)
+                                              for i, cost in zip(model.items, costs)])])
+            post_or_enqueue(sale_journal_entry(model.id, model.date, total, sum(costs)))
+        super().on_model_change(form, model, is_created)
 
 
 
 
 
 # --- Product Purchase (Inventory) ---
-class ProductView(SecureModelView):
-    form_columns = ['name','price','stock','satuan','transaction_account']
+class ProductView(FullTextSearchMixin, IdempotentCreateMixin, SecureModelView):
+    idempotency_scope = 'purchase'
+    form_columns = ['name','sku','price','harga_beli','stock','tambah_stok','satuan',
+                    'transaction_account']
+    column_labels          = {'sku': 'SKU / Barcode'}
+    column_searchable_list = ['name']
+    fts_table              = 'products_fts'
     form_extra_fields = {
+        'tambah_stok': IntegerField(
+            'Tambah / Kurangi Stok', validators=[validators.Optional()],
+            description='Positif = pembelian, negatif = stok dikurangi (selisih).'
+        ),
+        'harga_beli': DecimalField(
+            'Harga Beli / Unit', places=2, validators=[validators.Optional()],
+            description='Biaya per unit untuk stok yang ditambahkan; kosong = harga jual.'
+        ),
         'transaction_account': SelectField(
             'Akun Lawan',
             choices=[
@@ -149,33 +330,49 @@ class ProductView(SecureModelView):
         )
     }
 
+    def create_form(self, obj=None):
+        form = super().create_form(obj)
+        del form.tambah_stok        # a new product starts at 'stock'
+        return form
+
+    def edit_form(self, obj=None):
+        # stock is never overwritten from a form rendered before later sales;
+        # it only moves by the 'tambah_stok' quantity, applied relatively
+        form = super().edit_form(obj)
+        del form.stock
+        return form
+
     def on_model_change(self, form, model, is_created):
-        if not is_created:
-            return super().on_model_change(form, model, is_created)
+        delta = model.stock if is_created else (form.tambah_stok.data or 0)
 
         try:
-            cost   = model.price * Decimal(model.stock)
-            now    = datetime.utcnow()
-            saldo0 = Decimal(get_last_saldo() or 0)
-
-            # 1) Debit Inventory
-            db.session.add(Ledger(
-                tanggal=now,
-                keterangan=f"Pembelian {model.name}",
-                account_name="Persediaan Barang",
-                debit=cost,
-                kredit=Decimal('0.00'),
-                saldo=saldo0 + cost
-            ))
-            # 2) Credit Cash/Payable
-            db.session.add(Ledger(
-                tanggal=now,
-                keterangan=f"Pembelian {model.name}",
-                account_name=form.transaction_account.data,
-                debit=Decimal('0.00'),
-                kredit=cost,
-                saldo=saldo0
-            ))
+            unit  = form.harga_beli.data or model.price
+            now   = datetime.utcnow()
+            db.session.flush()    # model.id for the movement and the entry's source reference
+            source = {'tanggal': now, 'product_id': model.id,
+                      'source_type': 'product', 'source_id': model.id}
+
+            if delta > 0 or is_created:
+                # purchase / restock: Persediaan Barang against Kas / Utang
+                if not is_created:
+                    # relative, so sales committed since the form was rendered are kept
+                    products_t = Product.__table__
+                    db.session.execute(update(products_t)
+                                       .where(products_t.c.id == model.id)
+                                       .values(stock=products_t.c.stock + delta))
+                cost = unit * Decimal(delta or 0)
+                receive_stock([dict(source, quantity=delta or 0, value=cost)])
+                post_or_enqueue(inventory_journal_entry(
+                    now, f"Pembelian {model.name}", form.transaction_account.data,
+                    cost, 'product', model.id))
+            elif delta < 0:
+                # stock counted down: the missing units' cost is written off
+                if reserve_stock([(model.id, -delta)]):
+                    raise ValueError(f"Stok '{model.name}' tidak cukup untuk dikurangi {-delta}.")
+                cost, = issue_stock([dict(source, quantity=-delta)])
+                post_or_enqueue(inventory_journal_entry(
+                    now, f"Penyesuaian stok {model.name}", ADJUSTMENT_ACCOUNT,
+                    -cost, 'product', model.id))
 
             super().on_model_change(form, model, is_created)
 
@@ -184,6 +381,12 @@ class ProductView(SecureModelView):
             flash(f"Gagal menyimpan Product: {e}", 'error')
             raise
 
+    def after_model_change(self, form, model, is_created):
+        invalidate_catalog(model.id)
+
+    def after_model_delete(self, model):
+        invalidate_catalog(model.id)
+
 
 
 
@@ -191,6 +394,7 @@ class ProductView(SecureModelView):
 
 # --- Opening Balance ---
 class NeracaSaldoAwalView(SecureModelView):
+    column_list  = ['tanggal','account_name','debit','kredit']
     form_columns = ['tanggal','account_name','debit','kredit']
     form_overrides = {'tanggal': DateField}
     form_args      = {'tanggal': {'widget': DatePickerWidget()}}
@@ -212,30 +416,31 @@ class NeracaSaldoAwalView(SecureModelView):
             return super().on_model_change(form, model, is_created)
 
         try:
-            amt    = (model.debit or Decimal('0.00')) - (model.kredit or Decimal('0.00'))
-            now    = model.tanggal
-            saldo0 = Decimal(get_last_saldo() or 0)
+            now     = model.tanggal
+            entries = []
+            db.session.flush()    # model.id for the entry's source reference
 
             # 1) Debit Account
             if model.debit:
-                db.session.add(Ledger(
+                entries.append(Ledger(
                     tanggal=now,
                     keterangan=f"Saldo Awal {model.account_name}",
                     account_name=model.account_name,
                     debit=model.debit,
-                    kredit=Decimal('0.00'),
-                    saldo=saldo0 + amt
+                    kredit=Decimal('0.00')
                 ))
             # 2) Credit Opening Equity
             if model.kredit:
-                db.session.add(Ledger(
+                entries.append(Ledger(
                     tanggal=now,
                     keterangan=f"Saldo Awal {model.account_name}",
                     account_name="Modal Awal",
                     debit=Decimal('0.00'),
-                    kredit=model.kredit,
-                    saldo=saldo0
+                    kredit=model.kredit
                 ))
+            post_journal(JournalEntry(tanggal=now, keterangan=f"Saldo Awal {model.account_name}",
+                                      source_type='opening', source_id=model.id,
+                                      lines=entries))
 
             super().on_model_change(form, model, is_created)
 
@@ -246,9 +451,10 @@ class NeracaSaldoAwalView(SecureModelView):
 
 # --- Ongoing Balance Update ---
 class NeracaSaldoView(SecureModelView):
-    form_columns = ['akun','debit','kredit']
+    column_list  = ['account_name','debit','kredit']
+    form_columns = ['account_name','debit','kredit']
     form_extra_fields = {
-        'akun': SelectField(
+        'account_name': SelectField(
             'Akun',
             choices=[
                 ('Kas Tunai','Kas Tunai'),
@@ -265,30 +471,31 @@ class NeracaSaldoView(SecureModelView):
             return super().on_model_change(form, model, is_created)
 
         try:
-            change  = (model.debit or Decimal('0.00')) - (model.kredit or Decimal('0.00'))
             now     = datetime.utcnow()
-            saldo0  = Decimal(get_last_saldo() or 0)
+            entries = []
+            db.session.flush()    # model.id for the entry's source reference
 
             # 1) Debit Account
             if model.debit:
-                db.session.add(Ledger(
+                entries.append(Ledger(
                     tanggal=now,
-                    keterangan=f"Neraca Saldo: {model.akun}",
-                    account_name=model.akun,
+                    keterangan=f"Neraca Saldo: {model.account_name}",
+                    account_name=model.account_name,
                     debit=model.debit,
-                    kredit=Decimal('0.00'),
-                    saldo=saldo0 + change
+                    kredit=Decimal('0.00')
                 ))
             # 2) Credit Adjustment Equity
             if model.kredit:
-                db.session.add(Ledger(
+                entries.append(Ledger(
                     tanggal=now,
-                    keterangan=f"Neraca Saldo: {model.akun}",
+                    keterangan=f"Neraca Saldo: {model.account_name}",
                     account_name="Saldo Penyesuaian",
                     debit=Decimal('0.00'),
-                    kredit=model.kredit,
-                    saldo=saldo0
+                    kredit=model.kredit
                 ))
+            post_journal(JournalEntry(tanggal=now, keterangan=f"Neraca Saldo: {model.account_name}",
+                                      source_type='neraca_saldo', source_id=model.id,
+                                      lines=entries))
 
             super().on_model_change(form, model, is_created)
 
@@ -303,7 +510,8 @@ class NeracaSaldoView(SecureModelView):
 
 
 # --- General Journal ---
-class JurnalUmumView(SecureModelView):
+class JurnalUmumView(IdempotentCreateMixin, SecureModelView):
+    idempotency_scope = 'jurnal'
     form_columns    = ['tanggal','transaksi','debit','kredit']
     form_extra_fields = {
         'tanggal': DateField('Tanggal', widget=DatePickerWidget()),
@@ -323,30 +531,31 @@ class JurnalUmumView(SecureModelView):
             return super().on_model_change(form, model, is_created)
 
         try:
-            amt     = (model.debit or Decimal('0.00')) - (model.kredit or Decimal('0.00'))
             now     = model.tanggal
-            saldo0  = Decimal(get_last_saldo() or 0)
+            entries = []
+            db.session.flush()    # model.id for the entry's source reference
 
             # 1) Debit if any
             if model.debit:
-                db.session.add(Ledger(
+                entries.append(Ledger(
                     tanggal=now,
                     keterangan=f"Jurnal: {model.transaksi}",
                     account_name=model.transaksi,
                     debit=model.debit,
-                    kredit=Decimal('0.00'),
-                    saldo=saldo0 + model.debit
+                    kredit=Decimal('0.00')
                 ))
             # 2) Credit if any
             if model.kredit:
-                db.session.add(Ledger(
+                entries.append(Ledger(
                     tanggal=now,
                     keterangan=f"Jurnal: {model.transaksi}",
                     account_name="Kas Tunai",
                     debit=Decimal('0.00'),
-                    kredit=model.kredit,
-                    saldo=saldo0
+                    kredit=model.kredit
                 ))
+            post_journal(JournalEntry(tanggal=now, keterangan=f"Jurnal: {model.transaksi}",
+                                      source_type='jurnal', source_id=model.id,
+                                      lines=entries))
 
             super().on_model_change(form, model, is_created)
 
@@ -361,38 +570,213 @@ class JurnalUmumView(SecureModelView):
 
 
 # --- Read-Only Unified Ledger View ---
-class LedgerView(SecureModelView):
+class LedgerView(FullTextSearchMixin, SecureModelView):
     can_create  = can_edit = can_delete = False
+    column_searchable_list = ['keterangan']
+    fts_table              = 'ledger_fts'
 
-    column_list         = ['tanggal','account_name','keterangan','debit','kredit','saldo']
+    column_list         = ['tanggal','account_name','keterangan','debit','kredit','saldo',
+                           'entry_id']
+    column_labels       = {'entry_id': 'Jurnal'}
     column_default_sort = ('tanggal', True)
+    simple_list_pager   = True    # no COUNT(*) over ledger_entries per page
+    column_formatters   = {
+        'entry_id': lambda v, c, m, p: Markup('<a href="{}">#{}</a>').format(
+            url_for('journal.details_view', id=m.entry_id), m.entry_id) if m.entry_id else '',
+    }
 
-    # Hard-coded dropdown choices
-    ACCOUNT_CHOICES = [
-        ('Kas Tunai', 'Kas Tunai'),
-        ('Penjualan', 'Penjualan'),
-        ('Persediaan Barang', 'Persediaan Barang'),
-        ('Utang Usaha', 'Utang Usaha'),
-        ('Modal Awal', 'Modal Awal'),
-        ('Saldo Penyesuaian', 'Saldo Penyesuaian'),
-        # add any other accounts here…
+    column_filters = [
+        IntEqualFilter(
+            column=Ledger.account_id,
+            name='Account Name',
+            options=AccountChoices()
+        )
     ]
 
+    # keyset-paginated listing for deep browsing of old history
+    @expose('/browse/')
+    def browse_view(self):
+        account = request.args.get('account') or None
+        try:
+            rows, prev_cursor, next_cursor = ledger_page(
+                account_name=account,
+                after=request.args.get('after'),
+                before=request.args.get('before'),
+            )
+        except ValueError:
+            # a hand-edited or truncated cursor: start again from the first page
+            flash("Posisi halaman tidak valid, menampilkan halaman pertama.", 'error')
+            rows, prev_cursor, next_cursor = ledger_page(account_name=account)
+        return self.render('admin/ledger_browse.html',
+                           rows=rows, account=account,
+                           accounts=get_account_name_choices(),
+                           total=ledger_count(account),
+                           prev_cursor=prev_cursor, next_cursor=next_cursor)
+
+
+
+
+# --- Journal entries: header + ledger lines, drill-down and reversal ---
+def _journal_lines(view, context, model, name):
+    row = Markup('<tr><td>{}</td><td>{}</td><td class="text-right">{}</td>'
+                 '<td class="text-right">{}</td></tr>')
+    return Markup('<table class="table table-sm mb-0"><tr><th>Akun</th><th>Keterangan</th>'
+                  '<th class="text-right">Debit</th><th class="text-right">Kredit</th></tr>'
+                  '{}</table>').format(Markup('').join(
+                      row.format(l.account_name, l.keterangan, l.debit, l.kredit)
+                      for l in model.lines))
+
+class JournalEntryView(SecureModelView):
+    can_create  = can_edit = can_delete = False
+    can_view_details = True
+
+    column_list         = ['id','tanggal','keterangan','source_type','source_id','reversal_of']
+    column_details_list = column_list + ['lines']
+    column_labels       = {'source_type': 'Sumber', 'source_id': 'ID Sumber',
+                           'reversal_of': 'Membalik', 'lines': 'Baris'}
+    column_default_sort = ('id', True)
+    simple_list_pager   = True
+    column_formatters_detail = {'lines': _journal_lines}
+
     column_filters = [
         FilterEqual(
-            column=Ledger.account_name,
+            column=JournalEntry.source_type,
+            name='Sumber',
+            options=[(t, t) for t in SOURCE_TYPES]
+        ),
+        IntEqualFilter(column=JournalEntry.source_id, name='ID Sumber'),
+    ]
+
+    @action('reverse', 'Balik Jurnal', 'Buat jurnal pembalik untuk jurnal yang dipilih?')
+    def action_reverse(self, ids):
+        try:
+            for entry_id in ids:
+                reverse_journal(int(entry_id))
+            db.session.commit()
+            flash(f"{len(ids)} jurnal dibalik.", 'success')
+        except (ValueError, SQLAlchemyError) as e:
+            db.session.rollback()
+            flash(f"Gagal membalik jurnal: {e}", 'error')
+
+
+
+
+# --- Read-Only Stock Movements (costing history) ---
+class StockMovementView(SecureModelView):
+    can_create  = can_edit = can_delete = False
+
+    column_list         = ['id','tanggal','product','quantity','value','source_type','source_id']
+    column_labels       = {'product': 'Produk', 'quantity': 'Jumlah', 'value': 'Nilai',
+                           'source_type': 'Sumber', 'source_id': 'ID Sumber'}
+    column_default_sort = ('id', True)
+    simple_list_pager   = True
+
+    column_filters = [
+        IntEqualFilter(column=StockMovement.product_id, name='ID Produk'),
+        FilterEqual(
+            column=StockMovement.source_type,
+            name='Sumber',
+            options=[(t, t) for t in SOURCE_TYPES]
+        ),
+    ]
+
+
+
+
+# --- Read-Only Opening + Ledger View (ledger_merged) ---
+class LedgerMergedView(SecureModelView):
+    can_create  = can_edit = can_delete = False
+
+    column_list         = ['tanggal','account_name','keterangan','debit','kredit','saldo','sumber']
+    column_default_sort = [('tanggal', True), ('id', True)]
+    simple_list_pager   = True
+
+    column_filters = [
+        IntEqualFilter(
+            column=LedgerMerged.account_id,
             name='Account Name',
-            options=ACCOUNT_CHOICES
-        )
+            options=AccountChoices()
+        ),
+        FilterEqual(
+            column=LedgerMerged.sumber,
+            name='Sumber',
+            options=[('Opening', 'Opening'), ('Ledger', 'Ledger')]
+        ),
     ]
 
 
 
 
+# --- Chart of Accounts ---
+class AccountView(SecureModelView):
+    can_delete   = False     # ledger rows reference accounts by id
+    column_list  = ['id','name','kategori']
+    form_columns = ['name','kategori']
+    column_choices    = {'kategori': ACCOUNT_CATEGORIES}
+    form_extra_fields = {
+        'kategori': SelectField('Kategori', choices=[('', '-')] + ACCOUNT_CATEGORIES,
+                                coerce=lambda v: v or None)
+    }
+
+    def edit_form(self, obj=None):
+        form = super().edit_form(obj)
+        if obj is not None and obj.name in DEFAULT_ACCOUNTS:
+            form.name.render_kw = {'readonly': True}
+        return form
+
+    def on_model_change(self, form, model, is_created):
+        # postings look the default accounts up by name; a rename would
+        # silently register a fresh account under the old one
+        renamed = inspect(model).attrs.name.history.deleted
+        if renamed and renamed[0] in DEFAULT_ACCOUNTS:
+            raise ValueError(f"Akun bawaan '{renamed[0]}' tidak boleh diganti namanya.")
+
+    def after_model_change(self, form, model, is_created):
+        invalidate_accounts()
+
+
+
+
+# --- Computed Trial Balance ---
+class TrialBalanceView(SecureBaseView):
+    @expose('/')
+    def index(self):
+        try:
+            as_of = date.fromisoformat(request.args.get('tanggal', ''))
+        except ValueError:
+            as_of = date.today()
+        rows = trial_balance(as_of)
+        return self.render('admin/trial_balance.html', rows=rows, as_of=as_of,
+                           total_debit=sum(r['debit'] for r in rows),
+                           total_kredit=sum(r['kredit'] for r in rows))
+
+
+# --- Financial Statements (laba rugi / neraca) ---
+class FinancialStatementView(SecureBaseView):
+    @expose('/')
+    def index(self):
+        today = date.today()
+        try:
+            end = date.fromisoformat(request.args.get('end', ''))
+        except ValueError:
+            end = today
+        try:
+            start = date.fromisoformat(request.args.get('start', ''))
+        except ValueError:
+            start = end.replace(day=1)
+        if start > end:
+            start, end = end, start
+        return self.render('admin/financial_statements.html', start=start, end=end,
+                           **financial_statements(start, end))
+
+
+
+
 # --- Admin setup ---
 admin = Admin(app, name='SIM Admin', index_view=MyAdminHome(), template_mode='bootstrap4')
 admin.add_view(LoginView(name='Login',    endpoint='login'))
 admin.add_view(LogoutView(name='Logout', endpoint='logout'))
+admin.add_view(AccountView(Account, db.session, name='Akun',             endpoint='account'))
 admin.add_view(ProductView(Product, db.session, name='Product',          endpoint='product'))
 admin.add_view(TransactionView(Transaction, db.session, name='Transaksi', endpoint='transaksi'))
 admin.add_view(JurnalUmumView(JurnalUmum, db.session, name='Jurnal',      endpoint='jurnalumum'))
@@ -400,9 +784,17 @@ admin.add_view(NeracaSaldoAwalView(NeracaSaldoAwal, db.session,
                                    name='Saldo Awal', endpoint='neraca_awal'))
 admin.add_view(NeracaSaldoView(NeracaSaldo, db.session,
                                name='Saldo Berjalan', endpoint='neracasaldo'))
+admin.add_view(TrialBalanceView(name='Neraca Saldo', endpoint='trial_balance'))
+admin.add_view(FinancialStatementView(name='Laporan Keuangan', endpoint='laporan'))
 
 ledger_view = LedgerView(Ledger, db.session, name='Ledger', endpoint='ledger')
 admin.add_view(ledger_view)
+admin.add_link(MenuLink(name='Telusuri Ledger', url='/admin/ledger/browse/'))
+admin.add_view(JournalEntryView(JournalEntry, db.session, name='Jurnal Entri', endpoint='journal'))
+admin.add_view(StockMovementView(StockMovement, db.session,
+                                 name='Mutasi Stok', endpoint='stock_movement'))
+admin.add_view(LedgerMergedView(LedgerMerged, db.session,
+                                name='Ledger + Saldo Awal', endpoint='ledger_merged'))
 
 # --- Public Landing Page at / ---
 @app.route('/')
@@ -481,47 +873,450 @@ def landing_page():
     return html_template.render()
 
 
+# --- POS API: batched sales from terminals ---
+@app.route('/api/sales/batch', methods=['POST'])
+def api_sales_batch():
+    if not session.get('logged_in'):
+        return jsonify(error='Login diperlukan.'), 401
+
+    payload = request.get_json(silent=True) or {}
+    sales   = payload.get('sales')
+    if not isinstance(sales, list):
+        return jsonify(error="Field 'sales' harus berupa list."), 400
+
+    # a retried request with the same Idempotency-Key gets the first response
+    try:
+        key  = check_key(request.headers.get(IDEMPOTENCY_HEADER))
+        idem = (key, fingerprint(sales)) if key else None
+        prior = replay('sales_batch', *idem) if idem else None
+    except IdempotencyConflict as e:
+        return jsonify(error=str(e)), 422
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    if prior is not None:
+        return jsonify(results=prior), 200, {'Idempotent-Replayed': 'true'}
+
+    try:
+        results = post_sales_batch(sales, idempotency=idem)
+    except DuplicateRequest:
+        db.session.rollback()
+        return jsonify(results=replay('sales_batch', *idem)), 200, {'Idempotent-Replayed': 'true'}
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify(error=str(e)), 400
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        return jsonify(error=f"Gagal menyimpan penjualan: {e}"), 500
+    return jsonify(results=results)
+
+
+@app.route('/api/sales/daily')
+def api_sales_daily():
+    if not session.get('logged_in'):
+        return jsonify(error='Login diperlukan.'), 401
+    try:
+        day = date.fromisoformat(request.args['date']) if request.args.get('date') else None
+    except ValueError:
+        return jsonify(error='Format tanggal harus YYYY-MM-DD.'), 400
+    return jsonify(products=sales_vs_last_week(day))
+
+
+# --- Full-text search (ledger keterangan, product names) ---
+@app.route('/api/search')
+def api_search():
+    if not session.get('logged_in'):
+        return jsonify(error='Login diperlukan.'), 401
+    q      = request.args.get('q', '')
+    scope  = request.args.get('in', 'all')
+    limit  = min(request.args.get('limit', SEARCH_LIMIT, type=int) or SEARCH_LIMIT,
+                 MAX_SEARCH_LIMIT)
+    if scope not in ('all', 'ledger', 'product'):
+        return jsonify(error="Parameter 'in' harus all, ledger atau product."), 400
+
+    result = {}
+    if scope in ('all', 'ledger'):
+        result['ledger'] = [
+            {'id': r.id, 'tanggal': r.tanggal.isoformat(), 'account_name': r.account_name,
+             'keterangan': r.keterangan, 'debit': str(r.debit), 'kredit': str(r.kredit)}
+            for r in search_ledger(q, limit, request.args.get('account') or None)
+        ]
+    if scope in ('all', 'product'):
+        result['products'] = [
+            {'id': p.id, 'name': p.name, 'price': str(p.price), 'stock': p.stock,
+             'satuan': p.satuan}
+            for p in search_products(q, limit)
+        ]
+    return jsonify(result)
+
+
+# --- Product lookup for barcode scanners (served from the catalogue cache) ---
+@app.route('/api/products/lookup')
+def api_product_lookup():
+    if not session.get('logged_in'):
+        return jsonify(error='Login diperlukan.'), 401
+    sku        = request.args.get('sku', '').strip()
+    product_id = request.args.get('id', type=int)
+    if not sku and product_id is None:
+        return jsonify(error="Parameter 'sku' atau 'id' diperlukan."), 400
+
+    item = product_by_sku(sku) if sku else product_by_id(product_id)
+    if item is None:
+        return jsonify(error='Produk tidak ditemukan.'), 404
+    return jsonify(id=item.id, sku=item.sku, name=item.name, price=str(item.price),
+                   satuan=item.satuan)
+
+
+# --- Dashboard analytics (cash flow, stock outlook) for MyAdminHome charts ---
+@app.route('/api/analytics')
+def api_analytics():
+    if not session.get('logged_in'):
+        return jsonify(error='Login diperlukan.'), 401
+    if importlib.util.find_spec('numpy') is None:
+        return jsonify(error='Analitik membutuhkan paket numpy.'), 400
+    try:
+        end   = (date.fromisoformat(request.args['end']) if request.args.get('end')
+                 else date.today())
+        start = (date.fromisoformat(request.args['start']) if request.args.get('start')
+                 else end - timedelta(days=89))
+    except ValueError:
+        return jsonify(error='Format tanggal harus YYYY-MM-DD.'), 400
+    if start > end:
+        start, end = end, start
+    window = min(max(request.args.get('window', MA_WINDOW, type=int) or MA_WINDOW, 1), 90)
+    days   = min(max(request.args.get('days', SALES_WINDOW, type=int) or SALES_WINDOW, 1), 365)
+    limit  = min(max(request.args.get('limit', TOP_PRODUCTS, type=int) or TOP_PRODUCTS, 1), 200)
+    return jsonify(dashboard(start, end, window=window, days=days, limit=limit))
+
+
+# --- Gross margin per product (sales_daily revenue vs HPP) ---
+@app.route('/api/margins')
+def api_margins():
+    if not session.get('logged_in'):
+        return jsonify(error='Login diperlukan.'), 401
+    try:
+        end   = (date.fromisoformat(request.args['end']) if request.args.get('end')
+                 else date.today())
+        start = (date.fromisoformat(request.args['start']) if request.args.get('start')
+                 else end - timedelta(days=29))
+    except ValueError:
+        return jsonify(error='Format tanggal harus YYYY-MM-DD.'), 400
+    limit = min(max(request.args.get('limit', 100, type=int) or 100, 1), 1000)
+    return jsonify(start=start.isoformat(), end=end.isoformat(),
+                   products=product_margins(start, end, limit))
+
+
+# --- Journal drill-down: entries posted for a sale / product / opening balance ---
+@app.route('/api/journal/<source_type>/<int:source_id>')
+def api_journal(source_type, source_id):
+    if not session.get('logged_in'):
+        return jsonify(error='Login diperlukan.'), 401
+    if source_type not in SOURCE_TYPES:
+        return jsonify(error='Sumber tidak dikenal.'), 404
+    return jsonify(entries=[{
+        'id':          e.id,
+        'tanggal':     e.tanggal.isoformat(),
+        'keterangan':  e.keterangan,
+        'reversal_of': e.reversal_of,
+        'lines': [{'account_name': l.account_name, 'debit': str(l.debit),
+                   'kredit': str(l.kredit)} for l in e.lines],
+    } for e in journal_for_source(source_type, source_id)])
+
+
+# --- Bulk CSV import (product, saldo_awal, jurnal) ---
+@app.route('/api/import/<kind>', methods=['POST'])
+def api_import(kind):
+    if not session.get('logged_in'):
+        return jsonify(error='Login diperlukan.'), 401
+    if kind not in IMPORTERS:
+        return jsonify(error='Import tidak dikenal.'), 404
+    upload = request.files.get('file')
+    if upload is None:
+        return jsonify(error="File CSV harus dikirim di field 'file'."), 400
+
+    try:
+        report = import_upload(kind, upload, dry_run=request.args.get('dry_run') == '1')
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify(error=str(e)), 400
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        return jsonify(error=f"Gagal mengimpor: {e}"), 500
+    return jsonify(report)
+
+
+# --- Streaming exports ---
+EXPORTS = {
+    'ledger': (LEDGER_HEADER, ledger_rows, True),
+    'sales':  (SALES_HEADER,  sales_rows,  False),
+    'merged': (MERGED_HEADER, merged_rows, True),
+}
+
+@app.route('/api/export/<kind>.<fmt>')
+def api_export(kind, fmt):
+    if not session.get('logged_in'):
+        return jsonify(error='Login diperlukan.'), 401
+    if kind not in EXPORTS or fmt not in ('csv', 'xlsx'):
+        return jsonify(error='Export tidak dikenal.'), 404
+    if fmt == 'xlsx' and importlib.util.find_spec('openpyxl') is None:
+        return jsonify(error='Export XLSX membutuhkan paket openpyxl.'), 400
+
+    try:
+        start = date.fromisoformat(request.args['start']) if request.args.get('start') else None
+        end   = date.fromisoformat(request.args['end'])   if request.args.get('end')   else None
+    except ValueError:
+        return jsonify(error='Format tanggal harus YYYY-MM-DD.'), 400
+
+    header, source, by_account = EXPORTS[kind]
+    kwargs = {'account_name': request.args.get('account') or None} if by_account else {}
+    rows   = source(start, end, **kwargs)
+
+    if fmt == 'csv':
+        body, mimetype = stream_csv(header, rows), 'text/csv'
+    else:
+        body, mimetype = (stream_xlsx(header, rows, kind),
+                          'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+    return Response(stream_with_context(body), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename={kind}.{fmt}'
+    })
+
+
+# --- Request metrics (Prometheus text format) ---
+@app.route('/metrics')
+def metrics_endpoint():
+    if request.remote_addr not in app.config['METRICS_ALLOW']:
+        return 'Forbidden', 403
+    body = metrics.render()
+    if outbox_enabled():
+        body += render_outbox_metrics()
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
+
+# --- Derived tables seeded once for databases from before they existed ---
+def backfill_derived_tables():
+    """Seed derived tables that are still empty while their sources hold data.
+
+    Run after the schema migration by both 'flask migrate-schema' and
+    'python app.py', so a database is complete whichever way it is upgraded.
+    Returns the names of the tables it filled.
+    """
+    filled = []
+    # postings continue each account's saldo from account_balances; rows from
+    # before it still carry the old single running saldo
+    if not db.session.query(AccountBalance).first() and db.session.query(Ledger).first():
+        rebuild_ledger_saldo()
+        rebuild_account_balances()
+        filled.append('account_balances')
+    # ledger rows posted before journal_entries, also once other entries exist
+    if db.session.query(Ledger.id).filter(Ledger.entry_id.is_(None)).first():
+        if backfill_journal_entries():
+            filled.append('journal_entries')
+    # the sales_daily rollup behind sales_vs_last_week and the margin report
+    if not db.session.query(SalesDaily).first() and db.session.query(Transaction).first():
+        rebuild_sales_daily()
+        filled.append('sales_daily')
+    # opening-stock cost layers, so the first sales are costed from receipts
+    if not db.session.query(StockMovement).first() and db.session.query(Product).first():
+        revalue_inventory()
+        filled.append('stock_movements')
+    return filled
+
+
+# --- Maintenance commands (flask --app app <command>) ---
+@app.cli.command('migrate-schema')
+def migrate_schema_command():
+    """Create declared tables, columns and indexes missing from the database."""
+    drop_ledger_merged_view()
+    db.create_all()
+    created = (migrate_account_ids() + ensure_columns() + migrate_money_columns()
+               + ensure_indexes() + ensure_ledger_merged() + ensure_search_index())
+    ensure_accounts()
+    print('Dibuat: ' + ', '.join(created) if created else 'Skema sudah lengkap.')
+    filled = backfill_derived_tables()
+    if filled:
+        print('Diisi: ' + ', '.join(filled))
+
+
+@app.cli.command('backfill-journal')
+def backfill_journal_command():
+    """Group ledger rows posted before journal_entries existed into entries."""
+    print(f"journal_entries: {backfill_journal_entries()} entri dibuat.")
+
+
+@app.cli.command('rebuild-ledger-merged')
+def rebuild_ledger_merged_command():
+    """Repair ledger_merged from neraca_saldo_awal and ledger_entries."""
+    rebuild_ledger_merged()
+    print(f"ledger_merged: {LedgerMerged.query.count()} baris.")
+
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """Rebuild the FTS5 indexes of ledger keterangan and product names."""
+    rebuild_search_index()
+    print('Indeks pencarian dibangun ulang.')
+
+
+@app.cli.command('rebuild-sales-daily')
+def rebuild_sales_daily_command():
+    """Backfill the sales_daily rollup from transaction history."""
+    print(f"sales_daily: {rebuild_sales_daily()} baris.")
+
+
+@app.cli.command('revalue-inventory')
+@click.option('--method', type=click.Choice(COSTING_METHODS), default=None,
+              help='Metode biaya (default: COSTING_METHOD).')
+def revalue_inventory_command(method):
+    """Rebuild cost layers from stock movements and post the HPP difference."""
+    try:
+        report = revalue_inventory(method)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    print(json.dumps(report, indent=2))
+
+
+@app.cli.command('import-csv')
+@click.argument('kind', type=click.Choice(sorted(IMPORTERS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--dry-run', is_flag=True, help='Hanya validasi, tanpa menyimpan.')
+def import_csv_command(kind, path, dry_run):
+    """Bulk-import products, opening balances or journal entries from CSV."""
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        try:
+            report = import_csv(kind, f, dry_run=dry_run)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+    for err in report['errors']:
+        print(f"baris {err['line']}: {err['error']}")
+    print(f"{report['imported']}/{report['rows']} baris diimpor, "
+          f"{report['error_count']} error, {report['elapsed_s']} detik.")
+
+
+@app.cli.command('check-indexes')
+def check_indexes_command():
+    """Verify with EXPLAIN QUERY PLAN that hot queries use their indexes."""
+    failed = 0
+    for label, ok, plan in check_query_plans():
+        print(f"[{'OK' if ok else 'FAIL'}] {label}: {plan}")
+        failed += not ok
+    if failed:
+        raise SystemExit(1)
+
+
+@app.cli.command('checkpoint-trial-balance')
+@click.option('--date', 'as_of', default=None,
+              help='Tanggal checkpoint (YYYY-MM-DD), default kemarin.')
+def checkpoint_trial_balance_command(as_of):
+    """Store per-account trial balance totals up to a date."""
+    as_of = date.fromisoformat(as_of) if as_of else date.today() - timedelta(days=1)
+    n = checkpoint_trial_balance(as_of)
+    print(f"Checkpoint {as_of}: {n} akun.")
+
+
+@app.cli.command('close-period')
+@click.option('--date', 'through', required=True,
+              help='Tanggal akhir periode yang ditutup (YYYY-MM-DD).')
+def close_period_command(through):
+    """Close the books up to a date and snapshot per-account balances."""
+    try:
+        pc = close_period(date.fromisoformat(through))
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    print(f"Periode s/d {pc.closed_through} ditutup ({pc.row_count} baris ledger).")
+
+
+@app.cli.command('verify-ledger')
+@click.option('--workers', type=int, default=None, help='Jumlah proses (default: jumlah CPU).')
+@click.option('--chunk-rows', type=int, default=VERIFY_CHUNK_ROWS, show_default=True,
+              help='Rentang id ledger per tugas.')
+@click.option('--fix', is_flag=True, help='Tulis ulang saldo yang salah (tanpa ini: dry-run).')
+@click.option('--diff-limit', type=int, default=DIFF_LIMIT, show_default=True,
+              help='Jumlah baris selisih yang dicantumkan di laporan.')
+@click.option('--out', type=click.Path(dir_okay=False), default=None,
+              help='Simpan laporan JSON lengkap ke file.')
+def verify_ledger_command(workers, chunk_rows, fix, diff_limit, out):
+    """Check journal balance and the saldo chain of ledger_entries in parallel."""
+    report = verify_ledger(workers=workers, chunk_rows=chunk_rows, fix=fix,
+                           diff_limit=diff_limit, pragmas=app.config['SQLITE_PRAGMAS'])
+    if out:
+        with open(out, 'w') as f:
+            json.dump(report, f, indent=2)
+    print(f"{report['rows']} baris, {report['ranges']} rentang, {report['workers']} proses, "
+          f"{report['elapsed_s']} s")
+    print(f"Jurnal tidak seimbang: {report['unbalanced_count']}, "
+          f"baris tanpa jurnal: {report['lines_without_entry']}")
+    print(f"Saldo salah: {report['saldo_mismatches']}"
+          + (' (diperbaiki)' if fix and report['saldo_mismatches'] else ''))
+    for acc in report['accounts']:
+        print(f"  {acc['account_name']}: {acc['mismatches']} baris, mulai id {acc['first_bad_id']}")
+    for row in report['diff'][:20]:
+        print(f"  id {row['id']} {row['account_name']}: {row['stored']} -> {row['expected']}")
+    for row in report['account_balances']:
+        print(f"  account_balances {row['account_name']}: {row['stored']} -> {row['expected']}"
+              + (' (dibangun ulang)' if fix else ''))
+    if not fix and (report['saldo_mismatches'] or report['account_balances']):
+        print("Dry-run: jalankan dengan --fix untuk memperbaiki.")
+
+
+@app.cli.command('purge-idempotency-keys')
+@click.option('--hours', type=float, default=None,
+              help='Hapus kunci yang lebih tua dari N jam (default: IDEMPOTENCY_TTL_HOURS).')
+def purge_idempotency_keys_command(hours):
+    """Delete expired idempotency keys."""
+    before = datetime.utcnow() - timedelta(hours=hours) if hours is not None else None
+    print(f"idempotency_keys: {purge_idempotency_keys(before)} kunci dihapus.")
+
+
+@app.cli.command('drain-outbox')
+@click.option('--follow', is_flag=True, help='Terus berjalan sebagai worker.')
+@click.option('--purge-days', type=int, default=None,
+              help='Hapus baris outbox yang sudah diproses lebih dari N hari.')
+def drain_outbox_command(follow, purge_days):
+    """Post queued ledger_outbox rows (LEDGER_MODE=outbox)."""
+    if purge_days is not None:
+        n = purge_outbox(datetime.utcnow() - timedelta(days=purge_days))
+        print(f"Outbox: {n} baris lama dihapus.")
+    if follow:
+        worker = OutboxWorker(app, app.config['OUTBOX_BATCH'], app.config['OUTBOX_POLL_S'])
+        try:
+            worker.run()
+        except KeyboardInterrupt:
+            pass
+        return
+    total = 0
+    while (n := drain_outbox(app.config['OUTBOX_BATCH'])):
+        total += n
+    print(f"Outbox: {total} baris diposting.")
+
+
 @app.errorhandler(500)
 def internal_error(err):
     return str(err), 500
 
 if __name__ == '__main__':
     with app.app_context():
-        # 1) Create tables
+        # 1) ledger_merged used to be a VIEW; it is now a maintained table
+        drop_ledger_merged_view()
+
+        # 2) Create tables, plus columns and indexes added after they were created
         db.create_all()
+        migrate_account_ids()
+        ensure_columns()
+        migrate_money_columns()
+        ensure_indexes()
+        ensure_ledger_merged()
+        ensure_search_index()
+        ensure_accounts()
+
+        backfill_derived_tables()
 
-        # 2) (Re)create the ledger_merged VIEW
-        # db.session.execute(text("DROP VIEW IF EXISTS ledger_merged;"))
-        # db.session.execute(text("""
-        # CREATE VIEW ledger_merged AS
-        #   SELECT
-        #     ROW_NUMBER() OVER (ORDER BY tanggal) AS id,
-        #     tanggal,
-        #     account_name,
-        #     'Saldo Awal'    AS keterangan,
-        #     debit, kredit,
-        #     debit - kredit  AS saldo,
-        #     'Opening'        AS sumber
-        #   FROM neraca_saldo_awal
-
-        #   UNION ALL
-
-        #   SELECT
-        #     ROW_NUMBER() OVER (ORDER BY tanggal) +
-        #       (SELECT COUNT(*) FROM neraca_saldo_awal) AS id,
-        #     date(tanggal) AS tanggal,
-        #     account_name,
-        #     keterangan,
-        #     debit, kredit,
-        #     saldo,
-        #     'Ledger' AS sumber
-        #   FROM ledger_entries
-        # """))
-        db.session.commit()
-
-        # 3) Now that tables & VIEW exist, populate the filter choices
+        # 3) Now that tables exist, populate the filter choices
         ledger_view.column_choices = {
             'account_name': get_account_name_choices()
         }
 
+    # the reloader's parent process only watches files; run the worker in the server
+    if (app.config['LEDGER_MODE'] == 'outbox' and app.config['OUTBOX_WORKER']
+            and os.environ.get('WERKZEUG_RUN_MAIN') == 'true'):
+        start_outbox_worker(app)
+
     app.run(debug=True, host='0.0.0.0')
@@ -0,0 +1,217 @@
+# benchmark.py
+#
+# Reproducible timings of the admin hot paths against synthetic data:
+#
+#   python benchmark.py --products 10000 --sales 200000 --ledger-rows 5000000 --out bench.json
+#   python benchmark.py --db /tmp/bench.db --reuse --compare bench-1.2.json
+#
+# The database is filled by datagen.generate() with a fixed seed, so two runs
+# with the same arguments measure the same data. The report is JSON: one
+# entry per scenario with min/median/p95/mean in milliseconds.
+
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date
+
+LIST_PAGES = [
+    ('list_product',       '/admin/product/'),
+    ('list_transaksi',     '/admin/transaksi/'),
+    ('list_jurnalumum',    '/admin/jurnalumum/'),
+    ('list_neraca_awal',   '/admin/neraca_awal/'),
+    ('list_neracasaldo',   '/admin/neracasaldo/'),
+    ('list_ledger',        '/admin/ledger/'),
+    ('list_ledger_kas',    '/admin/ledger/?flt0_0={kas_id}'),
+    ('list_ledger_merged', '/admin/ledger_merged/'),
+    ('browse_ledger',      '/admin/ledger/browse/?account=Kas+Tunai'),
+    ('search_ledger',      '/admin/ledger/?search=transaksi+12'),
+    ('search_product',     '/admin/product/?search=produk+001'),
+    ('api_search',         '/api/search?q=penjualan+transaksi+99'),
+    ('form_transaksi',     '/admin/transaksi/new/'),
+    ('ajax_product',       '/admin/transaksi/ajax/lookup/?name=transactionitem-product&query=produk+001'),
+    ('lookup_sku',         '/api/products/lookup?sku=8990000000001'),
+    ('trial_balance',      '/admin/trial_balance/'),
+]
+
+
+def posting_forms(today, product_id):
+    """(scenario, url, form data) for every on_model_change posting path."""
+    return [
+        ('post_product',     '/admin/product/new/',
+         {'name': 'Bench {n}', 'price': '1000', 'stock': '10', 'satuan': 'pcs',
+          'transaction_account': 'Kas Tunai'}),
+        ('post_transaksi',   '/admin/transaksi/new/',
+         {'date': f'{today} 10:00:00', 'items-0-product': str(product_id), 'items-0-quantity': '1'}),
+        ('post_jurnalumum',  '/admin/jurnalumum/new/',
+         {'tanggal': today, 'transaksi': 'Biaya Perlengkapan', 'debit': '100', 'kredit': '100'}),
+        ('post_neraca_awal', '/admin/neraca_awal/new/',
+         {'tanggal': today, 'account_name': 'Kas Tunai', 'debit': '100', 'kredit': '100'}),
+        ('post_neracasaldo', '/admin/neracasaldo/new/',
+         {'account_name': 'Kas Tunai', 'debit': '1', 'kredit': '1'}),
+    ]
+
+
+def measure(fn, repeat, warmup=1):
+    for _ in range(warmup):
+        fn(0)
+    times = []
+    for n in range(1, repeat + 1):
+        t0 = time.perf_counter()
+        fn(n)
+        times.append((time.perf_counter() - t0) * 1000)
+    times.sort()
+    return {
+        'n':      repeat,
+        'min':    round(times[0], 3),
+        'median': round(statistics.median(times), 3),
+        'p95':    round(times[min(len(times) - 1, int(0.95 * len(times)))], 3),
+        'mean':   round(statistics.fmean(times), 3),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline_path):
+    """Median ratio (current / baseline) per scenario present in both reports."""
+    with open(baseline_path) as f:
+        base = json.load(f)['scenarios']
+    return {name: round(r['median'] / base[name]['median'], 3)
+            for name, r in report['scenarios'].items()
+            if name in base and base[name]['median']}
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description='Benchmark admin pages and posting paths.')
+    p.add_argument('--db', help='database file (default: a new temp file)')
+    p.add_argument('--reuse', action='store_true',
+                   help='benchmark an existing --db instead of generating data')
+    p.add_argument('--products',    type=int, default=1000)
+    p.add_argument('--sales',       type=int, default=20000)
+    p.add_argument('--items',       type=int, default=3)
+    p.add_argument('--ledger-rows', type=int, default=100000)
+    p.add_argument('--opening',     type=int, default=10)
+    p.add_argument('--days',        type=int, default=365)
+    p.add_argument('--seed',        type=int, default=42)
+    p.add_argument('--repeat',      type=int, default=20, help='timed runs per scenario')
+    p.add_argument('--only', help='comma-separated scenario names')
+    p.add_argument('--out', help='write the JSON report here as well as stdout')
+    p.add_argument('--compare', help='earlier report to compute median ratios against')
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.reuse and not args.db:
+        sys.exit('--reuse needs --db')
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix='pos-bench-'), 'bench.db')
+    os.environ['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.abspath(db_path)
+
+    from app import app, get_account_name_choices
+    from search import ensure_search_index
+    from models import (db, Product, Ledger, Transaction, ensure_indexes,
+                        ensure_ledger_merged, account_id_of, invalidate_accounts)
+    import datagen
+
+    only = set(args.only.split(',')) if args.only else None
+    scenarios = {}
+
+    def run(name, fn):
+        if only is None or name in only:
+            scenarios[name] = measure(fn, args.repeat)
+            print(f"{name:24} {scenarios[name]['median']:10.2f} ms", file=sys.stderr)
+
+    with app.app_context():
+        db.create_all()
+        ensure_indexes()
+        if not args.reuse:
+            t0 = time.perf_counter()
+            datagen.generate(products=args.products, sales=args.sales, items_per_sale=args.items,
+                             ledger_rows=args.ledger_rows, opening=args.opening, days=args.days,
+                             seed=args.seed, log=lambda msg: print(msg, file=sys.stderr))
+            generate_s = round(time.perf_counter() - t0, 1)
+        else:
+            ensure_ledger_merged()
+            ensure_search_index()
+            generate_s = None
+
+        counts = {
+            'products':       db.session.query(db.func.count(Product.id)).scalar(),
+            'transactions':   db.session.query(db.func.count(Transaction.id)).scalar(),
+            'ledger_entries': db.session.query(db.func.count(Ledger.id)).scalar(),
+        }
+        kas_id = account_id_of('Kas Tunai')
+        product_id = (db.session.query(Product.id)
+                      .order_by(Product.stock.desc()).limit(1).scalar())
+        db.session.remove()
+
+    client = app.test_client()
+    with client.session_transaction() as s:
+        s['logged_in'] = True
+
+    def get(url):
+        def fn(_):
+            r = client.get(url)
+            if r.status_code != 200:
+                raise RuntimeError(f"GET {url} -> {r.status_code}")
+        return fn
+
+    def post(url, data):
+        def fn(n):
+            form = {k: v.format(n=f'{time.time_ns()}-{n}') for k, v in data.items()}
+            r = client.post(url, data=form)
+            if r.status_code != 302:
+                raise RuntimeError(f"POST {url} -> {r.status_code}")
+        return fn
+
+    for name, url in LIST_PAGES:
+        run(name, get(url.format(kas_id=kas_id)))
+
+    for name, url, data in posting_forms(date.today().isoformat(), product_id):
+        run(name, post(url, data))
+
+    with app.app_context():
+        def choices_cold(_):
+            invalidate_accounts()
+            get_account_name_choices()
+        run('account_choices_cold', choices_cold)
+        run('account_choices',      lambda _: get_account_name_choices())
+
+    report = {
+        'revision':  git_revision(),
+        'python':    platform.python_version(),
+        'sqlite':    sqlite3.sqlite_version,
+        'params':    {k: getattr(args, k) for k in
+                      ('products', 'sales', 'items', 'ledger_rows', 'opening', 'days', 'seed',
+                       'repeat')},
+        'rows':      counts,
+        'generate_s': generate_s,
+        'scenarios': scenarios,
+        'database':  db_path,
+    }
+    if args.compare:
+        report['vs_baseline'] = compare(report, args.compare)
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(text + '\n')
+    print(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,101 @@
+# catalog.py
+#
+# Process-local product catalogue for checkout and barcode scanners:
+# product id or SKU/barcode -> (id, sku, name, price, satuan). Entries are
+# kept in an LRU of CATALOG_CACHE_SIZE products and expire after CATALOG_TTL
+# seconds; ProductView drops them as soon as it saves, other processes pick
+# the change up when their entry expires. Stock is not cached, it changes
+# with every sale.
+
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from sqlalchemy import select
+
+from models import db, Product
+
+CATALOG_CACHE_SIZE = 20000
+CATALOG_TTL        = 300      # seconds
+
+CatalogItem = namedtuple('CatalogItem', 'id sku name price satuan')
+
+_by_id  = OrderedDict()       # id -> (loaded_at, CatalogItem), least recently used first
+_by_sku = {}                  # sku -> id, for the ids in _by_id
+_lock   = threading.Lock()
+
+
+def _load(condition):
+    return [CatalogItem(*row) for row in db.session.execute(
+        select(Product.id, Product.sku, Product.name, Product.price, Product.satuan)
+        .where(condition))]
+
+
+def _remember(items):
+    now = time.monotonic()
+    with _lock:
+        for item in items:
+            _by_id[item.id] = (now, item)
+            _by_id.move_to_end(item.id)
+            if item.sku:
+                _by_sku[item.sku] = item.id
+        while len(_by_id) > CATALOG_CACHE_SIZE:
+            _, (_, old) = _by_id.popitem(last=False)
+            if old.sku and _by_sku.get(old.sku) == old.id:
+                del _by_sku[old.sku]
+
+
+def _cached(product_id):
+    with _lock:
+        entry = _by_id.get(product_id)
+        if entry is None or time.monotonic() - entry[0] > CATALOG_TTL:
+            return None
+        _by_id.move_to_end(product_id)
+        return entry[1]
+
+
+def products_by_ids(ids):
+    """{id: CatalogItem} for ``ids``; misses are loaded with one IN (...) query."""
+    found, missing = {}, []
+    for product_id in set(ids):
+        item = _cached(product_id)
+        if item is None:
+            missing.append(product_id)
+        else:
+            found[product_id] = item
+    if missing:
+        loaded = _load(Product.id.in_(missing))
+        _remember(loaded)
+        found.update((item.id, item) for item in loaded)
+    return found
+
+
+def product_by_id(product_id):
+    return products_by_ids([product_id]).get(product_id)
+
+
+def product_by_sku(sku):
+    """CatalogItem for a SKU / barcode, or None."""
+    sku = (sku or '').strip()
+    if not sku:
+        return None
+    with _lock:
+        product_id = _by_sku.get(sku)
+    item = _cached(product_id) if product_id is not None else None
+    if item is not None and item.sku == sku:
+        return item
+    loaded = _load(Product.sku == sku)
+    _remember(loaded)
+    return loaded[0] if loaded else None
+
+
+def invalidate_catalog(product_id=None):
+    """Forget one product, or the whole catalogue when ``product_id`` is None."""
+    with _lock:
+        if product_id is None:
+            _by_id.clear()
+            _by_sku.clear()
+            return
+        _, item = _by_id.pop(product_id, (None, None))
+        if item is not None and item.sku and _by_sku.get(item.sku) == product_id:
+            del _by_sku[item.sku]
@@ -3,8 +3,56 @@ import os
 
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 
+# Installs from before pos.db kept their data in Flask's instance folder
+# ('sqlite:///database.db'). While that file exists and
+# SQLALCHEMY_DATABASE_URI is not set it stays the database, so an upgrade
+# does not come up empty; move it to pos.db (or set the variable) to switch.
+LEGACY_DB  = os.path.join(BASE_DIR, 'instance', 'database.db')
+DEFAULT_DB = LEGACY_DB if os.path.exists(LEGACY_DB) else os.path.join(BASE_DIR, 'pos.db')
+
 class Config:
-    SECRET_KEY = 'your-secret-key'
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(BASE_DIR, 'pos.db')
+    SECRET_KEY = os.environ.get('SECRET_KEY', 'your-secret-key')
+    SQLALCHEMY_DATABASE_URI = os.environ.get('SQLALCHEMY_DATABASE_URI', 'sqlite:///' + DEFAULT_DB)
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-# untuk menyimpan database atau basis data
\ No newline at end of file
+
+    # one pooled connection per server thread; pysqlite's own wait on a
+    # locked database matches busy_timeout below
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size':     int(os.environ.get('DB_POOL_SIZE', 10)),
+        'max_overflow':  int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout':  30,
+        'connect_args':  {'timeout': 5, 'check_same_thread': False},
+    }
+
+    # applied to every new SQLite connection (see models.install_sqlite_pragmas);
+    # SQLITE_PROFILE=default keeps SQLite's stock rollback-journal settings
+    SQLITE_PRAGMAS = {} if os.environ.get('SQLITE_PROFILE') == 'default' else {
+        'journal_mode': 'WAL',          # readers no longer wait behind writers
+        'synchronous':  'NORMAL',       # safe with WAL, one fsync per checkpoint
+        'busy_timeout': 5000,           # ms to wait for a lock before 'database is locked'
+        'cache_size':   -64000,         # KiB (negative) -> 64 MB page cache
+        'mmap_size':    256 * 1024 * 1024,
+        'temp_store':   'MEMORY',
+    }
+
+    # request metrics (metrics.py); /metrics answers only local clients
+    SLOW_QUERY_MS      = float(os.environ.get('SLOW_QUERY_MS', 200))
+    SLOW_QUERY_LOG     = os.environ.get('SLOW_QUERY_LOG')      # file path, else app logger
+    NPLUSONE_THRESHOLD = int(os.environ.get('NPLUSONE_THRESHOLD', 20))
+    METRICS_ALLOW      = ('127.0.0.1', '::1')
+
+    # 'sync' posts ledger rows with each sale/purchase; 'outbox' queues them in
+    # ledger_outbox for a background worker (outbox.py)
+    LEDGER_MODE   = os.environ.get('LEDGER_MODE', 'sync')
+    OUTBOX_BATCH  = int(os.environ.get('OUTBOX_BATCH', 500))
+    OUTBOX_POLL_S = float(os.environ.get('OUTBOX_POLL_S', 0.5))
+    OUTBOX_WORKER = os.environ.get('OUTBOX_WORKER', '1') == '1'   # run it inside the web process
+
+    # how sales are costed from stock_movements (inventory.py): 'fifo' or
+    # 'average'; run 'flask revalue-inventory' after changing it
+    COSTING_METHOD = os.environ.get('COSTING_METHOD', 'fifo')
+
+    # idempotency keys (idempotency.py) are kept this long; a retry after that
+    # is treated as a new request
+    IDEMPOTENCY_TTL_HOURS = float(os.environ.get('IDEMPOTENCY_TTL_HOURS', 48))
+# untuk menyimpan database atau basis data
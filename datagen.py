@@ -0,0 +1,189 @@
+# datagen.py
+#
+# Synthetic data for benchmarks and load tests:
+#
+#   python datagen.py --db /tmp/bench.db --products 10000 --sales 200000 --ledger-rows 5000000
+#
+# Rows are written with executemany in chunks, in date order, so the stored
+# per-account saldo chain is consistent; every debit/kredit pair gets its
+# journal_entries header. ledger_merged and account_balances are built once
+# at the end instead of row by row.
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+CHUNK = 20000
+
+JOURNAL_PAIRS = [
+    # (debit account, credit account, keterangan)
+    ('Biaya Perlengkapan', 'Kas Tunai',         'Jurnal: Biaya Perlengkapan'),
+    ('Kas Tunai',          'Pendapatan Lain',   'Jurnal: Pendapatan Lain'),
+    ('Persediaan Barang',  'Utang Usaha',       'Pembelian persediaan'),
+    ('Utang Usaha',        'Kas Tunai',         'Pelunasan utang'),
+]
+OPENING_ACCOUNTS = ['Kas Tunai', 'Persediaan Barang', 'Utang Usaha']
+
+
+def generate(products=1000, sales=20000, items_per_sale=3, ledger_rows=100000,
+             opening=10, days=365, start=None, seed=42, log=print):
+    """Fill the app's database (call inside an app context). Returns row counts."""
+    from sqlalchemy import insert
+    from sales import rebuild_sales_daily
+    from inventory import revalue_inventory
+    from search import ensure_search_index, rebuild_search_index
+    from models import (db, Product, Transaction, TransactionItem, Ledger, NeracaSaldoAwal,
+                        JournalEntry, account_id_of, account_name_of, ensure_accounts, rebuild_account_balances,
+                        rebuild_ledger_merged, ensure_ledger_merged)
+
+    rnd   = random.Random(seed)
+    start = start or datetime(datetime.utcnow().year - 1, 1, 1)
+    t0    = time.perf_counter()
+
+    ensure_accounts()
+    acc = {name: account_id_of(name) for name in
+           {a for pair in JOURNAL_PAIRS for a in pair[:2]} | {'Penjualan', 'Modal Awal'}}
+    db.session.commit()
+
+    # products
+    prices = [Decimal(rnd.randrange(500, 200000, 500)) for _ in range(products)]
+    first_product = (db.session.query(db.func.max(Product.id)).scalar() or 0) + 1
+    for i in range(0, products, CHUNK):
+        db.session.execute(insert(Product), [
+            {'name': f'Produk {first_product + j:05d}', 'sku': f'899{first_product + j:010d}',
+             'price': prices[j],
+             'stock': rnd.randint(0, 5000), 'satuan': rnd.choice(['pcs', 'kg', 'box', 'liter'])}
+            for j in range(i, min(i + CHUNK, products))])
+    db.session.commit()
+    log(f"products: {products}")
+
+    # sales and journal pairs, generated day by day so ids follow tanggal
+    journal_pairs = max(0, ledger_rows - 2 * sales) // 2
+    saldo   = {}
+    ledger  = []
+    journal = []
+    trans_id = (db.session.query(db.func.max(Transaction.id)).scalar() or 0)
+    entry_id = (db.session.query(db.func.max(JournalEntry.id)).scalar() or 0)
+    n_sales = n_items = n_ledger = 0
+
+    def post(tanggal, ket, debit_acc, kredit_acc, amount, source=(None, None)):
+        nonlocal entry_id
+        entry_id += 1
+        journal.append({'id': entry_id, 'tanggal': tanggal, 'keterangan': ket,
+                        'source_type': source[0], 'source_id': source[1]})
+        for account_id, debit, kredit in ((debit_acc, amount, Decimal('0.00')),
+                                          (kredit_acc, Decimal('0.00'), amount)):
+            saldo[account_id] = saldo.get(account_id, Decimal('0.00')) + debit - kredit
+            ledger.append({'tanggal': tanggal, 'keterangan': ket, 'account_id': account_id,
+                           'debit': debit, 'kredit': kredit, 'saldo': saldo[account_id],
+                           'entry_id': entry_id})
+
+    def flush(force=False):
+        nonlocal ledger, journal, n_ledger
+        if ledger and (force or len(ledger) >= CHUNK):
+            db.session.execute(insert(JournalEntry), journal)
+            db.session.execute(insert(Ledger), ledger)
+            n_ledger += len(ledger)
+            ledger, journal = [], []
+
+    # opening balances on the first day, posted like NeracaSaldoAwalView does
+    opening_rows = [{'tanggal': start.date(), 'account_id': acc.get(a) or account_id_of(a),
+                     'debit': Decimal(rnd.randrange(1_000_000, 50_000_000, 1000)), 'kredit': 0}
+                    for a in (OPENING_ACCOUNTS * opening)[:opening]]
+    opening_ids = db.session.execute(
+        insert(NeracaSaldoAwal).returning(NeracaSaldoAwal.id, sort_by_parameter_order=True),
+        opening_rows).scalars().all() if opening_rows else []
+    for row, opening_id in zip(opening_rows, opening_ids):
+        post(start, f"Saldo Awal {account_name_of(row['account_id'])}",
+             row['account_id'], acc['Modal Awal'], row['debit'], ('opening', opening_id))
+
+    for day in range(days):
+        base = start + timedelta(days=day)
+        todays_sales = sales // days + (day < sales % days)
+        todays_pairs = journal_pairs // days + (day < journal_pairs % days)
+        events = sorted([('s', rnd.random()) for _ in range(todays_sales)] +
+                        [('j', rnd.random()) for _ in range(todays_pairs)], key=lambda e: e[1])
+        trans, items = [], []
+        for kind, frac in events:
+            tanggal = base + timedelta(seconds=int(frac * 86399))
+            if kind == 's':
+                trans_id += 1
+                total = Decimal('0.00')
+                for _ in range(rnd.randint(1, items_per_sale * 2 - 1)):
+                    pid = rnd.randrange(products)
+                    qty = rnd.randint(1, 5)
+                    sub = prices[pid] * qty
+                    total += sub
+                    items.append({'transaction_id': trans_id, 'product_id': first_product + pid,
+                                  'quantity': qty, 'subtotal': sub})
+                trans.append({'id': trans_id, 'date': tanggal, 'total': total})
+                post(tanggal, f"Penjualan Transaksi #{trans_id}", acc['Kas Tunai'],
+                     acc['Penjualan'], total, ('transaction', trans_id))
+            else:
+                debit_acc, credit_acc, ket = rnd.choice(JOURNAL_PAIRS)
+                amount = Decimal(rnd.randrange(10000, 5_000_000, 100))
+                post(tanggal, ket, acc[debit_acc], acc[credit_acc], amount)
+            flush()
+        if trans:
+            db.session.execute(insert(Transaction), trans)
+            db.session.execute(insert(TransactionItem), items)
+            n_sales += len(trans)
+            n_items += len(items)
+        if day % 30 == 29:
+            db.session.commit()
+            log(f"  {base:%Y-%m-%d}: {n_sales} sales, {n_ledger + len(ledger)} ledger rows")
+    flush(force=True)
+    db.session.commit()
+
+    # derived tables in one pass each
+    rebuild_account_balances()
+    rebuild_sales_daily()
+    revalue_inventory()     # stock on hand enters the cost layers at its price
+    if not ensure_ledger_merged():
+        rebuild_ledger_merged()
+    if not ensure_search_index():
+        rebuild_search_index()
+
+    counts = {'products': products, 'opening': len(opening_rows), 'transactions': n_sales,
+              'transaction_items': n_items, 'ledger_entries': n_ledger}
+    log(f"done in {time.perf_counter() - t0:.1f}s: {counts}")
+    return counts
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description='Generate synthetic POS/ledger data.')
+    p.add_argument('--db', required=True, help='SQLite file to fill (created if missing)')
+    p.add_argument('--products',    type=int, default=1000)
+    p.add_argument('--sales',       type=int, default=20000)
+    p.add_argument('--items',       type=int, default=3, help='average items per sale')
+    p.add_argument('--ledger-rows', type=int, default=100000,
+                   help='total ledger rows (sales contribute 2 each, the rest are journal pairs)')
+    p.add_argument('--opening',     type=int, default=10)
+    p.add_argument('--days',        type=int, default=365)
+    p.add_argument('--seed',        type=int, default=42)
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.environ['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.abspath(args.db)
+
+    from app import app
+    from models import db, ensure_indexes
+
+    with app.app_context():
+        # ledger_merged and search triggers are installed after the bulk load
+        db.create_all()
+        ensure_indexes()
+        generate(products=args.products, sales=args.sales, items_per_sale=args.items,
+                 ledger_rows=args.ledger_rows, opening=args.opening, days=args.days,
+                 seed=args.seed)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
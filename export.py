@@ -0,0 +1,108 @@
+# export.py
+
+import csv
+import io
+import tempfile
+from datetime import datetime, timedelta
+from sqlalchemy import select
+
+from models import (db, Account, Ledger, LedgerMerged, Transaction, TransactionItem, Product,
+                    account_id_of)
+
+EXPORT_BATCH = 2000        # rows fetched per round trip
+CSV_CHUNK    = 64 * 1024   # bytes per chunk sent to the client
+
+LEDGER_HEADER = ['id', 'tanggal', 'account_name', 'keterangan', 'debit', 'kredit', 'saldo']
+SALES_HEADER  = ['transaction_id', 'tanggal', 'total', 'item_id', 'product_id',
+                 'product', 'quantity', 'subtotal']
+MERGED_HEADER = ['tanggal', 'account_name', 'keterangan', 'debit', 'kredit', 'saldo', 'sumber']
+
+
+def _range(column, start, end):
+    # start/end are dates, both inclusive
+    cond = []
+    if start:
+        cond.append(column >= datetime.combine(start, datetime.min.time()))
+    if end:
+        cond.append(column < datetime.combine(end + timedelta(days=1), datetime.min.time()))
+    return cond
+
+
+def _stream(stmt):
+    # yield_per streams from the cursor in batches instead of buffering all rows
+    result = db.session.execute(stmt.execution_options(yield_per=EXPORT_BATCH))
+    for partition in result.partitions():
+        for row in partition:
+            yield tuple(row)
+
+
+# ------------------------------------------------------------------------------
+# Row sources
+# ------------------------------------------------------------------------------
+
+def ledger_rows(start=None, end=None, account_name=None):
+    stmt = select(Ledger.id, Ledger.tanggal, Account.name, Ledger.keterangan,
+                  Ledger.debit, Ledger.kredit, Ledger.saldo) \
+        .join(Account, Account.id == Ledger.account_id) \
+        .where(*_range(Ledger.tanggal, start, end))
+    if account_name:
+        stmt = stmt.where(Ledger.account_id == account_id_of(account_name, create=False))
+    return _stream(stmt.order_by(Ledger.tanggal, Ledger.id))
+
+
+def sales_rows(start=None, end=None):
+    stmt = (select(Transaction.id, Transaction.date, Transaction.total,
+                   TransactionItem.id, TransactionItem.product_id, Product.name,
+                   TransactionItem.quantity, TransactionItem.subtotal)
+            .join(TransactionItem, TransactionItem.transaction_id == Transaction.id)
+            .join(Product, Product.id == TransactionItem.product_id)
+            .where(*_range(Transaction.date, start, end))
+            .order_by(Transaction.date, Transaction.id, TransactionItem.id))
+    return _stream(stmt)
+
+
+def merged_rows(start=None, end=None, account_name=None):
+    stmt = select(LedgerMerged.tanggal, Account.name, LedgerMerged.keterangan,
+                  LedgerMerged.debit, LedgerMerged.kredit, LedgerMerged.saldo,
+                  LedgerMerged.sumber) \
+        .join(Account, Account.id == LedgerMerged.account_id)
+    if start:
+        stmt = stmt.where(LedgerMerged.tanggal >= start)
+    if end:
+        stmt = stmt.where(LedgerMerged.tanggal <= end)
+    if account_name:
+        stmt = stmt.where(LedgerMerged.account_id == account_id_of(account_name, create=False))
+    return _stream(stmt.order_by(LedgerMerged.tanggal, LedgerMerged.id))
+
+
+# ------------------------------------------------------------------------------
+# Writers (generators of bytes, for a chunked response)
+# ------------------------------------------------------------------------------
+
+def stream_csv(header, rows):
+    buf = io.StringIO()
+    out = csv.writer(buf)
+    out.writerow(header)
+    for row in rows:
+        out.writerow(row)
+        if buf.tell() >= CSV_CHUNK:
+            yield buf.getvalue().encode('utf-8')
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue().encode('utf-8')
+
+
+def stream_xlsx(header, rows, title='Data'):
+    """XLSX via openpyxl's write-only mode; rows go to a temp file, not RAM."""
+    from openpyxl import Workbook    # optional dependency, only needed for XLSX
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title)
+    ws.append(header)
+    for row in rows:
+        ws.append(row)
+    with tempfile.TemporaryFile() as tmp:
+        wb.save(tmp)
+        tmp.seek(0)
+        while chunk := tmp.read(CSV_CHUNK):
+            yield chunk
@@ -0,0 +1,105 @@
+# idempotency.py
+#
+# Duplicate-submission suppression for postings. A till that retries a sale
+# after a timeout sends the same key again (Idempotency-Key header for the
+# JSON API, a hidden form field for the admin forms). The key is recorded in
+# idempotency_keys in the same commit as the rows the request created, so:
+#
+#   - a retry after that commit finds the key and gets the original result
+#     back; nothing is posted twice
+#   - a request that failed rolled its key back with everything else, so its
+#     retry is simply processed
+#   - two copies racing each other both do the work, but the second one's
+#     insert hits the unique index, raises DuplicateRequest and rolls back
+#
+# Keys are kept IDEMPOTENCY_TTL_HOURS; every record() deletes a few expired
+# ones, so the table stays bounded without a separate job.
+
+import hashlib
+import json
+import uuid
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import select, delete
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import db, IdempotencyKey
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH     = 100
+PURGE_BATCH        = 100      # expired keys deleted per record()
+
+
+class IdempotencyConflict(ValueError):
+    """The key was already used for a different request."""
+
+
+class DuplicateRequest(Exception):
+    """Another request with the same key committed first; roll back and replay()."""
+
+
+def new_idempotency_key():
+    return uuid.uuid4().hex
+
+
+def fingerprint(payload):
+    """sha256 of a request body (bytes / str) or of any JSON-serialisable value."""
+    if not isinstance(payload, (bytes, str)):
+        payload = json.dumps(payload, sort_keys=True, default=str)
+    if isinstance(payload, str):
+        payload = payload.encode('utf-8')
+    return hashlib.sha256(payload).hexdigest()
+
+
+def check_key(key):
+    key = (key or '').strip()
+    if len(key) > MAX_KEY_LENGTH:
+        raise ValueError(f"Idempotency key maksimal {MAX_KEY_LENGTH} karakter.")
+    return key or None
+
+
+def _expired_before():
+    return datetime.utcnow() - timedelta(hours=current_app.config.get('IDEMPOTENCY_TTL_HOURS', 48))
+
+
+def replay(scope, key, request_fingerprint):
+    """Stored result of an earlier request with this key, or None if there was none."""
+    row = db.session.execute(
+        select(IdempotencyKey.fingerprint, IdempotencyKey.result, IdempotencyKey.created_at)
+        .where(IdempotencyKey.scope == scope, IdempotencyKey.key == key)).first()
+    if row is None or row.created_at < _expired_before():
+        return None
+    if row.fingerprint != request_fingerprint:
+        raise IdempotencyConflict("Idempotency key sudah dipakai untuk permintaan lain.")
+    return json.loads(row.result)
+
+
+def record(scope, key, request_fingerprint, result):
+    """Remember ``result`` for ``key`` in the caller's transaction.
+
+    Raises DuplicateRequest when a request with the same key got there first.
+    """
+    cutoff = _expired_before()
+    db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.id.in_(
+        select(IdempotencyKey.id).where(IdempotencyKey.created_at < cutoff)
+        .order_by(IdempotencyKey.created_at).limit(PURGE_BATCH))))
+    # an expired copy of this very key may be newer than the batch above
+    db.session.execute(delete(IdempotencyKey).where(
+        IdempotencyKey.scope == scope, IdempotencyKey.key == key,
+        IdempotencyKey.created_at < cutoff))
+    res = db.session.execute(
+        sqlite_insert(IdempotencyKey)
+        .values(scope=scope, key=key, fingerprint=request_fingerprint,
+                result=json.dumps(result, default=str), created_at=datetime.utcnow())
+        .on_conflict_do_nothing(index_elements=['scope', 'key']))
+    if res.rowcount != 1:
+        raise DuplicateRequest(f"{scope}:{key}")
+
+
+def purge_idempotency_keys(before=None):
+    """Delete every key recorded before ``before`` (default: the TTL)."""
+    res = db.session.execute(
+        delete(IdempotencyKey).where(IdempotencyKey.created_at < (before or _expired_before())))
+    db.session.commit()
+    return res.rowcount
@@ -0,0 +1,274 @@
+# importer.py
+#
+# Bulk CSV import for onboarding: products, opening balances (saldo awal)
+# and historical journal entries. Rows are validated as they stream in,
+# inserted with executemany in chunks of IMPORT_CHUNK (one transaction per
+# chunk) and their journal entries go through one post_journal() call per
+# chunk. The entries are the ones the matching admin views post.
+
+import csv
+import io
+import itertools
+import time
+from datetime import datetime, date
+from decimal import Decimal, InvalidOperation
+
+from sqlalchemy import insert, select
+
+from models import (db, Product, NeracaSaldoAwal, JurnalUmum, Ledger, JournalEntry,
+                    post_journal, account_id_of, last_closed_date, _as_date, _check_balanced)
+from inventory import receive_stock
+
+IMPORT_CHUNK = 1000
+MAX_REPORTED_ERRORS = 1000
+
+ZERO = Decimal('0.00')
+
+# same counter-accounts as ProductView's 'Akun Lawan'
+PURCHASE_ACCOUNTS = ('Kas Tunai', 'Utang Usaha', 'Persediaan Barang')
+
+
+class RowError(ValueError):
+    pass
+
+
+# ------------------------------------------------------------------------------
+# Field parsing
+# ------------------------------------------------------------------------------
+
+def _text(row, field, required=True):
+    value = (row.get(field) or '').strip()
+    if required and not value:
+        raise RowError(f"Kolom '{field}' wajib diisi.")
+    return value
+
+
+def _money(row, field, default=ZERO):
+    raw = (row.get(field) or '').strip()
+    if not raw:
+        return default
+    try:
+        value = Decimal(raw).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise RowError(f"Nilai '{field}' tidak valid: {raw!r}")
+    if value < 0:
+        raise RowError(f"Nilai '{field}' tidak boleh negatif.")
+    return value
+
+
+def _int(row, field, default=0):
+    raw = (row.get(field) or '').strip()
+    if not raw:
+        return default
+    try:
+        return int(raw)
+    except ValueError:
+        raise RowError(f"Nilai '{field}' harus bilangan bulat: {raw!r}")
+
+
+def _date(row, field):
+    raw = _text(row, field)
+    try:
+        return date.fromisoformat(raw)
+    except ValueError:
+        raise RowError(f"Tanggal tidak valid (YYYY-MM-DD): {raw!r}")
+
+
+def _account(name):
+    account_id = account_id_of(name, create=False)
+    if account_id is None:
+        raise RowError(f"Akun '{name}' tidak dikenal.")
+    return account_id
+
+
+def _entry(tanggal, keterangan, source_type, debit_account, kredit_account, debit, kredit):
+    lines = []
+    if debit:
+        lines.append(Ledger(tanggal=tanggal, keterangan=keterangan, account_id=debit_account,
+                            debit=debit, kredit=ZERO))
+    if kredit:
+        lines.append(Ledger(tanggal=tanggal, keterangan=keterangan, account_id=kredit_account,
+                            debit=ZERO, kredit=kredit))
+    if not lines:
+        return None
+    entry = JournalEntry(tanggal=tanggal, keterangan=keterangan, source_type=source_type,
+                         lines=lines)
+    try:
+        _check_balanced(entry)
+    except ValueError as e:
+        raise RowError(str(e))
+    return entry
+
+
+# ------------------------------------------------------------------------------
+# Row parsers: CSV dict -> (insert values, journal entry or None)
+# ------------------------------------------------------------------------------
+
+def _product_row(row, now):
+    name   = _text(row, 'name')
+    price  = _money(row, 'price', default=None)
+    if price is None:
+        raise RowError("Kolom 'price' wajib diisi.")
+    stock  = _int(row, 'stock')
+    if stock < 0:
+        raise RowError("Nilai 'stock' tidak boleh negatif.")
+    lawan  = _text(row, 'akun_lawan', required=False) or 'Kas Tunai'
+    if lawan not in PURCHASE_ACCOUNTS:
+        raise RowError(f"Akun lawan harus salah satu dari {', '.join(PURCHASE_ACCOUNTS)}.")
+    cost   = _money(row, 'harga_beli', default=price) * stock
+    values = {'name': name, 'price': price, 'stock': stock,
+              'sku': _text(row, 'sku', required=False) or None,
+              'satuan': _text(row, 'satuan', required=False) or None}
+    return values, _entry(now, f"Pembelian {name}", 'product', _account('Persediaan Barang'),
+                          _account(lawan), cost, cost)
+
+
+def _opening_row(row, now):
+    tanggal    = _date(row, 'tanggal')
+    account_id = _account(_text(row, 'account_name'))
+    debit, kredit = _money(row, 'debit'), _money(row, 'kredit')
+    values = {'tanggal': tanggal, 'account_id': account_id, 'debit': debit, 'kredit': kredit}
+    ket    = f"Saldo Awal {row['account_name'].strip()}"
+    return values, _entry(datetime.combine(tanggal, datetime.min.time()), ket, 'opening',
+                          account_id, _account('Modal Awal'), debit, kredit)
+
+
+def _journal_row(row, now):
+    tanggal    = datetime.combine(_date(row, 'tanggal'), datetime.min.time())
+    transaksi  = _text(row, 'transaksi')
+    account_id = _account(transaksi)
+    debit, kredit = _money(row, 'debit'), _money(row, 'kredit')
+    values = {'tanggal': tanggal, 'transaksi': transaksi, 'debit': debit, 'kredit': kredit}
+    return values, _entry(tanggal, f"Jurnal: {transaksi}", 'jurnal', account_id,
+                          _account('Kas Tunai'), debit, kredit)
+
+
+def _existing_skus(skus):
+    """The subset of ``skus`` already taken in products (one IN (...) query)."""
+    if not skus:
+        return set()
+    return set(db.session.execute(select(Product.sku).where(Product.sku.in_(skus))).scalars())
+
+
+# kind -> (model, required header columns, row parser)
+IMPORTERS = {
+    'product':    (Product,         ['name', 'price'],                 _product_row),
+    'saldo_awal': (NeracaSaldoAwal, ['tanggal', 'account_name'],       _opening_row),
+    'jurnal':     (JurnalUmum,      ['tanggal', 'transaksi'],          _journal_row),
+}
+
+
+# ------------------------------------------------------------------------------
+# Driver
+# ------------------------------------------------------------------------------
+
+def _reader(stream):
+    """csv.DictReader over a text stream; ';' is accepted as the delimiter too."""
+    header = stream.readline()
+    delimiter = ';' if header.count(';') > header.count(',') else ','
+    return csv.DictReader(itertools.chain([header], stream), delimiter=delimiter)
+
+
+def import_csv(kind, stream, chunk_size=IMPORT_CHUNK, dry_run=False):
+    """Import a CSV text stream of ``kind`` (see IMPORTERS).
+
+    Invalid rows are skipped and reported by line number; every valid chunk is
+    committed with its ledger postings. With dry_run nothing is written.
+    """
+    if kind not in IMPORTERS:
+        raise ValueError(f"Jenis import tidak dikenal: {kind!r}")
+    model, required, parse = IMPORTERS[kind]
+
+    t0      = time.perf_counter()
+    reader  = _reader(stream)
+    missing = [c for c in required if c not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError(f"Kolom wajib tidak ada: {', '.join(missing)}")
+
+    closed   = last_closed_date()
+    now      = datetime.utcnow()
+    errors, error_count = [], 0
+    total = imported = 0
+    values, entries, lines = [], [], []
+    skus = {}                 # sku -> line it was first seen on, for product imports
+
+    def report(line, message):
+        nonlocal error_count
+        error_count += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({'line': line, 'error': message})
+
+    def flush():
+        nonlocal imported, values, entries, lines
+        if model is Product and values:
+            # the unique index on sku would abort the whole chunk; report the rows instead
+            taken = _existing_skus({v['sku'] for v in values if v['sku']})
+            if taken:
+                keep = []
+                for i, v in enumerate(values):
+                    if v['sku'] in taken:
+                        report(lines[i], f"SKU '{v['sku']}' sudah dipakai produk lain.")
+                    else:
+                        keep.append(i)
+                values  = [values[i] for i in keep]
+                entries = [entries[i] for i in keep]
+                lines   = [lines[i] for i in keep]
+        if values and not dry_run:
+            ids = db.session.execute(
+                insert(model).returning(model.id, sort_by_parameter_order=True), values
+            ).scalars().all()
+            for entry, source_id in zip(entries, ids):
+                if entry is not None:
+                    entry.source_id = source_id
+            if model is Product:
+                # the stock enters the cost layers at the entry's Persediaan Barang debit
+                receive_stock([{'tanggal': now, 'product_id': pid, 'quantity': v['stock'],
+                                'value': entry.lines[0].debit if entry is not None else ZERO,
+                                'source_type': 'product', 'source_id': pid}
+                               for pid, v, entry in zip(ids, values, entries)])
+            post_journal(*[e for e in entries if e is not None], bulk=True)
+            db.session.commit()
+        imported += len(values)
+        values, entries, lines = [], [], []
+
+    for row in reader:
+        total += 1
+        try:
+            row_values, row_entry = parse(row, now)
+            if closed and row_entry and any(_as_date(l.tanggal) <= closed
+                                            for l in row_entry.lines):
+                raise RowError(f"Periode sampai {closed} sudah ditutup.")
+            sku = row_values.get('sku') if model is Product else None
+            if sku:
+                if sku in skus:
+                    raise RowError(f"SKU '{sku}' sudah dipakai di baris {skus[sku]}.")
+                skus[sku] = reader.line_num
+        except RowError as e:
+            report(reader.line_num, str(e))
+            continue
+        values.append(row_values)
+        entries.append(row_entry)
+        lines.append(reader.line_num)
+        if len(values) >= chunk_size:
+            flush()
+    flush()
+    errors.sort(key=lambda e: e['line'])   # SKU clashes with the database are found per chunk
+
+    return {
+        'kind':        kind,
+        'rows':        total,
+        'imported':    imported,
+        'error_count': error_count,
+        'errors':      errors,
+        'dry_run':     dry_run,
+        'elapsed_s':   round(time.perf_counter() - t0, 3),
+    }
+
+
+def import_upload(kind, file_storage, **kwargs):
+    """import_csv() for a werkzeug FileStorage (multipart upload)."""
+    stream = io.TextIOWrapper(file_storage.stream, encoding='utf-8-sig', newline='')
+    try:
+        return import_csv(kind, stream, **kwargs)
+    finally:
+        stream.detach()
@@ -0,0 +1,194 @@
+# integrity.py
+#
+# Ledger verification for the nightly reconciliation:
+#
+#   flask --app app verify-ledger [--workers 8] [--fix] [--out report.json]
+#
+# ledger_entries is split into id ranges that a process pool scans in two
+# passes. Pass 1 sums each range per account (and per journal entry, to find
+# postings whose debits and credits differ). Prefix sums of those give every
+# range the exact per-account balance it starts from, so pass 2 can replay
+# the saldo chain of all ranges in parallel and list the rows whose stored
+# saldo is wrong. Without --fix nothing is written (the report is the diff);
+# with --fix each worker rewrites its own wrong rows in batched UPDATEs.
+#
+# Workers use their own sqlite3 connections and read Money columns as the
+# integer sen they are stored as, so all arithmetic is exact.
+
+import multiprocessing
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+from functools import partial
+
+from sqlalchemy import func
+
+from models import db, Ledger, AccountBalance, account_name_of, rebuild_account_balances
+
+VERIFY_CHUNK_ROWS = 500000      # ledger ids per range
+FIX_BATCH         = 10000       # corrected rows per UPDATE transaction
+DIFF_LIMIT        = 100         # diff rows kept in the report
+FIX_BUSY_TIMEOUT  = 600000      # ms a fixing worker waits for the write lock
+
+
+def _connect(path, pragmas, busy_timeout=None):
+    con = sqlite3.connect(path, timeout=(busy_timeout or 5000) / 1000)
+    for name, value in pragmas.items():
+        con.execute(f"PRAGMA {name}={value}")
+    if busy_timeout:
+        con.execute(f"PRAGMA busy_timeout={busy_timeout}")
+    return con
+
+
+def _rupiah(sen):
+    return str(Decimal(sen).scaleb(-2))
+
+
+# ------------------------------------------------------------------------------
+# Workers (run in child processes; arguments and results must pickle)
+# ------------------------------------------------------------------------------
+
+def _range_sums(path, pragmas, lo, hi):
+    """Pass 1: per-account net, unbalanced entry parts and lines without an entry."""
+    con = _connect(path, pragmas)
+    try:
+        net = dict(con.execute(
+            "SELECT account_id, sum(debit) - sum(kredit) FROM ledger_entries "
+            "WHERE id BETWEEN ? AND ? GROUP BY account_id", (lo, hi)))
+        # an entry cut by a range boundary shows up here from both sides; the
+        # parent adds the parts up
+        parts = dict(con.execute(
+            "SELECT entry_id, sum(debit) - sum(kredit) FROM ledger_entries "
+            "WHERE id BETWEEN ? AND ? AND entry_id IS NOT NULL "
+            "GROUP BY entry_id HAVING sum(debit) != sum(kredit)", (lo, hi)))
+        rows, orphans = con.execute(
+            "SELECT count(*), count(*) - count(entry_id) FROM ledger_entries "
+            "WHERE id BETWEEN ? AND ?", (lo, hi)).fetchone()
+    finally:
+        con.close()
+    return net, parts, rows, orphans
+
+
+def _replay_chain(path, pragmas, fix, diff_limit, lo, hi, opening):
+    """Pass 2: recompute saldo for ids lo..hi from ``opening``; rewrite if ``fix``."""
+    con = _connect(path, pragmas, FIX_BUSY_TIMEOUT if fix else None)
+    running  = dict(opening)
+    diff     = []
+    bad      = {}       # account_id -> [wrong rows, first wrong id]
+    fixes    = []
+    try:
+        for row_id, account_id, debit, kredit, saldo in con.execute(
+                "SELECT id, account_id, debit, kredit, saldo FROM ledger_entries "
+                "WHERE id BETWEEN ? AND ? ORDER BY id", (lo, hi)):
+            expected = running.get(account_id, 0) + debit - kredit
+            running[account_id] = expected
+            if saldo == expected:
+                continue
+            stats = bad.setdefault(account_id, [0, row_id])
+            stats[0] += 1
+            if len(diff) < diff_limit:
+                diff.append((row_id, account_id, saldo, expected))
+            if fix:
+                fixes.append((expected, row_id))
+
+        # written only after the scan: a read transaction of this connection
+        # could not be upgraded once another worker has committed
+        for i in range(0, len(fixes), FIX_BATCH):
+            con.executemany("UPDATE ledger_entries SET saldo = ? WHERE id = ?",
+                            fixes[i:i + FIX_BATCH])
+            con.commit()
+    finally:
+        con.close()
+    return bad, diff
+
+
+# ------------------------------------------------------------------------------
+# Driver (runs in the app context)
+# ------------------------------------------------------------------------------
+
+def _ranges(chunk_rows):
+    lo, hi = db.session.query(func.min(Ledger.id), func.max(Ledger.id)).one()
+    if lo is None:
+        return []
+    return [(start, min(start + chunk_rows - 1, hi)) for start in range(lo, hi + 1, chunk_rows)]
+
+
+def verify_ledger(workers=None, chunk_rows=VERIFY_CHUNK_ROWS, fix=False,
+                  diff_limit=DIFF_LIMIT, pragmas=None):
+    """Check every journal entry balances and every stored saldo matches the chain.
+
+    saldo is the account's running debit - kredit in id order, the order
+    post_ledger() assigns it in. Returns a JSON-ready report; with fix=True
+    wrong saldo values are rewritten and account_balances is rebuilt if it
+    disagrees with the ledger.
+    """
+    t0      = time.perf_counter()
+    path    = db.engine.url.database
+    pragmas = dict(pragmas or {})
+    pragmas.pop('busy_timeout', None)
+    ranges  = _ranges(chunk_rows)
+    los     = [lo for lo, _ in ranges]
+    his     = [hi for _, hi in ranges]
+    workers = min(workers or os.cpu_count() or 1, max(len(ranges), 1))
+    db.session.close()     # release our read snapshot before workers write
+
+    with ProcessPoolExecutor(max_workers=workers,
+                             mp_context=multiprocessing.get_context('spawn')) as pool:
+        sums = list(pool.map(partial(_range_sums, path, pragmas), los, his))
+
+        # balance each range starts from = net of every range before it
+        openings, total = [], {}
+        entry_parts, rows, orphans = {}, 0, 0
+        for net, parts, n, no_entry in sums:
+            openings.append(dict(total))
+            for account_id, value in net.items():
+                total[account_id] = total.get(account_id, 0) + value
+            for entry_id, value in parts.items():
+                entry_parts[entry_id] = entry_parts.get(entry_id, 0) + value
+            rows    += n
+            orphans += no_entry
+
+        chains = list(pool.map(partial(_replay_chain, path, pragmas, fix, diff_limit),
+                               los, his, openings))
+
+    unbalanced = sorted((e, v) for e, v in entry_parts.items() if v)
+    accounts, diff = {}, []
+    for bad, part in chains:
+        for account_id, (count, first_id) in bad.items():
+            stats = accounts.setdefault(account_id, [0, first_id])
+            stats[0] += count
+        diff += part[:max(0, diff_limit - len(diff))]
+
+    stored_balances = {b.account_id: b.saldo for b in AccountBalance.query}
+    balance_diff = [
+        {'account_name': account_name_of(account_id),
+         'stored':   str(stored_balances.get(account_id, Decimal('0.00'))),
+         'expected': _rupiah(total.get(account_id, 0))}
+        for account_id in sorted(set(total) | set(stored_balances))
+        if stored_balances.get(account_id, Decimal('0.00'))
+           != Decimal(total.get(account_id, 0)).scaleb(-2)
+    ]
+    if fix and balance_diff:
+        rebuild_account_balances()
+
+    return {
+        'rows':                rows,
+        'ranges':              len(ranges),
+        'workers':             workers,
+        'fixed':               fix,
+        'unbalanced_count':    len(unbalanced),
+        'unbalanced_entries':  [{'entry_id': e, 'selisih': _rupiah(v)}
+                                for e, v in unbalanced[:diff_limit]],
+        'lines_without_entry': orphans,
+        'saldo_mismatches':    sum(count for count, _ in accounts.values()),
+        'accounts': [{'account_name': account_name_of(account_id), 'mismatches': count,
+                      'first_bad_id': first_id}
+                     for account_id, (count, first_id) in sorted(accounts.items())],
+        'diff': [{'id': row_id, 'account_name': account_name_of(account_id),
+                  'stored': _rupiah(stored), 'expected': _rupiah(expected)}
+                 for row_id, account_id, stored, expected in diff],
+        'account_balances':    balance_diff,
+        'elapsed_s':           round(time.perf_counter() - t0, 3),
+    }
@@ -0,0 +1,350 @@
+# inventory.py
+#
+# Inventory costing. Every change of products.stock is written to
+# stock_movements, and cost_layers records what the stock on hand cost. A sale
+# is costed by taking units from its products' open layers, oldest first, so it
+# only touches the layers it uses up and never rescans purchase history.
+# COSTING_METHOD decides how receipts form layers:
+#
+#   fifo      one layer per receipt; issues take from the oldest layer first
+#   average   one open layer per product that every receipt merges into, so
+#             its value / remaining is the moving average cost
+#
+# revalue_inventory() rebuilds the layers from stock_movements, after a
+# change of method or a repair, and posts any HPP difference it finds.
+
+from collections import defaultdict, deque
+from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
+
+from flask import current_app
+from sqlalchemy import select, insert, update, delete, func, text, literal_column
+
+from models import (db, CENT, Product, StockMovement, CostLayer, SalesDaily, Ledger,
+                    JournalEntry, post_journal)
+
+COSTING_METHODS = ('fifo', 'average')
+REVALUE_CHUNK   = 20000
+
+ZERO = Decimal('0.00')
+
+INVENTORY_ACCOUNT  = 'Persediaan Barang'
+ADJUSTMENT_ACCOUNT = 'Selisih Persediaan'
+# source_type of an issue -> account its cost is charged to (default ADJUSTMENT_ACCOUNT)
+ISSUE_ACCOUNTS = {'transaction': 'Harga Pokok Penjualan'}
+
+# a literal 0, so SQLite can match the partial index ix_cost_layers_open
+_OPEN = CostLayer.remaining > literal_column('0')
+
+
+def costing_method():
+    method = current_app.config.get('COSTING_METHOD', 'fifo')
+    if method not in COSTING_METHODS:
+        raise ValueError(f"COSTING_METHOD harus salah satu dari {', '.join(COSTING_METHODS)}.")
+    return method
+
+
+def _unit_cost(value, quantity):
+    return (value / quantity).quantize(CENT, ROUND_HALF_UP) if quantity else ZERO
+
+
+def _take(layers, quantity):
+    """Take ``quantity`` units from ``layers`` (dicts, oldest first), in place.
+
+    Each layer gives up value * taken / remaining, and all of its value when
+    it is emptied, so no sen is lost to rounding. Returns (cost, units the
+    layers could not cover, unit cost of the last layer taken from).
+    """
+    cost, unit = ZERO, None
+    for layer in layers:
+        if not quantity:
+            break
+        remaining = layer['remaining']
+        if remaining <= 0:
+            continue
+        take = min(quantity, remaining)
+        part = (layer['value'] if take == remaining else
+                (layer['value'] * take / remaining).quantize(CENT, ROUND_HALF_UP))
+        layer['remaining'] -= take
+        layer['value']     -= part
+        cost     += part
+        quantity -= take
+        unit      = layer['unit_cost']
+    return cost, quantity, unit
+
+
+def _last_unit_cost(product_id):
+    # newest layer's cost; a product that never had one was bought at its price
+    unit = db.session.execute(
+        select(CostLayer.unit_cost).where(CostLayer.product_id == product_id)
+        .order_by(CostLayer.id.desc()).limit(1)).scalar()
+    if unit is None:
+        unit = db.session.execute(
+            select(Product.price).where(Product.id == product_id)).scalar()
+    return unit or ZERO
+
+
+def _open_layers(product_id, quantity):
+    """Open layers of a product, oldest first, until they cover ``quantity`` units."""
+    layers, covered = [], 0
+    result = db.session.execute(
+        select(CostLayer.id, CostLayer.remaining, CostLayer.value, CostLayer.unit_cost)
+        .where(CostLayer.product_id == product_id, _OPEN).order_by(CostLayer.id))
+    for row in result:
+        layers.append(row._asdict())
+        covered += row.remaining
+        if covered >= quantity:
+            break
+    result.close()
+    return layers
+
+
+# ------------------------------------------------------------------------------
+# Receipts and issues (run in the caller's transaction)
+# ------------------------------------------------------------------------------
+
+def receive_stock(receipts):
+    """Put stock in at cost.
+
+    ``receipts`` is a list of dicts with tanggal, product_id, quantity (> 0),
+    value (total cost) and source_type / source_id. Writes their
+    stock_movements rows and opens or tops up cost layers. products.stock is
+    the caller's to update.
+    """
+    receipts = [r for r in receipts if r['quantity'] > 0]
+    if not receipts:
+        return
+    method = costing_method()
+    ids = db.session.execute(
+        insert(StockMovement).returning(StockMovement.id, sort_by_parameter_order=True),
+        receipts).scalars().all()
+
+    new, pending = [], {}       # pending: product_id -> layer opened by this call (average)
+    for movement_id, r in zip(ids, receipts):
+        pid, qty, value = r['product_id'], r['quantity'], r['value']
+        if method == 'average':
+            layer = pending.get(pid)
+            if layer is None:
+                row = db.session.execute(
+                    select(CostLayer.id, CostLayer.quantity, CostLayer.remaining, CostLayer.value)
+                    .where(CostLayer.product_id == pid, _OPEN)).first()
+                if row is not None:
+                    remaining, total = row.remaining + qty, row.value + value
+                    db.session.execute(update(CostLayer), [{
+                        'id': row.id, 'quantity': row.quantity + qty, 'remaining': remaining,
+                        'value': total, 'unit_cost': _unit_cost(total, remaining)}])
+                    continue
+            else:
+                layer['quantity']  += qty
+                layer['remaining'] += qty
+                layer['value']     += value
+                layer['unit_cost']  = _unit_cost(layer['value'], layer['remaining'])
+                continue
+        layer = {'product_id': pid, 'movement_id': movement_id, 'tanggal': r['tanggal'],
+                 'quantity': qty, 'remaining': qty, 'value': value,
+                 'unit_cost': _unit_cost(value, qty)}
+        new.append(layer)
+        pending[pid] = layer
+    if new:
+        db.session.execute(insert(CostLayer), new)
+
+
+def issue_stock(issues):
+    """Take stock out at cost; returns the cost of each issue, in order.
+
+    ``issues`` is a list of dicts with tanggal, product_id, quantity (units
+    leaving, > 0) and source_type / source_id. Each issue reads and updates
+    only the layers it consumes. Units not covered by any layer (stock from
+    before costing) are costed at the product's last unit cost, or its price.
+    """
+    costs, movements = [], []
+    for issue in issues:
+        pid, qty = issue['product_id'], issue['quantity']
+        layers = _open_layers(pid, qty)
+        cost, short, unit = _take(layers, qty)
+        if short:
+            cost += short * (unit if unit is not None else _last_unit_cost(pid))
+        if layers:
+            db.session.execute(update(CostLayer), [
+                {'id': l['id'], 'remaining': l['remaining'], 'value': l['value']} for l in layers])
+        costs.append(cost)
+        movements.append(dict(issue, quantity=-qty, value=-cost))
+    if movements:
+        db.session.execute(insert(StockMovement), movements)
+    return costs
+
+
+def inventory_journal_entry(tanggal, keterangan, account, amount, source_type, source_id):
+    """Entry moving ``amount`` into Persediaan Barang from ``account``.
+
+    A positive amount debits Persediaan Barang (stock bought); a negative
+    one credits it and debits ``account`` (stock sold or written off).
+    """
+    debit, kredit = (amount, ZERO) if amount >= 0 else (ZERO, -amount)
+    return JournalEntry(
+        tanggal=tanggal, keterangan=keterangan,
+        source_type=source_type, source_id=source_id,
+        lines=[
+            Ledger(tanggal=tanggal, keterangan=keterangan, account_name=INVENTORY_ACCOUNT,
+                   debit=debit, kredit=kredit),
+            Ledger(tanggal=tanggal, keterangan=keterangan, account_name=account,
+                   debit=kredit, kredit=debit),
+        ])
+
+
+# ------------------------------------------------------------------------------
+# Rollups and reports
+# ------------------------------------------------------------------------------
+
+def refresh_sales_cost():
+    """Set sales_daily.cost from the sale issues in stock_movements."""
+    db.session.execute(update(SalesDaily).values(cost=0))
+    # raw integer sen on both sides, no Money conversion needed
+    rows = db.session.execute(text(
+        "SELECT date(tanggal), product_id, -sum(value) FROM stock_movements "
+        "WHERE source_type = 'transaction' GROUP BY 1, 2")).all()
+    if rows:
+        db.session.execute(
+            text("UPDATE sales_daily SET cost = :cost WHERE tanggal = :tanggal "
+                 "AND product_id = :product_id"),
+            [{'tanggal': d, 'product_id': pid, 'cost': cost} for d, pid, cost in rows])
+
+
+def product_margins(start, end, limit=None):
+    """Revenue, HPP and gross margin per product from the sales_daily rollup.
+
+    Sales made before costing existed have no HPP and count as full margin.
+    Largest margin first.
+    """
+    margin = func.sum(SalesDaily.revenue) - func.sum(SalesDaily.cost)
+    query = (db.session.query(SalesDaily.product_id, Product.name,
+                              func.sum(SalesDaily.quantity), func.sum(SalesDaily.revenue),
+                              func.sum(SalesDaily.cost))
+             .join(Product, Product.id == SalesDaily.product_id)
+             .filter(SalesDaily.tanggal.between(start, end))
+             .group_by(SalesDaily.product_id, Product.name)
+             .order_by(margin.desc()))
+    if limit:
+        query = query.limit(limit)
+    rows = []
+    for pid, name, qty, revenue, cost in query:
+        rows.append({
+            'product_id': pid, 'name': name, 'quantity': qty,
+            'revenue': str(revenue), 'hpp': str(cost), 'margin': str(revenue - cost),
+            'margin_pct': round(float((revenue - cost) / revenue * 100), 2) if revenue else None,
+        })
+    return rows
+
+
+# ------------------------------------------------------------------------------
+# Revaluation
+# ------------------------------------------------------------------------------
+
+def _moved_quantity():
+    return (select(func.coalesce(func.sum(StockMovement.quantity), 0))
+            .where(StockMovement.product_id == Product.id).scalar_subquery())
+
+
+def _seed_opening_stock(tanggal):
+    # stock that stock_movements does not account for predates costing; it
+    # enters at the product's price, the cost ProductView posted its purchase at
+    moved    = _moved_quantity()
+    products = db.session.execute(
+        select(Product.id, Product.stock - moved, Product.price).where(Product.stock > moved)
+    ).all()
+    if products:
+        db.session.execute(insert(StockMovement), [
+            {'tanggal': tanggal, 'product_id': pid, 'quantity': qty, 'value': price * qty,
+             'source_type': 'stok_awal', 'source_id': pid}
+            for pid, qty, price in products])
+    return len(products)
+
+
+def revalue_inventory(method=None, tanggal=None):
+    """Rebuild cost_layers by replaying stock_movements in id order.
+
+    Stock not accounted for by movements gets a 'stok_awal' receipt at the
+    product's price, replayed before the product's other movements. Issues
+    are costed again under ``method`` (default COSTING_METHOD): changed
+    movement values are rewritten, sales_daily.cost is refreshed and the
+    total difference is posted against Persediaan Barang. Commits; returns a
+    report dict.
+    """
+    method  = method or costing_method()
+    tanggal = tanggal or datetime.utcnow()
+    if method not in COSTING_METHODS:
+        raise ValueError(f"Metode harus salah satu dari {', '.join(COSTING_METHODS)}.")
+
+    seeded = _seed_opening_stock(tanggal)
+    db.session.execute(delete(CostLayer))
+
+    layers, changed = [], []
+    delta   = defaultdict(lambda: ZERO)    # source_type -> extra cost of its issues
+    current = held = last_unit = None      # product being replayed, its open layers
+    count   = 0
+    result  = db.session.execute(
+        select(StockMovement.id, StockMovement.product_id, StockMovement.tanggal,
+               StockMovement.quantity, StockMovement.value, StockMovement.source_type)
+        .order_by(StockMovement.product_id, (StockMovement.source_type == 'stok_awal').desc(),
+                  StockMovement.id)
+        .execution_options(yield_per=REVALUE_CHUNK))
+    for movement_id, pid, moved_at, qty, value, source_type in result:
+        count += 1
+        if pid != current:
+            current, held, last_unit = pid, deque(), None
+        if qty > 0:
+            if method == 'average' and held:
+                layer = held[0]
+                layer['quantity']  += qty
+                layer['remaining'] += qty
+                layer['value']     += value
+                layer['unit_cost']  = _unit_cost(layer['value'], layer['remaining'])
+            else:
+                layer = {'product_id': pid, 'movement_id': movement_id, 'tanggal': moved_at,
+                         'quantity': qty, 'remaining': qty, 'value': value,
+                         'unit_cost': _unit_cost(value, qty)}
+                held.append(layer)
+                layers.append(layer)
+            last_unit = layer['unit_cost']
+        elif qty < 0:
+            cost, short, unit = _take(held, -qty)
+            if short:
+                if unit is None:
+                    unit = last_unit if last_unit is not None else _last_unit_cost(pid)
+                cost += short * unit
+            while held and held[0]['remaining'] <= 0:
+                held.popleft()
+            if cost != -value:
+                changed.append({'id': movement_id, 'value': -cost})
+                delta[source_type] += cost + value
+
+    for i in range(0, len(layers), REVALUE_CHUNK):
+        db.session.execute(insert(CostLayer), layers[i:i + REVALUE_CHUNK])
+    for i in range(0, len(changed), REVALUE_CHUNK):
+        db.session.execute(update(StockMovement), changed[i:i + REVALUE_CHUNK])
+    refresh_sales_cost()
+
+    entries = [
+        inventory_journal_entry(tanggal, f"Revaluasi persediaan ({method})",
+                                ISSUE_ACCOUNTS.get(source_type, ADJUSTMENT_ACCOUNT), -amount,
+                                'revaluation', None)
+        for source_type, amount in sorted(delta.items(), key=lambda d: str(d[0])) if amount
+    ]
+    post_journal(*entries)
+
+    drift = db.session.execute(
+        select(func.count()).select_from(Product).where(Product.stock != _moved_quantity())
+    ).scalar()
+    db.session.commit()
+
+    return {
+        'method':           method,
+        'seeded_products':  seeded,
+        'movements':        count,
+        'layers':           len(layers),
+        'open_layers':      sum(1 for l in layers if l['remaining'] > 0),
+        'inventory_value':  str(sum((l['value'] for l in layers), ZERO)),
+        'recosted':         len(changed),
+        'hpp_difference':   {str(k): str(v) for k, v in delta.items() if v},
+        'stock_mismatches': drift,
+    }
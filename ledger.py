@@ -0,0 +1,257 @@
+# ledger.py
+
+import threading
+import time
+from datetime import datetime, date, timedelta
+from decimal import Decimal
+from sqlalchemy import func, tuple_
+
+from sqlalchemy.orm import selectinload
+
+from models import (db, Ledger, AccountBalance, TrialBalanceCheckpoint, PeriodClose,
+                    JournalEntry, post_journal, last_closed_date, account_id_of,
+                    account_name_of)
+
+LEDGER_PAGE_SIZE = 50
+COUNT_CACHE_TTL  = 300      # seconds an approximate total may be reused
+
+_count_cache = {}
+_count_lock  = threading.Lock()
+
+
+# ------------------------------------------------------------------------------
+# Keyset (seek) pagination on (tanggal, id), newest first
+# ------------------------------------------------------------------------------
+
+def encode_cursor(row):
+    return f"{row.tanggal.isoformat()}_{row.id}"
+
+
+def decode_cursor(cursor):
+    """(tanggal, id) of an encode_cursor() value; ValueError if it is not one."""
+    tanggal, _, row_id = cursor.rpartition('_')
+    tanggal, row_id = datetime.fromisoformat(tanggal), int(row_id)
+    if not 0 < row_id < 2 ** 63:        # SQLite INTEGER range
+        raise ValueError(f"Cursor tidak valid: {cursor!r}")
+    return tanggal, row_id
+
+
+def ledger_page(account_name=None, after=None, before=None, limit=LEDGER_PAGE_SIZE):
+    """One page of ledger rows, seeking from a cursor instead of an OFFSET.
+
+    ``after`` moves to older rows, ``before`` to newer ones. Every page is a
+    single index range scan, so page 5,000 costs the same as page 1.
+    Returns (rows, prev_cursor, next_cursor); a cursor is None at either end.
+    """
+    key = tuple_(Ledger.tanggal, Ledger.id)
+    q = db.session.query(Ledger)
+    if account_name:
+        q = q.filter(Ledger.account_id == account_id_of(account_name, create=False))
+
+    if before:
+        q = q.filter(key > decode_cursor(before)) \
+             .order_by(Ledger.tanggal.asc(), Ledger.id.asc())
+    else:
+        if after:
+            q = q.filter(key < decode_cursor(after))
+        q = q.order_by(Ledger.tanggal.desc(), Ledger.id.desc())
+
+    rows = q.limit(limit + 1).all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+
+    if before:
+        rows.reverse()
+        has_prev, has_next = more, True
+    else:
+        has_prev, has_next = bool(after), more
+
+    if not rows:
+        return rows, None, None
+    return (rows,
+            encode_cursor(rows[0]) if has_prev else None,
+            encode_cursor(rows[-1]) if has_next else None)
+
+
+def ledger_count(account_name=None, max_age=COUNT_CACHE_TTL):
+    """Row count for the ledger listing, cached for ``max_age`` seconds."""
+    now = time.monotonic()
+    with _count_lock:
+        hit = _count_cache.get(account_name)
+    if hit and now - hit[0] < max_age:
+        return hit[1]
+
+    q = db.session.query(func.count(Ledger.id))
+    if account_name:
+        q = q.filter(Ledger.account_id == account_id_of(account_name, create=False))
+    total = q.scalar()
+    with _count_lock:
+        _count_cache[account_name] = (now, total)
+    return total
+
+
+# ------------------------------------------------------------------------------
+# Trial balance (neraca saldo) from account totals and checkpoints
+# ------------------------------------------------------------------------------
+
+def _day_after(as_of):
+    return datetime.combine(as_of + timedelta(days=1), datetime.min.time())
+
+
+def _ledger_sums(start=None, end=None):
+    """{account_id: [debit, kredit]} for ledger rows with start <= tanggal < end."""
+    q = db.session.query(Ledger.account_id,
+                         func.sum(Ledger.debit), func.sum(Ledger.kredit))
+    if start is not None:
+        q = q.filter(Ledger.tanggal >= start)
+    if end is not None:
+        q = q.filter(Ledger.tanggal < end)
+    return {account_id: [d or Decimal('0.00'), k or Decimal('0.00')]
+            for account_id, d, k in q.group_by(Ledger.account_id)}
+
+
+def _account_totals(as_of):
+    """{account_id: [debit_total, kredit_total]} of every row dated <= as_of.
+
+    Starts from the nearest checkpoint on or before as_of and adds the rows
+    after it; without one, starts from the live account_balances totals and
+    subtracts the rows after as_of. Either way only a date range is scanned.
+    While account_balances is unseeded the rows through as_of are summed.
+    """
+    cp_date = (db.session.query(func.max(TrialBalanceCheckpoint.as_of))
+               .filter(TrialBalanceCheckpoint.as_of <= as_of).scalar())
+
+    if cp_date is not None:
+        totals = {c.account_id: [c.debit_total, c.kredit_total]
+                  for c in TrialBalanceCheckpoint.query.filter_by(as_of=cp_date)}
+        sign, delta = 1, _ledger_sums(_day_after(cp_date), _day_after(as_of))
+    else:
+        totals = {b.account_id: [b.debit_total, b.kredit_total]
+                  for b in AccountBalance.query}
+        if totals or not db.session.query(Ledger.id).first():
+            sign, delta = -1, _ledger_sums(start=_day_after(as_of))
+        else:
+            # account_balances not seeded yet (see app.backfill_derived_tables)
+            sign, delta = 1, _ledger_sums(end=_day_after(as_of))
+
+    for account_id, (d, k) in delta.items():
+        cur = totals.setdefault(account_id, [Decimal('0.00'), Decimal('0.00')])
+        cur[0] += sign * d
+        cur[1] += sign * k
+    return totals
+
+
+def trial_balance(as_of=None):
+    """Neraca saldo as of a date (inclusive), one row per account.
+
+    Each account's net balance is shown on its debit or credit side, and the
+    two sides total equal whenever every posting balances.
+    """
+    as_of  = as_of or date.today()
+    totals = {account_name_of(i): t for i, t in _account_totals(as_of).items()}
+    rows   = []
+    for name, (d, k) in sorted(totals.items()):
+        if not d and not k:
+            continue
+        net = d - k
+        rows.append({
+            'account_name': name,
+            'debit_total':  d,
+            'kredit_total': k,
+            'debit':        net if net > 0 else Decimal('0.00'),
+            'kredit':       -net if net < 0 else Decimal('0.00'),
+        })
+    return rows
+
+
+def _write_checkpoint(as_of):
+    totals = _account_totals(as_of)
+    TrialBalanceCheckpoint.query.filter_by(as_of=as_of).delete()
+    db.session.add_all(
+        TrialBalanceCheckpoint(as_of=as_of, account_id=account_id,
+                               debit_total=d, kredit_total=k)
+        for account_id, (d, k) in totals.items()
+    )
+    return len(totals)
+
+
+def checkpoint_trial_balance(as_of):
+    """Store cumulative per-account totals up to as_of (replacing any existing)."""
+    n = _write_checkpoint(as_of)
+    db.session.commit()
+    return n
+
+
+# ------------------------------------------------------------------------------
+# Period closing
+# ------------------------------------------------------------------------------
+
+def open_period_start():
+    """First instant of the open period, or None if nothing was ever closed."""
+    closed = last_closed_date()
+    return _day_after(closed) if closed else None
+
+
+def close_period(through):
+    """Close the books up to and including ``through``.
+
+    Writes the closing snapshot (a trial-balance checkpoint at ``through``),
+    flags the period's ledger rows as closed and records the close. After
+    this, post_ledger() refuses rows dated inside the closed period, so the
+    snapshot never changes and reports only scan rows after it.
+    """
+    closed = last_closed_date()
+    if closed and through <= closed:
+        raise ValueError(f"Periode sampai {closed} sudah ditutup.")
+
+    _write_checkpoint(through)
+    res = db.session.execute(
+        Ledger.__table__.update()
+        .where(Ledger.tanggal < _day_after(through),
+               Ledger.closed.is_(False))
+        .values(closed=True)
+    )
+    pc = PeriodClose(closed_through=through, row_count=res.rowcount)
+    db.session.add(pc)
+    db.session.commit()
+    return pc
+
+
+# ------------------------------------------------------------------------------
+# Journal entries: drill-down and reversal
+# ------------------------------------------------------------------------------
+
+def journal_for_source(source_type, source_id):
+    """Entries (with lines) posted for one source row, reversals included."""
+    return (JournalEntry.query
+            .options(selectinload(JournalEntry.lines))
+            .filter_by(source_type=source_type, source_id=source_id)
+            .order_by(JournalEntry.id)
+            .all())
+
+
+def reverse_journal(entry_id, tanggal=None):
+    """Post the mirror image of entry ``entry_id`` (debit and kredit swapped).
+
+    The reversal keeps the original's source reference and points back to it
+    with reversal_of; an entry can be reversed once and a reversal not at all.
+    The caller commits.
+    """
+    entry = db.session.get(JournalEntry, entry_id)
+    if entry is None:
+        raise ValueError(f"Jurnal #{entry_id} tidak ditemukan.")
+    if entry.reversal_of is not None:
+        raise ValueError(f"Jurnal #{entry_id} adalah pembalik dan tidak dapat dibalik.")
+    if db.session.query(JournalEntry.id).filter_by(reversal_of=entry_id).first():
+        raise ValueError(f"Jurnal #{entry_id} sudah dibalik.")
+
+    tanggal = tanggal or datetime.utcnow()
+    ket     = f"Pembalikan #{entry.id}: {entry.keterangan}"[:255]
+    reversal = JournalEntry(
+        tanggal=tanggal, keterangan=ket, reversal_of=entry.id,
+        source_type=entry.source_type, source_id=entry.source_id,
+        lines=[Ledger(tanggal=tanggal, keterangan=ket, account_id=line.account_id,
+                      debit=line.kredit, kredit=line.debit)
+               for line in entry.lines])
+    post_journal(reversal)
+    return reversal
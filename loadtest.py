@@ -0,0 +1,99 @@
+# loadtest.py
+#
+# Concurrent sale-posting harness. Runs against a throw-away database:
+#
+#   python loadtest.py --workers 8 --sales 400
+#   python loadtest.py --workers 8 --sales 400 --profile default   # stock SQLite settings
+#
+# and prints throughput, latency and how many postings hit 'database is locked'.
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description='Post sales concurrently and report lock errors.')
+    p.add_argument('--workers',  type=int, default=8,   help='concurrent threads')
+    p.add_argument('--sales',    type=int, default=400, help='total sales to post')
+    p.add_argument('--items',    type=int, default=3,   help='items per sale')
+    p.add_argument('--products', type=int, default=50,  help='products to seed')
+    p.add_argument('--profile',  choices=['wal', 'default'], default='wal',
+                   help="'wal' = Config.SQLITE_PRAGMAS, 'default' = stock SQLite")
+    p.add_argument('--db', help='database file (default: a new temp file)')
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix='pos-loadtest-'), 'loadtest.db')
+    # the engine is built when app is imported, so configure it first
+    os.environ['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + db_path
+    os.environ['SQLITE_PROFILE'] = args.profile
+    os.environ.setdefault('DB_POOL_SIZE', str(args.workers))
+
+    from sqlalchemy.exc import OperationalError
+    from app import app
+    from models import db, Product, ensure_indexes, ensure_ledger_merged, ensure_accounts
+    from sales import post_sales_batch
+
+    with app.app_context():
+        db.create_all()
+        ensure_indexes()
+        ensure_ledger_merged()
+        ensure_accounts()
+        db.session.add_all(Product(name=f'Produk {i}', price=1000 + i, stock=10**9, satuan='pcs')
+                           for i in range(args.products))
+        db.session.commit()
+
+    lock = threading.Lock()
+    stats = {'ok': 0, 'rejected': 0, 'locked': 0, 'other_errors': 0}
+    latencies = []
+
+    def worker(n_sales, seed):
+        with app.app_context():
+            for i in range(n_sales):
+                sale = {'items': [{'product_id': (seed * 7 + i * 3 + k) % args.products + 1,
+                                   'quantity': 1} for k in range(args.items)]}
+                t0 = time.perf_counter()
+                try:
+                    outcome = 'ok' if post_sales_batch([sale])[0]['status'] == 'ok' else 'rejected'
+                except OperationalError as e:
+                    db.session.rollback()
+                    outcome = 'locked' if 'database is locked' in str(e) else 'other_errors'
+                dt = time.perf_counter() - t0
+                with lock:
+                    stats[outcome] += 1
+                    latencies.append(dt)
+            db.session.remove()
+
+    per_worker = [args.sales // args.workers + (w < args.sales % args.workers)
+                  for w in range(args.workers)]
+    threads = [threading.Thread(target=worker, args=(n, w)) for w, n in enumerate(per_worker)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+
+    latencies.sort()
+    pct = lambda q: round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000, 2)
+    report = {
+        'profile': args.profile, 'workers': args.workers, 'sales': args.sales,
+        'elapsed_s': round(elapsed, 3),
+        'sales_per_s': round(stats['ok'] / elapsed, 1) if elapsed else None,
+        'latency_ms': {'p50': pct(0.50), 'p95': pct(0.95), 'max': pct(1.0)} if latencies else {},
+        **stats,
+        'database': db_path,
+    }
+    print(json.dumps(report, indent=2))
+    return 0 if stats['locked'] == 0 and stats['other_errors'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
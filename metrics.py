@@ -0,0 +1,137 @@
+# metrics.py
+#
+# Per-request SQL instrumentation: query count, DB time and latency per Flask
+# endpoint, a slow-query log and an N+1 warning, aggregated into histograms
+# served as Prometheus text on /metrics.
+
+import logging
+import threading
+import time
+from collections import Counter
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+slow_log     = logging.getLogger('pos.sql.slow')
+nplusone_log = logging.getLogger('pos.sql.nplusone')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS   = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by endpoint (Prometheus semantics)."""
+
+    def __init__(self, name, help_text, buckets):
+        self.name, self.help, self.buckets = name, help_text, buckets
+        self.series = {}        # endpoint -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, endpoint, value):
+        s = self.series.get(endpoint)
+        if s is None:
+            s = self.series[endpoint] = [0] * (len(self.buckets) + 2)
+        for i, le in enumerate(self.buckets):
+            if value <= le:
+                s[i] += 1
+        s[-2] += 1
+        s[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for endpoint, s in sorted(self.series.items()):
+            for le, n in zip(self.buckets, s):
+                lines.append(f'{self.name}_bucket{{endpoint="{endpoint}",le="{le}"}} {n}')
+            lines.append(f'{self.name}_bucket{{endpoint="{endpoint}",le="+Inf"}} {s[-2]}')
+            lines.append(f'{self.name}_count{{endpoint="{endpoint}"}} {s[-2]}')
+            lines.append(f'{self.name}_sum{{endpoint="{endpoint}"}} {s[-1]:.6f}')
+        return lines
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = Histogram('pos_request_seconds', 'Request latency per endpoint.',
+                                 LATENCY_BUCKETS)
+        self.db_time = Histogram('pos_request_db_seconds', 'Time spent in SQL per request.',
+                                 LATENCY_BUCKETS)
+        self.queries = Histogram('pos_request_queries', 'SQL statements per request.',
+                                 QUERY_BUCKETS)
+        self.slow     = Counter()       # endpoint -> slow statements
+        self.nplusone = Counter()       # endpoint -> requests with a repeated statement
+
+    def record(self, endpoint, latency, db_time, queries, slow, repeated):
+        with self.lock:
+            self.latency.observe(endpoint, latency)
+            self.db_time.observe(endpoint, db_time)
+            self.queries.observe(endpoint, queries)
+            if slow:
+                self.slow[endpoint] += slow
+            if repeated:
+                self.nplusone[endpoint] += 1
+
+    def render(self):
+        with self.lock:
+            lines = self.latency.render() + self.db_time.render() + self.queries.render()
+            for name, help_text, counter in (
+                    ('pos_slow_queries_total', 'Statements over SLOW_QUERY_MS.', self.slow),
+                    ('pos_nplusone_requests_total',
+                     'Requests that ran one statement more than NPLUSONE_THRESHOLD times.',
+                     self.nplusone)):
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+                lines += [f'{name}{{endpoint="{e}"}} {n}' for e, n in sorted(counter.items())]
+        return '\n'.join(lines) + '\n'
+
+
+metrics = RequestMetrics()
+
+
+def install_sql_metrics(engine, slow_ms=200, slow_log_file=None):
+    """Time every statement on ``engine``; add it to the current request, log slow ones."""
+    slow_s = slow_ms / 1000.0
+    if slow_log_file and not slow_log.handlers:
+        handler = logging.FileHandler(slow_log_file)
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        slow_log.addHandler(handler)
+        slow_log.setLevel(logging.INFO)
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        dt = time.perf_counter() - conn.info['query_start'].pop()
+        stats = g.get('sql_stats') if has_request_context() else None
+        if stats is not None:
+            stats['queries'] += 1
+            stats['db_time'] += dt
+            stats['statements'][statement] += 1
+        if dt >= slow_s:
+            if stats is not None:
+                stats['slow'] += 1
+            slow_log.warning("%.1f ms [%s] %s | %.200r", dt * 1000,
+                             request.endpoint if has_request_context() else '-',
+                             ' '.join(statement.split()), parameters)
+
+
+def init_request_metrics(app):
+    """Collect per-request SQL stats and latency into ``metrics``."""
+    threshold = app.config.get('NPLUSONE_THRESHOLD', 20)
+
+    @app.before_request
+    def _start_request_metrics():
+        g.request_start = time.perf_counter()
+        g.sql_stats = {'queries': 0, 'db_time': 0.0, 'slow': 0, 'statements': Counter()}
+
+    @app.teardown_request
+    def _finish_request_metrics(_exc):
+        stats = g.pop('sql_stats', None)
+        if stats is None or request.endpoint in (None, 'metrics_endpoint', 'static'):
+            return
+        endpoint = request.endpoint
+        repeated = [(s, n) for s, n in stats['statements'].items() if n > threshold]
+        for statement, n in repeated:
+            nplusone_log.warning("%s ran %dx in one request: %s", endpoint, n,
+                                 ' '.join(statement.split())[:300])
+        metrics.record(endpoint, time.perf_counter() - g.request_start,
+                       stats['db_time'], stats['queries'], stats['slow'], bool(repeated))
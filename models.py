@@ -1,13 +1,56 @@
 # models.py
 
-from sqlalchemy import func
-from sqlalchemy.orm import relationship
-from sqlalchemy import func, Column, Integer, String, Date, DateTime, Numeric, ForeignKey
+from sqlalchemy import func, event
+from sqlalchemy.orm import relationship, declared_attr, Session
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy import (func, text, select, insert, literal, Column, Integer, String, Date,
+                        DateTime, Boolean, ForeignKey, Index)
+from sqlalchemy.schema import CreateColumn, CreateTable
+from sqlalchemy.types import TypeDecorator
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
 
 db = SQLAlchemy()
 
+CENT = Decimal('0.01')
+
+
+class Money(TypeDecorator):
+    """Rupiah amount stored as integer sen, read back as a 2-place Decimal.
+
+    SQL only ever sees integers, so SUM() and +/- in queries are exact and
+    an aggregate is converted to Decimal once per result row, not per input
+    row. Python code keeps working with Decimal as it did with Numeric(18, 2).
+    """
+    impl     = Integer
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        value = Decimal(str(value)) if isinstance(value, float) else Decimal(value)
+        return int(value.quantize(CENT, rounding=ROUND_HALF_UP).scaleb(2))
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return Decimal(int(value)).scaleb(-2)
+
+
+def install_sqlite_pragmas(engine, pragmas):
+    """Run PRAGMA statements on every new connection of a SQLite engine."""
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def _set_pragmas(dbapi_conn, _record):
+        cur = dbapi_conn.cursor()
+        for name, value in pragmas.items():
+            cur.execute(f"PRAGMA {name}={value}")
+        cur.close()
+
 
 class User(db.Model):
     __tablename__ = 'users'
@@ -28,12 +71,146 @@ class User(db.Model):
         return f"<User {self.username}>"
 
 
+class Account(db.Model):
+    __tablename__ = 'accounts'
+
+    # chart of accounts; other tables reference accounts by integer id
+    id       = Column(Integer, primary_key=True)
+    name     = Column(String(100), nullable=False, unique=True)
+    kategori = Column(String(20))      # one of ACCOUNT_CATEGORIES, for reports
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        return f"<Account {self.id} {self.name}>"
+
+
+# classification used by the financial statements (reports.py)
+ACCOUNT_CATEGORIES = [
+    ('aset',       'Aset'),
+    ('kewajiban',  'Kewajiban'),
+    ('modal',      'Modal'),
+    ('pendapatan', 'Pendapatan'),
+    ('beban',      'Beban'),
+]
+
+DEFAULT_ACCOUNTS = {
+    'Kas Tunai':             'aset',
+    'Penjualan':             'pendapatan',
+    'Persediaan Barang':     'aset',
+    'Utang Usaha':           'kewajiban',
+    'Modal Awal':            'modal',
+    'Saldo Penyesuaian':     'modal',
+    'Biaya Perlengkapan':    'beban',
+    'Pendapatan Lain':       'pendapatan',
+    'Harga Pokok Penjualan': 'beban',
+    'Selisih Persediaan':    'beban',
+}
+
+# process-local {id: name} / {name: id}; reloaded after edits and on a miss
+_account_cache = None
+
+
+def _account_maps():
+    global _account_cache
+    if _account_cache is None:
+        with db.session.no_autoflush:
+            rows = db.session.execute(select(Account.id, Account.name)).all()
+        _account_cache = ({i: n for i, n in rows}, {n: i for i, n in rows})
+    return _account_cache
+
+
+def invalidate_accounts():
+    global _account_cache
+    _account_cache = None
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _forget_rolled_back_accounts(session, previous_transaction):
+    # an account created in a rolled-back transaction must not stay cached
+    if session.info.pop('accounts_created', False):
+        invalidate_accounts()
+
+
+@event.listens_for(Session, 'after_commit')
+def _keep_committed_accounts(session):
+    session.info.pop('accounts_created', None)
+
+
+def account_name_of(account_id):
+    if account_id is None:
+        return None
+    if account_id not in _account_maps()[0]:
+        invalidate_accounts()
+    return _account_maps()[0].get(account_id)
+
+
+def account_id_of(name, create=True):
+    """Id of an account by name; unknown names are registered when create=True."""
+    if not name:
+        return None
+    if name not in _account_maps()[1]:
+        invalidate_accounts()
+    if name not in _account_maps()[1] and create:
+        db.session.execute(sqlite_insert(Account.__table__)
+                           .values(name=name).on_conflict_do_nothing())
+        db.session.info['accounts_created'] = True
+        invalidate_accounts()
+    return _account_maps()[1].get(name)
+
+
+def account_names():
+    return sorted(_account_maps()[1])
+
+
+def account_choices():
+    """[(id, name), ...] sorted by name, for dropdowns and filters."""
+    return sorted(_account_maps()[0].items(), key=lambda c: c[1])
+
+
+def ensure_accounts():
+    """Register DEFAULT_ACCOUNTS and classify those that have no kategori yet."""
+    stmt = sqlite_insert(Account.__table__).values(
+        [{'name': n, 'kategori': k} for n, k in DEFAULT_ACCOUNTS.items()])
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=[Account.name],
+        set_={'kategori': func.coalesce(Account.kategori, stmt.excluded.kategori)}))
+    db.session.commit()
+    invalidate_accounts()
+
+
+class AccountRefMixin:
+    """account_id column plus an account_name that maps through the cache."""
+
+    @declared_attr
+    def account_id(cls):
+        return Column(Integer, ForeignKey('accounts.id'), nullable=False)
+
+    @hybrid_property
+    def account_name(self):
+        return account_name_of(self.account_id)
+
+    @account_name.setter
+    def account_name(self, name):
+        self.account_id = account_id_of(name)
+
+    @account_name.expression
+    def account_name(cls):
+        return (select(Account.name).where(Account.id == cls.account_id)
+                .scalar_subquery())
+
+
 class Product(db.Model):
     __tablename__ = 'products'
+    __table_args__ = (
+        Index('ux_products_sku', 'sku', unique=True),
+    )
 
     id     = Column(Integer, primary_key=True)
     name   = Column(String(100), nullable=False)
-    price  = Column(Numeric(18, 2), nullable=False)    # use fixed‐point
+    sku    = Column(String(64))               # SKU or barcode, NULL when not labelled
+    price  = Column(Money, nullable=False)    # integer sen, see Money
     stock  = Column(Integer, default=0, nullable=False)
     satuan = Column(String(20))
 
@@ -43,11 +220,14 @@ class Product(db.Model):
 
 class Transaction(db.Model):
     __tablename__ = 'transactions'
+    __table_args__ = (
+        Index('ix_transactions_date', 'date'),
+    )
 
     id    = Column(Integer, primary_key=True)
     date  = Column(DateTime, nullable=False, default=datetime.utcnow,
                    server_default=func.now())
-    total = Column(Numeric(18, 2), nullable=False, default=0)
+    total = Column(Money, nullable=False, default=0)
 
     items = relationship(
         'TransactionItem',
@@ -61,12 +241,16 @@ class Transaction(db.Model):
 
 class TransactionItem(db.Model):
     __tablename__ = 'transaction_items'
+    __table_args__ = (
+        Index('ix_transaction_items_transaction_id', 'transaction_id'),
+        Index('ix_transaction_items_product_id', 'product_id'),
+    )
 
     id             = Column(Integer, primary_key=True)
     transaction_id = Column(Integer, ForeignKey('transactions.id'), nullable=False)
     product_id     = Column(Integer, ForeignKey('products.id'), nullable=False)
     quantity       = Column(Integer, nullable=False)
-    subtotal       = Column(Numeric(18, 2), nullable=False)
+    subtotal       = Column(Money, nullable=False)
 
     transaction = relationship('Transaction', back_populates='items')
     product     = relationship('Product')
@@ -75,23 +259,209 @@ class TransactionItem(db.Model):
         return f"<Item {self.product.name} x{self.quantity} = {self.subtotal}>"
 
 
-class Ledger(db.Model):
+class SalesDaily(db.Model):
+    __tablename__ = 'sales_daily'
+
+    # per-day, per-product rollup of transaction_items, upserted in the same
+    # commit as each sale (see sales.record_daily_sales)
+    tanggal    = Column(Date, primary_key=True)
+    product_id = Column(Integer, ForeignKey('products.id'), primary_key=True)
+    quantity   = Column(Integer, default=0, nullable=False)
+    revenue    = Column(Money, default=0, nullable=False)
+    cost       = Column(Money, default=0, nullable=False, server_default='0')   # HPP
+    txn_count  = Column(Integer, default=0, nullable=False)
+
+    product = relationship('Product')
+
+    def __repr__(self):
+        return (f"<SalesDaily {self.tanggal} #{self.product_id} "
+                f"x{self.quantity} = {self.revenue} ({self.txn_count} trx)>")
+
+
+# JournalEntry / StockMovement source_type values: what business row it was posted for
+SOURCE_TYPES = ('transaction', 'product', 'opening', 'neraca_saldo', 'jurnal',
+                'revaluation', 'stok_awal')
+
+
+class JournalEntry(db.Model):
+    __tablename__  = 'journal_entries'
+    __table_args__ = (
+        # drill-down from a sale / product / opening balance to its postings
+        Index('ix_journal_entries_source', 'source_type', 'source_id'),
+    )
+
+    # one balanced posting; its lines are the ledger_entries rows with this entry_id
+    id          = Column(Integer, primary_key=True)
+    tanggal     = Column(DateTime, nullable=False, default=datetime.utcnow)
+    keterangan  = Column(String(255), nullable=False)
+    source_type = Column(String(20))        # see SOURCE_TYPES
+    source_id   = Column(Integer)           # id in the source table
+    reversal_of = Column(Integer, ForeignKey('journal_entries.id'), unique=True)
+
+    lines = relationship('Ledger', back_populates='entry', order_by='Ledger.id')
+
+    def __repr__(self):
+        return f"<JournalEntry #{self.id} {self.keterangan} ({self.source_type} {self.source_id})>"
+
+
+class Ledger(AccountRefMixin, db.Model):
     __tablename__ = 'ledger_entries'
+    __table_args__ = (
+        # LedgerView: filter by account, newest first
+        Index('ix_ledger_account_tanggal', 'account_id', 'tanggal'),
+        Index('ix_ledger_tanggal', 'tanggal'),
+        Index('ix_ledger_entry', 'entry_id'),
+    )
 
     id           = Column(Integer, primary_key=True)
     tanggal      = Column(DateTime, nullable=False, default=datetime.utcnow,
                           server_default=func.now())
     keterangan   = Column(String(255), nullable=False)
-    account_name = Column(String(100), nullable=False)
-    debit        = Column(Numeric(18, 2), default=0, nullable=False)
-    kredit       = Column(Numeric(18, 2), default=0, nullable=False)
-    saldo        = Column(Numeric(18, 2), default=0, nullable=False)
+    debit        = Column(Money, default=0, nullable=False)
+    kredit       = Column(Money, default=0, nullable=False)
+    saldo        = Column(Money, default=0, nullable=False)
+    closed       = Column(Boolean, default=False, nullable=False,
+                          server_default='0')    # set by close_period()
+    entry_id     = Column(Integer, ForeignKey('journal_entries.id'))
+
+    entry = relationship('JournalEntry', back_populates='lines')
 
     def __repr__(self):
         return (f"<Ledger {self.tanggal:%Y-%m-%d %H:%M} | "
                 f"{self.account_name} D:{self.debit} K:{self.kredit} S:{self.saldo}>")
 
 
+class AccountBalance(db.Model):
+    __tablename__ = 'account_balances'
+
+    # one row per account, advanced in the same transaction as each posting
+    account_id   = Column(Integer, ForeignKey('accounts.id'), primary_key=True)
+    debit_total  = Column(Money, default=0, nullable=False, server_default='0')
+    kredit_total = Column(Money, default=0, nullable=False, server_default='0')
+    saldo        = Column(Money, default=0, nullable=False)
+    updated_at   = Column(DateTime, nullable=False, default=datetime.utcnow,
+                          onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return (f"<AccountBalance {account_name_of(self.account_id)} | "
+                f"D:{self.debit_total} K:{self.kredit_total} S:{self.saldo}>")
+
+
+class TrialBalanceCheckpoint(db.Model):
+    __tablename__ = 'trial_balance_checkpoints'
+
+    # cumulative totals of every ledger row dated on or before as_of
+    as_of        = Column(Date, primary_key=True)
+    account_id   = Column(Integer, ForeignKey('accounts.id'), primary_key=True)
+    debit_total  = Column(Money, default=0, nullable=False)
+    kredit_total = Column(Money, default=0, nullable=False)
+
+    def __repr__(self):
+        return (f"<Checkpoint {self.as_of} {account_name_of(self.account_id)} "
+                f"D:{self.debit_total} K:{self.kredit_total}>")
+
+
+class PeriodClose(db.Model):
+    __tablename__ = 'period_closes'
+
+    # ledger rows dated on or before closed_through are frozen; their
+    # per-account totals live in the checkpoint with as_of = closed_through
+    id             = Column(Integer, primary_key=True)
+    closed_through = Column(Date, nullable=False, unique=True)
+    closed_at      = Column(DateTime, nullable=False, default=datetime.utcnow)
+    row_count      = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<PeriodClose s/d {self.closed_through} ({self.row_count} baris)>"
+
+
+class LedgerOutbox(db.Model):
+    __tablename__  = 'ledger_outbox'
+    __table_args__ = (
+        # the worker's "next batch" scan touches only unprocessed rows
+        Index('ix_ledger_outbox_pending', 'id', sqlite_where=text('processed_at IS NULL')),
+        {'sqlite_autoincrement': True},
+    )
+    # ledger postings written with the business row (LEDGER_MODE = 'outbox')
+    # and turned into ledger_entries later by outbox.drain_outbox()
+    id           = Column(Integer, primary_key=True)
+    created_at   = Column(DateTime, nullable=False, default=datetime.utcnow)
+    payload      = Column(String, nullable=False)   # JSON [{tanggal, keterangan, source_*, lines}, ...]
+    processed_at = Column(DateTime)
+    error        = Column(String(255))
+
+    def __repr__(self):
+        state = self.error or (self.processed_at and 'ok') or 'pending'
+        return f"<LedgerOutbox {self.id} {self.created_at:%Y-%m-%d %H:%M:%S} {state}>"
+
+
+class StockMovement(db.Model):
+    __tablename__  = 'stock_movements'
+    __table_args__ = (
+        # revaluation replays each product's movements in id order
+        Index('ix_stock_movements_product', 'product_id', 'id'),
+        Index('ix_stock_movements_source', 'source_type', 'source_id'),
+    )
+
+    # every change of products.stock: receipts are positive, issues negative;
+    # value is the cost that went in or out of Persediaan Barang (same sign)
+    id          = Column(Integer, primary_key=True)
+    tanggal     = Column(DateTime, nullable=False, default=datetime.utcnow)
+    product_id  = Column(Integer, ForeignKey('products.id'), nullable=False)
+    quantity    = Column(Integer, nullable=False)
+    value       = Column(Money, nullable=False)
+    source_type = Column(String(20))        # see SOURCE_TYPES
+    source_id   = Column(Integer)
+
+    product = relationship('Product')
+
+    def __repr__(self):
+        return f"<StockMovement #{self.id} product {self.product_id} {self.quantity:+d} = {self.value}>"
+
+
+class CostLayer(db.Model):
+    __tablename__  = 'cost_layers'
+    __table_args__ = (
+        # the layers a sale can still take from, oldest first
+        Index('ix_cost_layers_open', 'product_id', 'id', sqlite_where=text('remaining > 0')),
+    )
+
+    # stock bought at one cost (FIFO), or all stock on hand (moving average);
+    # maintained by inventory.py, rebuilt from stock_movements by revalue_inventory()
+    id          = Column(Integer, primary_key=True)
+    product_id  = Column(Integer, ForeignKey('products.id'), nullable=False)
+    movement_id = Column(Integer, ForeignKey('stock_movements.id'))   # receipt that opened it
+    tanggal     = Column(DateTime, nullable=False)
+    quantity    = Column(Integer, nullable=False)     # units received
+    remaining   = Column(Integer, nullable=False)     # units not sold yet
+    value       = Column(Money, nullable=False)       # cost of the remaining units
+    unit_cost   = Column(Money, nullable=False)       # per unit when received
+
+    def __repr__(self):
+        return f"<CostLayer #{self.id} product {self.product_id} {self.remaining}/{self.quantity} = {self.value}>"
+
+
+class IdempotencyKey(db.Model):
+    __tablename__  = 'idempotency_keys'
+    __table_args__ = (
+        Index('ux_idempotency_keys_scope_key', 'scope', 'key', unique=True),
+        Index('ix_idempotency_keys_created_at', 'created_at'),
+    )
+
+    # a client's key for one create request, written in the same commit as the
+    # rows it created; a retry with the same key gets ``result`` back instead
+    # of posting again (see idempotency.py)
+    id          = Column(Integer, primary_key=True)
+    scope       = Column(String(20), nullable=False)     # 'sale', 'purchase', 'jurnal', ...
+    key         = Column(String(100), nullable=False)
+    fingerprint = Column(String(64), nullable=False)     # sha256 of the request
+    result      = Column(String, nullable=False)         # JSON
+    created_at  = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<IdempotencyKey {self.scope}:{self.key} @ {self.created_at:%Y-%m-%d %H:%M:%S}>"
+
+
 class JurnalUmum(db.Model):
     __tablename__ = 'jurnal_umum'
 
@@ -99,62 +469,559 @@ class JurnalUmum(db.Model):
     tanggal   = Column(DateTime, nullable=False, default=datetime.utcnow,
                        server_default=func.now())
     transaksi = Column(String(255), nullable=False)
-    debit     = Column(Numeric(18, 2), default=0, nullable=False)
-    kredit    = Column(Numeric(18, 2), default=0, nullable=False)
+    debit     = Column(Money, default=0, nullable=False)
+    kredit    = Column(Money, default=0, nullable=False)
 
     def __repr__(self):
         return f"<Jurnal {self.transaksi} @ {self.tanggal:%Y-%m-%d}>"
 
 
-class NeracaSaldoAwal(db.Model):
+class NeracaSaldoAwal(AccountRefMixin, db.Model):
     __tablename__ = 'neraca_saldo_awal'
 
     id           = Column(Integer, primary_key=True)
     tanggal      = Column(Date, nullable=False, default=datetime.utcnow().date,
                           server_default=func.current_date())
-    account_name = Column(String(100), nullable=False)
-    debit        = Column(Numeric(18, 2), default=0, nullable=False)
-    kredit       = Column(Numeric(18, 2), default=0, nullable=False)
+    debit        = Column(Money, default=0, nullable=False)
+    kredit       = Column(Money, default=0, nullable=False)
 
     def __repr__(self):
         return (f"<SaldoAwal {self.account_name} | "
                 f"D:{self.debit} K:{self.kredit} @ {self.tanggal}>")
 
 
-class NeracaSaldo(db.Model):
+class NeracaSaldo(AccountRefMixin, db.Model):
     __tablename__ = 'neraca_saldo'
 
     id     = Column(Integer, primary_key=True)
-    akun   = Column(String(255), nullable=False)
-    debit  = Column(Numeric(18, 2), default=0, nullable=False)
-    kredit = Column(Numeric(18, 2), default=0, nullable=False)
+    debit  = Column(Money, default=0, nullable=False)
+    kredit = Column(Money, default=0, nullable=False)
 
     def __repr__(self):
-        return f"<NeracaSaldo {self.akun} D:{self.debit} K:{self.kredit}>"
+        return f"<NeracaSaldo {self.account_name} D:{self.debit} K:{self.kredit}>"
 
 
 # ------------------------------------------------------------------------------
 # Utility
 # ------------------------------------------------------------------------------
 
-def get_last_saldo():
-    last = db.session.query(Ledger).order_by(Ledger.id.desc()).first()
-    return float(last.saldo) if last else 0.0
+def get_saldo(account_name):
+    account_id = account_id_of(account_name, create=False)
+    bal = db.session.get(AccountBalance, account_id) if account_id else None
+    return bal.saldo if bal else Decimal('0.00')
+
+
+def _advance_balance(account_id, debit, kredit):
+    # single upsert: the write lock is taken before the new saldo is read back,
+    # so two postings can never start from the same balance
+    stmt = (
+        sqlite_insert(AccountBalance)
+        .values(account_id=account_id,
+                debit_total=debit, kredit_total=kredit, saldo=debit - kredit,
+                updated_at=datetime.utcnow())
+        .on_conflict_do_update(
+            index_elements=[AccountBalance.account_id],
+            set_={'debit_total':  AccountBalance.debit_total + debit,
+                  'kredit_total': AccountBalance.kredit_total + kredit,
+                  'saldo':        AccountBalance.saldo + (debit - kredit),
+                  'updated_at':   datetime.utcnow()})
+        .returning(AccountBalance.saldo)
+    )
+    return db.session.execute(stmt).scalar_one()
+
+
+def _as_date(value):
+    return value.date() if isinstance(value, datetime) else value
+
+
+def last_closed_date():
+    return db.session.query(func.max(PeriodClose.closed_through)).scalar()
+
+
+def _check_open_period(entries):
+    closed = last_closed_date()
+    if closed is None:
+        return
+    for e in entries:
+        if _as_date(e.tanggal) <= closed:
+            raise ValueError(f"Periode sampai {closed} sudah ditutup "
+                             f"({e.account_name}, {_as_date(e.tanggal)}).")
+
+
+def _adjust_checkpoints(entries):
+    # only back-dated rows (on or before an existing checkpoint) touch checkpoints
+    latest = db.session.query(func.max(TrialBalanceCheckpoint.as_of)).scalar()
+    if latest is None:
+        return
+    cp = TrialBalanceCheckpoint.__table__
+    for e in entries:
+        day = _as_date(e.tanggal)
+        if day > latest:
+            continue
+        db.session.execute(
+            sqlite_insert(cp)
+            .from_select(['as_of', 'account_id', 'debit_total', 'kredit_total'],
+                         select(cp.c.as_of, literal(e.account_id),
+                                literal(0), literal(0))
+                           .where(cp.c.as_of >= day).distinct())
+            .on_conflict_do_nothing()
+        )
+        db.session.execute(
+            cp.update()
+            .where(cp.c.account_id == e.account_id, cp.c.as_of >= day)
+            .values(debit_total=cp.c.debit_total + e.debit,
+                    kredit_total=cp.c.kredit_total + e.kredit)
+        )
+
+
+def post_ledger(*entries, bulk=False):
+    """Add Ledger rows to the session, filling in each account's running saldo.
+
+    saldo is debit - kredit accumulated per account. account_balances is
+    updated once per distinct account, inside the caller's transaction.
+    With bulk=True the rows are written with one executemany INSERT instead
+    of being added to the session (they do not get their ids back).
+    """
+    totals = {}
+    for e in entries:
+        e.tanggal = e.tanggal or datetime.utcnow()
+        e.debit   = e.debit  or Decimal('0.00')
+        e.kredit  = e.kredit or Decimal('0.00')
+        d, k = totals.get(e.account_id, (Decimal('0.00'), Decimal('0.00')))
+        totals[e.account_id] = (d + e.debit, k + e.kredit)
+
+    _check_open_period(entries)
+
+    # work back from the new balance to the one each row starts from
+    running = {acc: _advance_balance(acc, d, k) - (d - k)
+               for acc, (d, k) in totals.items()}
+    _adjust_checkpoints(entries)
+    for e in entries:
+        running[e.account_id] += e.debit - e.kredit
+        e.saldo = running[e.account_id]
+    if bulk:
+        db.session.execute(Ledger.__table__.insert(), [
+            {'tanggal': e.tanggal, 'keterangan': e.keterangan, 'account_id': e.account_id,
+             'debit': e.debit, 'kredit': e.kredit, 'saldo': e.saldo, 'entry_id': e.entry_id}
+            for e in entries])
+    else:
+        db.session.add_all(entries)
+    return list(entries)
+
+
+def _check_balanced(entry):
+    debit  = sum((l.debit  or Decimal('0.00') for l in entry.lines), Decimal('0.00'))
+    kredit = sum((l.kredit or Decimal('0.00') for l in entry.lines), Decimal('0.00'))
+    if not entry.lines:
+        raise ValueError(f"Jurnal '{entry.keterangan}' tidak memiliki baris.")
+    if debit != kredit:
+        raise ValueError(f"Jurnal '{entry.keterangan}' tidak seimbang: "
+                         f"debit {debit} != kredit {kredit}.")
+
+
+def post_journal(*entries, bulk=False):
+    """Post JournalEntry headers with their lines, each as one balanced unit.
+
+    Every entry's lines must have equal debit and kredit totals, otherwise
+    ValueError is raised before anything is written. The lines go through
+    post_ledger(). Normally headers and lines are added to the session and
+    written by the caller's next flush, one batched INSERT per table; with
+    bulk=True the headers are inserted with one executemany ... RETURNING
+    for their ids and the lines with post_ledger(bulk=True).
+    """
+    for entry in entries:
+        _check_balanced(entry)
+        entry.tanggal = entry.tanggal or entry.lines[0].tanggal or datetime.utcnow()
+        for line in entry.lines:
+            line.tanggal    = line.tanggal or entry.tanggal
+            line.keterangan = line.keterangan or entry.keterangan
+    if not entries:
+        return []
+
+    lines = [line for entry in entries for line in entry.lines]
+    if bulk:
+        ids = db.session.execute(
+            insert(JournalEntry).returning(JournalEntry.id, sort_by_parameter_order=True),
+            [{'tanggal': e.tanggal, 'keterangan': e.keterangan, 'source_type': e.source_type,
+              'source_id': e.source_id, 'reversal_of': e.reversal_of} for e in entries]
+        ).scalars().all()
+        for entry, entry_id in zip(entries, ids):
+            entry.id = entry_id
+            for line in entry.lines:
+                line.entry_id = entry_id
+        post_ledger(*lines, bulk=True)
+    else:
+        post_ledger(*lines)
+        db.session.add_all(entries)
+    return list(entries)
+
 
-class LedgerMerged(db.Model):
+def backfill_journal_entries():
+    """Group ledger rows posted before journal_entries existed into entries.
+
+    Rows with no entry_id are grouped by (tanggal, keterangan), which is how
+    the two sides of a posting used to be linked; only balanced groups get an
+    entry. Sales are linked to their transaction through the keterangan.
+    Returns the number of entries created.
+    """
+    first  = (db.session.query(func.max(JournalEntry.id)).scalar() or 0) + 1
+    prefix = 'Penjualan Transaksi #'
+    created = db.session.execute(text(f"""
+        INSERT INTO journal_entries (tanggal, keterangan, source_type, source_id)
+        SELECT tanggal, keterangan,
+               CASE WHEN keterangan LIKE '{prefix}%' THEN 'transaction' END,
+               CASE WHEN keterangan LIKE '{prefix}%'
+                    THEN CAST(substr(keterangan, {len(prefix) + 1}) AS INTEGER) END
+          FROM ledger_entries
+         WHERE entry_id IS NULL
+         GROUP BY tanggal, keterangan
+        HAVING sum(debit) = sum(kredit)
+         ORDER BY min(id)
+    """)).rowcount
+    db.session.execute(text("""
+        UPDATE ledger_entries SET entry_id = j.id
+          FROM journal_entries AS j
+         WHERE ledger_entries.entry_id IS NULL AND j.id >= :first
+           AND j.tanggal = ledger_entries.tanggal AND j.keterangan = ledger_entries.keterangan
+    """), {'first': first})
+    db.session.commit()
+    return created
+
+
+# string account columns that account_id replaced
+_LEGACY_ACCOUNT_COLUMNS = {
+    'ledger_entries':    'account_name',
+    'neraca_saldo_awal': 'account_name',
+    'neraca_saldo':      'akun',
+    'ledger_merged':     'account_name',
+}
+
+
+def _table_columns(table):
+    return {row[1] for row in db.session.execute(text(f'PRAGMA table_info("{table}")'))}
+
+
+def migrate_account_ids():
+    """Move a database from account-name strings to account_id references.
+
+    Names found in the data are registered in accounts. Indexes and triggers
+    that block DROP COLUMN are dropped; ensure_indexes() and
+    ensure_ledger_merged() recreate them. Tables keyed by name are rebuilt.
+    Returns the migrated tables.
+    """
+    legacy = [(t, c) for t, c in _LEGACY_ACCOUNT_COLUMNS.items() if c in _table_columns(t)]
+    if legacy:
+        for (name,) in db.session.execute(text(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE '%_merged_%'")):
+            db.session.execute(text(f'DROP TRIGGER "{name}"'))
+
+    for table, col in legacy:
+        db.session.execute(text(
+            f'INSERT OR IGNORE INTO accounts (name) '
+            f'SELECT DISTINCT "{col}" FROM "{table}" WHERE "{col}" IS NOT NULL'))
+        if 'account_id' not in _table_columns(table):
+            db.session.execute(text(
+                f'ALTER TABLE "{table}" ADD COLUMN account_id INTEGER REFERENCES accounts (id)'))
+        db.session.execute(text(
+            f'UPDATE "{table}" SET account_id = '
+            f'(SELECT id FROM accounts WHERE accounts.name = "{table}"."{col}")'))
+        for (name,) in db.session.execute(text(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :t "
+                "AND sql IS NOT NULL"), {'t': table}).all():
+            db.session.execute(text(f'DROP INDEX "{name}"'))
+        db.session.execute(text(f'ALTER TABLE "{table}" DROP COLUMN "{col}"'))
+
+    migrated = [t for t, _ in legacy]
+    if 'account_name' in _table_columns('trial_balance_checkpoints'):
+        db.session.execute(text(
+            'ALTER TABLE trial_balance_checkpoints RENAME TO trial_balance_checkpoints_old'))
+        TrialBalanceCheckpoint.__table__.create(bind=db.session.connection())
+        db.session.execute(text(
+            "INSERT INTO trial_balance_checkpoints (as_of, account_id, debit_total, kredit_total) "
+            "SELECT cp.as_of, a.id, cp.debit_total, cp.kredit_total "
+            "FROM trial_balance_checkpoints_old cp JOIN accounts a ON a.name = cp.account_name"))
+        db.session.execute(text('DROP TABLE trial_balance_checkpoints_old'))
+        migrated.append('trial_balance_checkpoints')
+    rebuild = 'account_name' in _table_columns('account_balances')
+    if rebuild:
+        db.session.execute(text('DROP TABLE account_balances'))
+        AccountBalance.__table__.create(bind=db.session.connection())
+        migrated.append('account_balances')
+
+    db.session.commit()
+    invalidate_accounts()
+    if rebuild:
+        rebuild_account_balances()
+    return migrated
+
+
+def _money_columns(table):
+    return [c.name for c in table.columns if isinstance(c.type, Money)]
+
+
+def migrate_money_columns():
+    """Rewrite NUMERIC money columns as integer sen (see Money).
+
+    SQLite cannot change a column type in place, so each legacy table is
+    copied into a fresh one and swapped in. Triggers on the old tables are
+    dropped; ensure_ledger_merged() and ensure_search_index() recreate them,
+    ensure_indexes() the indexes. Returns the migrated tables.
+    """
+    legacy = []
+    for table in db.metadata.sorted_tables:
+        money = _money_columns(table)
+        types = {row[1]: (row[2] or '').upper() for row in db.session.execute(
+            text(f'PRAGMA table_info("{table.name}")'))}
+        if any(types.get(c, '').startswith(('NUMERIC', 'DECIMAL')) for c in money):
+            legacy.append(table)
+    if not legacy:
+        return []
+
+    for (name,) in db.session.execute(text(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'trg%'")).all():
+        db.session.execute(text(f'DROP TRIGGER "{name}"'))
+    for table in legacy:
+        money    = _money_columns(table)
+        existing = _table_columns(table.name)
+        cols     = [c.name for c in table.columns if c.name in existing]
+        names    = ', '.join(f'"{c}"' for c in cols)
+        values   = ', '.join(f'CAST(ROUND("{c}" * 100) AS INTEGER)' if c in money else f'"{c}"'
+                             for c in cols)
+        # build the new table under a temporary name; renaming the old one
+        # instead would make SQLite rewrite foreign keys that point at it
+        ddl = str(CreateTable(table).compile(dialect=db.engine.dialect))
+        db.session.execute(text(ddl.replace(f'TABLE {table.name} ', f'TABLE {table.name}_money ', 1)))
+        db.session.execute(text(
+            f'INSERT INTO "{table.name}_money" ({names}) SELECT {values} FROM "{table.name}"'))
+        db.session.execute(text(f'DROP TABLE "{table.name}"'))
+        db.session.execute(text(f'ALTER TABLE "{table.name}_money" RENAME TO "{table.name}"'))
+    db.session.commit()
+    return [t.name for t in legacy]
+
+
+def ensure_columns():
+    """Add declared columns missing from existing tables (ALTER TABLE ADD COLUMN).
+
+    Columns added this way need a server_default if they are NOT NULL.
+    Returns the created columns as 'table.column'.
+    """
+    created = []
+    for table in db.metadata.sorted_tables:
+        existing = _table_columns(table.name)
+        if not existing:
+            continue    # table itself is missing; db.create_all() handles it
+        for col in table.columns:
+            if col.name in existing or col.primary_key:
+                continue
+            ddl = CreateColumn(col).compile(dialect=db.engine.dialect)
+            db.session.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN {ddl}'))
+            created.append(f'{table.name}.{col.name}')
+    db.session.commit()
+    return created
+
+
+def ensure_indexes():
+    """Create any declared index missing from an existing database.
+
+    db.create_all() skips tables that already exist, so their indexes
+    have to be added separately. Returns the names of created indexes.
+    """
+    created = []
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            if not db.session.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type='index' AND name=:n"),
+                {'n': index.name}
+            ).first():
+                index.create(bind=db.session.connection())
+                created.append(index.name)
+    db.session.commit()
+    return created
+
+
+# hot queries and the index each one must use
+HOT_QUERIES = [
+    ("ledger by account, newest first",
+     "SELECT * FROM ledger_entries WHERE account_id = 1 "
+     "ORDER BY tanggal DESC LIMIT 20",
+     'ix_ledger_account_tanggal'),
+    ("ledger newest first",
+     "SELECT * FROM ledger_entries ORDER BY tanggal DESC LIMIT 20",
+     'ix_ledger_tanggal'),
+    ("sales by date range",
+     "SELECT * FROM transactions WHERE date >= '2024-01-01' AND date < '2024-02-01'",
+     'ix_transactions_date'),
+    ("items of a sale",
+     "SELECT * FROM transaction_items WHERE transaction_id = 1",
+     'ix_transaction_items_transaction_id'),
+    ("sales of a product",
+     "SELECT * FROM transaction_items WHERE product_id = 1",
+     'ix_transaction_items_product_id'),
+    ("opening + ledger by account",
+     "SELECT * FROM ledger_merged WHERE account_id = 1 ORDER BY tanggal",
+     'ix_ledger_merged_account_tanggal'),
+    ("daily sales of a date",
+     "SELECT * FROM sales_daily WHERE tanggal = '2024-01-01'",
+     'sqlite_autoindex_sales_daily_1'),
+    ("lines of a journal entry",
+     "SELECT * FROM ledger_entries WHERE entry_id = 1",
+     'ix_ledger_entry'),
+    ("journal entries of a source row",
+     "SELECT * FROM journal_entries WHERE source_type = 'transaction' AND source_id = 1",
+     'ix_journal_entries_source'),
+    ("product by SKU / barcode",
+     "SELECT * FROM products WHERE sku = '8990000000001'",
+     'ux_products_sku'),
+    ("open cost layers of a product",
+     "SELECT * FROM cost_layers WHERE product_id = 1 AND remaining > 0 ORDER BY id",
+     'ix_cost_layers_open'),
+    ("stock movements of a product",
+     "SELECT * FROM stock_movements WHERE product_id = 1 ORDER BY id",
+     'ix_stock_movements_product'),
+    ("replayed request by idempotency key",
+     "SELECT * FROM idempotency_keys WHERE scope = 'sale' AND key = 'abc'",
+     'ux_idempotency_keys_scope_key'),
+]
+
+
+def check_query_plans():
+    """Run EXPLAIN QUERY PLAN on HOT_QUERIES.
+
+    Returns [(label, ok, plan_text), ...]; ok is False when the plan does
+    not mention the expected index.
+    """
+    report = []
+    for label, sql, index_name in HOT_QUERIES:
+        plan = ' | '.join(row[-1] for row in
+                          db.session.execute(text('EXPLAIN QUERY PLAN ' + sql)))
+        report.append((label, index_name in plan, plan))
+    return report
+
+
+def rebuild_account_balances():
+    """Recompute account_balances from ledger_entries (one grouped scan)."""
+    rows = (db.session.query(Ledger.account_id,
+                             func.sum(Ledger.debit), func.sum(Ledger.kredit))
+            .group_by(Ledger.account_id).all())
+    db.session.query(AccountBalance).delete()
+    for account_id, debit, kredit in rows:
+        debit, kredit = debit or Decimal('0.00'), kredit or Decimal('0.00')
+        db.session.add(AccountBalance(account_id=account_id,
+                                      debit_total=debit, kredit_total=kredit,
+                                      saldo=debit - kredit))
+    db.session.commit()
+
+
+def rebuild_ledger_saldo():
+    """Rewrite each ledger row's saldo as its account's running debit - kredit in id order.
+
+    For rows posted before saldo was kept per account; one windowed UPDATE.
+    Returns the number of rows changed.
+    """
+    changed = db.session.execute(text("""
+        UPDATE ledger_entries SET saldo = r.saldo
+          FROM (SELECT id, sum(debit - kredit) OVER (PARTITION BY account_id ORDER BY id) AS saldo
+                  FROM ledger_entries) AS r
+         WHERE ledger_entries.id = r.id AND ledger_entries.saldo IS NOT r.saldo
+    """)).rowcount
+    db.session.commit()
+    return changed
+
+class LedgerMerged(AccountRefMixin, db.Model):
     __tablename__  = 'ledger_merged'
-    # these columns must match exactly your VIEW definition below!
+    __table_args__ = (
+        Index('ux_ledger_merged_source', 'sumber', 'source_id', unique=True),
+        Index('ix_ledger_merged_account_tanggal', 'account_id', 'tanggal'),
+        Index('ix_ledger_merged_tanggal', 'tanggal'),
+        {'sqlite_autoincrement': True},    # ids are never reused
+    )
+    # physical projection of neraca_saldo_awal + ledger_entries, kept in sync
+    # by the LEDGER_MERGED_TRIGGERS below
     id            = Column(Integer, primary_key=True)
     tanggal       = Column(Date, nullable=False)
-    account_name  = Column(String(100), nullable=False)
     keterangan    = Column(String(255), nullable=False)
-    debit         = Column(Numeric(18,2), nullable=False)
-    kredit        = Column(Numeric(18,2), nullable=False)
-    saldo         = Column(Numeric(18,2), nullable=False)
-    sumber        = Column(String(50), nullable=False)
+    debit         = Column(Money, nullable=False)
+    kredit        = Column(Money, nullable=False)
+    saldo         = Column(Money, nullable=False)
+    sumber        = Column(String(50), nullable=False)     # 'Opening' | 'Ledger'
+    source_id     = Column(Integer)                        # id in the source table
 
     def __repr__(self):
         return f"<LedgerMerged {self.tanggal} {self.account_name} D:{self.debit} K:{self.kredit} S:{self.saldo}>"
 
 
+# columns of each source, in ledger_merged column order
+_MERGED_COLUMNS = "tanggal, account_id, keterangan, debit, kredit, saldo, sumber, source_id"
+_MERGED_FROM = {
+    'neraca_saldo_awal':
+        "date({r}.tanggal), {r}.account_id, 'Saldo Awal', {r}.debit, {r}.kredit, "
+        "{r}.debit - {r}.kredit, 'Opening', {r}.id",
+    'ledger_entries':
+        "date({r}.tanggal), {r}.account_id, {r}.keterangan, {r}.debit, {r}.kredit, "
+        "{r}.saldo, 'Ledger', {r}.id",
+}
+_MERGED_SUMBER = {'neraca_saldo_awal': 'Opening', 'ledger_entries': 'Ledger'}
+
+
+def _merged_triggers():
+    for table, cols in _MERGED_FROM.items():
+        sumber = _MERGED_SUMBER[table]
+        yield f"trg_{table}_merged_ins", f"""
+            CREATE TRIGGER trg_{table}_merged_ins AFTER INSERT ON {table} BEGIN
+              INSERT INTO ledger_merged ({_MERGED_COLUMNS})
+              VALUES ({cols.format(r='NEW')});
+            END"""
+        yield f"trg_{table}_merged_upd", f"""
+            CREATE TRIGGER trg_{table}_merged_upd
+            AFTER UPDATE OF tanggal, account_id, debit, kredit{', keterangan, saldo' if table == 'ledger_entries' else ''}
+            ON {table} BEGIN
+              UPDATE ledger_merged
+                 SET ({_MERGED_COLUMNS}) = (SELECT {cols.format(r='NEW')})
+               WHERE sumber = '{sumber}' AND source_id = OLD.id;
+            END"""
+        yield f"trg_{table}_merged_del", f"""
+            CREATE TRIGGER trg_{table}_merged_del AFTER DELETE ON {table} BEGIN
+              DELETE FROM ledger_merged WHERE sumber = '{sumber}' AND source_id = OLD.id;
+            END"""
+
+
+def rebuild_ledger_merged():
+    """Reconcile ledger_merged with its sources; existing rows keep their ids."""
+    db.session.execute(text("""
+        DELETE FROM ledger_merged
+         WHERE source_id IS NULL
+            OR (sumber = 'Opening' AND source_id NOT IN (SELECT id FROM neraca_saldo_awal))
+            OR (sumber = 'Ledger'  AND source_id NOT IN (SELECT id FROM ledger_entries))
+    """))
+    # opening balances first, so a fresh build numbers them before the ledger
+    for table, cols in _MERGED_FROM.items():
+        db.session.execute(text(f"""
+            INSERT INTO ledger_merged ({_MERGED_COLUMNS})
+            SELECT {cols.format(r='src')} FROM {table} AS src WHERE true ORDER BY src.id
+            ON CONFLICT (sumber, source_id) DO UPDATE SET
+              tanggal = excluded.tanggal, account_id = excluded.account_id,
+              keterangan = excluded.keterangan, debit = excluded.debit,
+              kredit = excluded.kredit, saldo = excluded.saldo
+        """))
+    db.session.commit()
+
+
+def drop_ledger_merged_view():
+    """ledger_merged used to be a VIEW; drop it so the table can be created."""
+    if db.session.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'view' AND name = 'ledger_merged'")).first():
+        db.session.execute(text("DROP VIEW ledger_merged"))
+    db.session.commit()
+
 
+def ensure_ledger_merged():
+    """Install the ledger_merged sync triggers; populate the table if they were missing."""
+    installed = {row[0] for row in db.session.execute(
+        text("SELECT name FROM sqlite_master WHERE type = 'trigger'"))}
+    missing = [(name, ddl) for name, ddl in _merged_triggers() if name not in installed]
+    for _, ddl in missing:
+        db.session.execute(text(ddl))
+    db.session.commit()
+    if missing:
+        rebuild_ledger_merged()
+    return [name for name, _ in missing]
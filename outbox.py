@@ -0,0 +1,225 @@
+# outbox.py
+#
+# Optional asynchronous ledger posting (LEDGER_MODE = 'outbox'). A sale or
+# purchase commits its business rows plus one compact ledger_outbox row; a
+# worker later turns outbox rows into ledger_entries in batches.
+#
+# Exactly-once: a batch is claimed with UPDATE ... SET processed_at ...
+# RETURNING, which takes SQLite's write lock before anything is read, and the
+# claim commits in the same transaction as the ledger rows it produced. A
+# crash or error rolls both back, so a row is never posted twice or lost.
+
+import json
+import threading
+import time
+from datetime import datetime
+from decimal import Decimal
+
+from flask import current_app
+from sqlalchemy import text, bindparam
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
+
+from models import (db, Ledger, LedgerOutbox, JournalEntry, post_journal, last_closed_date,
+                    _as_date, _check_balanced, _check_open_period)
+
+OUTBOX_BATCH = 500
+
+# in-process figures for /metrics; pending/lag are read from the table
+_stats = {'batches': 0, 'posted': 0, 'failed': 0, 'last_drain': None, 'last_batch_s': 0.0}
+_stats_lock = threading.Lock()
+
+
+def outbox_enabled():
+    return current_app.config.get('LEDGER_MODE') == 'outbox'
+
+
+def post_or_enqueue(*entries):
+    """post_journal() now, or queue the entries when LEDGER_MODE is 'outbox'.
+
+    Either way the work joins the caller's transaction. Unbalanced entries
+    and closed periods are still rejected here, so the user sees the error
+    at save time.
+    """
+    if not outbox_enabled():
+        return post_journal(*entries)
+
+    for entry in entries:
+        _check_balanced(entry)
+        _check_open_period([l for l in entry.lines if l.tanggal is not None])
+    now = datetime.utcnow()
+    db.session.add(LedgerOutbox(payload=json.dumps([{
+        'tanggal':     (e.tanggal or e.lines[0].tanggal or now).isoformat(),
+        'keterangan':  e.keterangan,
+        'source_type': e.source_type,
+        'source_id':   e.source_id,
+        'lines': [[(l.tanggal or e.tanggal or now).isoformat(), l.keterangan, l.account_id,
+                   str(l.debit or 0), str(l.kredit or 0)] for l in e.lines],
+    } for e in entries])))
+    return list(entries)
+
+
+def _lines(rows):
+    return [Ledger(tanggal=datetime.fromisoformat(t), keterangan=ket, account_id=acc,
+                   debit=Decimal(d), kredit=Decimal(k))
+            for t, ket, acc, d, k in rows]
+
+
+def _entries(payload):
+    data = json.loads(payload)
+    if data and isinstance(data[0], list):
+        # queued before journal entries: bare lines, paired by tanggal + keterangan
+        groups = {}
+        for line in _lines(data):
+            groups.setdefault((line.tanggal, line.keterangan), []).append(line)
+        return [JournalEntry(tanggal=t, keterangan=ket, lines=lines)
+                for (t, ket), lines in groups.items()]
+    return [JournalEntry(tanggal=datetime.fromisoformat(e['tanggal']), keterangan=e['keterangan'],
+                         source_type=e['source_type'], source_id=e['source_id'],
+                         lines=_lines(e['lines']))
+            for e in data]
+
+
+def _error(exc):
+    exc = getattr(exc, 'orig', None) or exc      # the driver's message, without the SQL
+    return str(exc) if isinstance(exc, ValueError) else f"{type(exc).__name__}: {exc}"
+
+
+def drain_outbox(batch=OUTBOX_BATCH):
+    """Post up to ``batch`` pending outbox rows in one transaction.
+
+    Rows that cannot be parsed or posted (dated inside a period closed after
+    they were queued, holding an unbalanced entry, ...) are marked with an
+    error instead of blocking the queue; the rest of the batch is posted.
+    Returns the number of rows claimed.
+    """
+    t0  = time.perf_counter()
+    now = datetime.utcnow()
+    claimed = db.session.execute(text(
+        "UPDATE ledger_outbox SET processed_at = :now "
+        "WHERE id IN (SELECT id FROM ledger_outbox WHERE processed_at IS NULL "
+        "             ORDER BY id LIMIT :n) "
+        "RETURNING id, payload"), {'now': now, 'n': batch}).all()
+    if not claimed:
+        # close, not rollback: an idle poll must not fire after_rollback handlers
+        db.session.close()
+        return 0
+
+    closed  = last_closed_date()
+    ready, failed = [], []
+    for row_id, payload in sorted(claimed):
+        try:
+            rows = _entries(payload)
+            for entry in rows:
+                _check_balanced(entry)
+            if closed and any(_as_date(l.tanggal) <= closed for e in rows for l in e.lines):
+                raise ValueError(f"Periode sampai {closed} sudah ditutup.")
+        except Exception as e:      # any payload that cannot become balanced entries
+            failed.append({'row_id': row_id, 'message': _error(e)})
+            continue
+        ready.append((row_id, rows))
+
+    if ready:
+        try:
+            with db.session.begin_nested():
+                post_journal(*[e for _, rows in ready for e in rows], bulk=True)
+        except (ValueError, SQLAlchemyError):
+            # find the rows at fault: post them one savepoint each
+            for row_id, rows in ready:
+                try:
+                    with db.session.begin_nested():
+                        post_journal(*rows, bulk=True)
+                except (ValueError, SQLAlchemyError) as e:
+                    failed.append({'row_id': row_id, 'message': _error(e)})
+    if failed:
+        db.session.execute(
+            LedgerOutbox.__table__.update()
+            .where(LedgerOutbox.id == bindparam('row_id'))
+            .values(error=bindparam('message')), failed)
+    db.session.commit()
+
+    with _stats_lock:
+        _stats['batches']     += 1
+        _stats['posted']      += len(claimed) - len(failed)
+        _stats['failed']      += len(failed)
+        _stats['last_drain']   = time.time()
+        _stats['last_batch_s'] = time.perf_counter() - t0
+    return len(claimed)
+
+
+def purge_outbox(before):
+    """Delete rows processed successfully before ``before``; failed rows stay."""
+    res = db.session.execute(
+        LedgerOutbox.__table__.delete()
+        .where(LedgerOutbox.processed_at < before, LedgerOutbox.error.is_(None)))
+    db.session.commit()
+    return res.rowcount
+
+
+def outbox_lag():
+    """Pending row count and age in seconds of the oldest pending row."""
+    count, oldest = db.session.execute(text(
+        "SELECT count(*), min(created_at) FROM ledger_outbox "
+        "WHERE processed_at IS NULL")).one()
+    age = 0.0
+    if oldest:
+        oldest = oldest if isinstance(oldest, datetime) else datetime.fromisoformat(oldest)
+        age = max(0.0, (datetime.utcnow() - oldest).total_seconds())
+    return count, age
+
+
+def render_outbox_metrics():
+    pending, age = outbox_lag()
+    with _stats_lock:
+        stats = dict(_stats)
+    gauges = [
+        ('pos_outbox_pending',             'gauge',   'Outbox rows waiting to be posted.', pending),
+        ('pos_outbox_lag_seconds',         'gauge',   'Age of the oldest pending outbox row.', age),
+        ('pos_outbox_posted_total',        'counter', 'Outbox rows posted by this process.',
+         stats['posted']),
+        ('pos_outbox_failed_total',        'counter', 'Outbox rows rejected by this process.',
+         stats['failed']),
+        ('pos_outbox_last_batch_seconds',  'gauge',   'Duration of the last drained batch.',
+         stats['last_batch_s']),
+    ]
+    lines = []
+    for name, kind, help_text, value in gauges:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}",
+                  f"{name} {value:.6f}" if isinstance(value, float) else f"{name} {value}"]
+    return '\n'.join(lines) + '\n'
+
+
+class OutboxWorker(threading.Thread):
+    """Drains the outbox in the background until stop() is called."""
+
+    def __init__(self, app, batch=OUTBOX_BATCH, poll=0.5):
+        super().__init__(name='ledger-outbox', daemon=True)
+        self.app, self.batch, self.poll = app, batch, poll
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        with self.app.app_context():
+            while not self._stop_event.is_set():
+                try:
+                    n = drain_outbox(self.batch)
+                except OperationalError:
+                    # 'database is locked' past busy_timeout: retry the batch
+                    db.session.rollback()
+                    n = 0
+                except Exception:
+                    db.session.rollback()
+                    self.app.logger.exception('ledger outbox worker')
+                    n = 0
+                finally:
+                    db.session.remove()
+                if n < self.batch:
+                    self._stop_event.wait(self.poll)
+
+
+def start_outbox_worker(app):
+    worker = OutboxWorker(app, app.config.get('OUTBOX_BATCH', OUTBOX_BATCH),
+                          app.config.get('OUTBOX_POLL_S', 0.5))
+    worker.start()
+    return worker
@@ -0,0 +1,121 @@
+# reports.py
+
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+
+from sqlalchemy import func
+
+from models import db, Account, Ledger, ACCOUNT_CATEGORIES
+from ledger import _day_after, _ledger_sums, _account_totals
+
+REPORT_CACHE_SIZE = 64
+
+ZERO = Decimal('0.00')
+
+# (start, end, max ledger id) -> {account_id: (period_debit, period_kredit, debit, kredit)}
+_sums_cache = OrderedDict()
+_sums_lock  = threading.Lock()
+
+
+def _dec(value):
+    return value if value is not None else ZERO
+
+
+def _account_sums(start, end):
+    """Per-account debit/kredit inside [start, end] and cumulative through end.
+
+    The in-period columns are one grouped scan of [start, end]; the
+    cumulative ones come from ledger._account_totals(), which starts at the
+    nearest trial balance checkpoint instead of the first ledger row. Opening
+    balances are included through the ledger rows NeracaSaldoAwalView posts
+    for them. Cached until a posting raises the highest ledger id.
+    """
+    max_id = db.session.query(func.max(Ledger.id)).scalar() or 0
+    key = (start, end, max_id)
+    with _sums_lock:
+        if key in _sums_cache:
+            _sums_cache.move_to_end(key)
+            return _sums_cache[key]
+
+    period = _ledger_sums(datetime.combine(start, datetime.min.time()), _day_after(end))
+    totals = _account_totals(end)
+    sums = {account_id: (*period.get(account_id, (ZERO, ZERO)),
+                         *(_dec(v) for v in totals.get(account_id, (ZERO, ZERO))))
+            for account_id in period.keys() | totals.keys()}
+
+    with _sums_lock:
+        _sums_cache[key] = sums
+        while len(_sums_cache) > REPORT_CACHE_SIZE:
+            _sums_cache.popitem(last=False)
+    return sums
+
+
+def _accounts_by_category():
+    groups = {k: [] for k, _ in ACCOUNT_CATEGORIES}
+    groups[None] = []
+    for account_id, name, kategori in db.session.query(Account.id, Account.name,
+                                                       Account.kategori).order_by(Account.name):
+        groups.get(kategori, groups[None]).append((account_id, name))
+    return groups
+
+
+def _section(accounts, amount_of):
+    rows  = [{'account_name': name, 'amount': amount_of(account_id)}
+             for account_id, name in accounts]
+    rows  = [r for r in rows if r['amount']]
+    return {'rows': rows, 'total': sum((r['amount'] for r in rows), ZERO)}
+
+
+def income_statement(start, end):
+    """Laba rugi for start..end (inclusive): pendapatan, beban and laba bersih."""
+    sums   = _account_sums(start, end)
+    groups = _accounts_by_category()
+    get    = lambda i: sums.get(i, (ZERO,) * 4)
+
+    pendapatan = _section(groups['pendapatan'], lambda i: get(i)[1] - get(i)[0])
+    beban      = _section(groups['beban'],      lambda i: get(i)[0] - get(i)[1])
+    return {
+        'start': start, 'end': end,
+        'pendapatan':  pendapatan,
+        'beban':       beban,
+        'laba_bersih': pendapatan['total'] - beban['total'],
+    }
+
+
+def balance_sheet(as_of, start=None):
+    """Neraca as of a date (inclusive).
+
+    Pendapatan and beban are never closed into modal by a journal, so their
+    cumulative net is shown as 'Laba ditahan' under modal; with balanced
+    postings aset == kewajiban + modal. Unclassified accounts are listed
+    separately and make the difference visible instead of hiding it.
+    """
+    sums   = _account_sums(start or as_of, as_of)
+    groups = _accounts_by_category()
+    get    = lambda i: sums.get(i, (ZERO,) * 4)
+    debit_side  = lambda i: get(i)[2] - get(i)[3]
+    kredit_side = lambda i: get(i)[3] - get(i)[2]
+
+    aset      = _section(groups['aset'],      debit_side)
+    kewajiban = _section(groups['kewajiban'], kredit_side)
+    modal     = _section(groups['modal'],     kredit_side)
+    laba      = (sum((kredit_side(i) for i, _ in groups['pendapatan']), ZERO)
+                 - sum((debit_side(i) for i, _ in groups['beban']), ZERO))
+    if laba:
+        modal['rows'].append({'account_name': 'Laba ditahan', 'amount': laba})
+        modal['total'] += laba
+    lainnya = _section(groups[None], debit_side)
+    return {
+        'as_of': as_of,
+        'aset': aset, 'kewajiban': kewajiban, 'modal': modal, 'lainnya': lainnya,
+        'selisih': aset['total'] - kewajiban['total'] - modal['total'],
+    }
+
+
+def financial_statements(start, end=None):
+    """Laba rugi for start..end and neraca at end, from one cached aggregate."""
+    end = end or date.today()
+    return {'laba_rugi': income_statement(start, end),
+            'neraca':    balance_sheet(end, start)}
@@ -0,0 +1,289 @@
+# sales.py
+
+from decimal import Decimal
+from datetime import datetime, date, timedelta
+from sqlalchemy import insert, update, func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import (db, Product, Transaction, TransactionItem, SalesDaily, Ledger,
+                    JournalEntry, _as_date, last_closed_date)
+from outbox import post_or_enqueue
+from inventory import issue_stock, refresh_sales_cost
+from idempotency import record
+
+MAX_SALES_PER_BATCH = 1000
+
+
+def sale_journal_entry(trans_id, tanggal, total, cost=None):
+    """Kas Tunai / Penjualan entry for one sale (saldo is filled by post_ledger).
+
+    With ``cost`` the entry also moves the goods' cost from Persediaan Barang
+    to Harga Pokok Penjualan.
+    """
+    keterangan = f"Penjualan Transaksi #{trans_id}"
+    entry = JournalEntry(
+        tanggal=tanggal, keterangan=keterangan,
+        source_type='transaction', source_id=trans_id,
+        lines=[
+            # Debit Kas Tunai
+            Ledger(
+                tanggal=tanggal, keterangan=keterangan,
+                account_name="Kas Tunai",
+                debit=total, kredit=Decimal('0.00')
+            ),
+            # Credit Penjualan
+            Ledger(
+                tanggal=tanggal, keterangan=keterangan,
+                account_name="Penjualan",
+                debit=Decimal('0.00'), kredit=total
+            ),
+        ])
+    if cost:
+        entry.lines += [
+            # Debit HPP
+            Ledger(
+                tanggal=tanggal, keterangan=keterangan,
+                account_name="Harga Pokok Penjualan",
+                debit=cost, kredit=Decimal('0.00')
+            ),
+            # Credit Persediaan Barang
+            Ledger(
+                tanggal=tanggal, keterangan=keterangan,
+                account_name="Persediaan Barang",
+                debit=Decimal('0.00'), kredit=cost
+            ),
+        ]
+    return entry
+
+
+def reserve_stock(lines):
+    """Atomically take stock for [(product_id, quantity), ...].
+
+    Quantities are summed per product and each product gets one
+    ``UPDATE products SET stock = stock - :q WHERE id = :id AND stock >= :q``,
+    so concurrent checkouts can never oversell. All-or-nothing: if any
+    product is short, the decrements already applied are put back.
+    Returns the indexes of the lines whose product could not be reserved.
+    """
+    need = {}
+    for pid, qty in lines:
+        need[pid] = need.get(pid, 0) + qty
+
+    products_t = Product.__table__
+    taken, short = [], set()
+    for pid, qty in need.items():
+        res = db.session.execute(
+            update(products_t)
+            .where(products_t.c.id == pid, products_t.c.stock >= qty)
+            .values(stock=products_t.c.stock - qty)
+        )
+        if res.rowcount == 1:
+            taken.append((pid, qty))
+        else:
+            short.add(pid)
+
+    if short:
+        release_stock(taken)
+    return [i for i, (pid, _) in enumerate(lines) if pid in short]
+
+
+def release_stock(lines):
+    """Give back stock taken by reserve_stock()."""
+    products_t = Product.__table__
+    for pid, qty in lines:
+        db.session.execute(
+            update(products_t)
+            .where(products_t.c.id == pid)
+            .values(stock=products_t.c.stock + qty)
+        )
+
+
+def record_daily_sales(sales):
+    """Add sales to the sales_daily rollup: [(tanggal, [(product_id, qty, subtotal, cost), ...]), ...].
+
+    One upsert per (day, product), executed in the caller's transaction so the
+    rollup commits or rolls back together with the sale itself.
+    """
+    rows = {}
+    for tanggal, lines in sales:
+        day = _as_date(tanggal)
+        for pid in {line[0] for line in lines}:
+            rows.setdefault((day, pid), [0, Decimal('0.00'), 0, Decimal('0.00')])[2] += 1
+        for pid, qty, subtotal, cost in lines:
+            row = rows[(day, pid)]
+            row[0] += qty
+            row[1] += subtotal
+            row[3] += cost
+    if not rows:
+        return
+
+    stmt = sqlite_insert(SalesDaily)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[SalesDaily.tanggal, SalesDaily.product_id],
+        set_={'quantity':  SalesDaily.quantity  + stmt.excluded.quantity,
+              'revenue':   SalesDaily.revenue   + stmt.excluded.revenue,
+              'cost':      SalesDaily.cost      + stmt.excluded.cost,
+              'txn_count': SalesDaily.txn_count + stmt.excluded.txn_count})
+    db.session.execute(stmt, [
+        {'tanggal': day, 'product_id': pid, 'quantity': q, 'revenue': r, 'txn_count': n,
+         'cost': c}
+        for (day, pid), (q, r, n, c) in rows.items()
+    ])
+
+
+def rebuild_sales_daily():
+    """Recompute sales_daily from transactions, transaction_items and stock_movements."""
+    items_t, trans_t = TransactionItem.__table__, Transaction.__table__
+    day = func.date(trans_t.c.date)
+    db.session.query(SalesDaily).delete()
+    db.session.execute(
+        insert(SalesDaily).from_select(
+            ['tanggal', 'product_id', 'quantity', 'revenue', 'txn_count'],
+            select(day, items_t.c.product_id,
+                   func.sum(items_t.c.quantity), func.sum(items_t.c.subtotal),
+                   func.count(items_t.c.transaction_id.distinct()))
+            .select_from(items_t.join(trans_t, trans_t.c.id == items_t.c.transaction_id))
+            .group_by(day, items_t.c.product_id)
+        )
+    )
+    refresh_sales_cost()
+    db.session.commit()
+    return db.session.query(func.count()).select_from(SalesDaily).scalar()
+
+
+def sales_vs_last_week(day=None):
+    """Per-product totals for ``day`` next to the same weekday a week earlier.
+
+    Reads two days of sales_daily through its primary key, whatever the size
+    of the transaction history.
+    """
+    day  = day or date.today()
+    prev = day - timedelta(days=7)
+    rows = (db.session.query(SalesDaily.tanggal, SalesDaily.product_id, Product.name,
+                             SalesDaily.quantity, SalesDaily.revenue, SalesDaily.txn_count)
+            .join(Product, Product.id == SalesDaily.product_id)
+            .filter(SalesDaily.tanggal.in_([day, prev])))
+    report = {}
+    for tanggal, pid, name, qty, revenue, txns in rows:
+        entry = report.setdefault(pid, {
+            'product_id': pid, 'name': name,
+            'today':     {'quantity': 0, 'revenue': '0.00', 'txn_count': 0},
+            'last_week': {'quantity': 0, 'revenue': '0.00', 'txn_count': 0},
+        })
+        entry['today' if tanggal == day else 'last_week'] = {
+            'quantity': qty, 'revenue': str(revenue),
+            'txn_count': txns,
+        }
+    return sorted(report.values(), key=lambda e: e['name'])
+
+
+def _parse_sale(sale):
+    if not isinstance(sale, dict):
+        raise ValueError("Format penjualan tidak valid.")
+    tanggal = sale.get('date')
+    try:
+        tanggal = datetime.fromisoformat(tanggal) if tanggal else datetime.utcnow()
+    except (TypeError, ValueError):
+        raise ValueError(f"Tanggal tidak valid: {tanggal!r}")
+
+    items = sale.get('items')
+    if not isinstance(items, list) or not items:
+        raise ValueError("Penjualan tanpa item.")
+    lines = []
+    for it in items:
+        try:
+            pid, qty = int(it['product_id']), int(it['quantity'])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"Item tidak valid: {it!r}")
+        if qty <= 0:
+            raise ValueError(f"Jumlah harus lebih dari 0 (produk #{pid}).")
+        lines.append((pid, qty))
+    return tanggal, lines
+
+
+def post_sales_batch(sales, idempotency=None):
+    """Validate and post many sales with one stock query and one commit.
+
+    Each sale is all-or-nothing; a rejected sale does not affect the others.
+    Returns one result dict per input sale, in input order. ``idempotency``
+    is an optional (key, fingerprint) recorded with the results in the same
+    commit (see idempotency.py).
+    """
+    if len(sales) > MAX_SALES_PER_BATCH:
+        raise ValueError(f"Maksimal {MAX_SALES_PER_BATCH} penjualan per batch.")
+
+    results = [None] * len(sales)
+    parsed  = {}
+    for idx, sale in enumerate(sales):
+        try:
+            parsed[idx] = _parse_sale(sale)
+        except ValueError as e:
+            results[idx] = {'index': idx, 'status': 'error', 'error': str(e)}
+
+    # one set-based read for the names and prices of every product in the batch;
+    # not the catalogue cache, which may lag a price change made in another process
+    ids = {pid for _, lines in parsed.values() for pid, _ in lines}
+    products = {
+        p.id: p for p in
+        db.session.query(Product.id, Product.name, Product.price)
+                  .filter(Product.id.in_(ids))
+    } if ids else {}
+
+    closed   = last_closed_date()
+    accepted = []
+    for idx, (tanggal, lines) in parsed.items():
+        if closed and _as_date(tanggal) <= closed:
+            # rejected here, before reserving stock, instead of failing the batch's journal post
+            results[idx] = {'index': idx, 'status': 'error',
+                            'error': f"Periode sampai {closed} sudah ditutup."}
+            continue
+        missing = [pid for pid, _ in lines if pid not in products]
+        if missing:
+            results[idx] = {'index': idx, 'status': 'error',
+                            'error': f"Produk #{missing[0]} tidak ditemukan."}
+            continue
+        failed = reserve_stock(lines)
+        if failed:
+            names = ', '.join(sorted({products[lines[i][0]].name for i in failed}))
+            results[idx] = {'index': idx, 'status': 'error',
+                            'error': f"Stok '{names}' tidak cukup.",
+                            'failed_lines': failed}
+            continue
+        items = [(pid, qty, products[pid].price * qty) for pid, qty in lines]
+        accepted.append((idx, tanggal, items, sum(s for _, _, s in items)))
+
+    if not accepted:
+        return results
+
+    trans_ids = db.session.execute(
+        insert(Transaction).returning(Transaction.id, sort_by_parameter_order=True),
+        [{'date': tanggal, 'total': total} for _, tanggal, _, total in accepted]
+    ).scalars().all()
+
+    db.session.execute(insert(TransactionItem), [
+        {'transaction_id': tid, 'product_id': pid, 'quantity': qty, 'subtotal': sub}
+        for tid, (_, _, items, _) in zip(trans_ids, accepted)
+        for pid, qty, sub in items
+    ])
+
+    # cost every line from the cost layers, in the same transaction
+    costs = iter(issue_stock([
+        {'tanggal': tanggal, 'product_id': pid, 'quantity': qty,
+         'source_type': 'transaction', 'source_id': tid}
+        for tid, (_, tanggal, items, _) in zip(trans_ids, accepted)
+        for pid, qty, _ in items
+    ]))
+    costed = [(tid, tanggal, [(pid, qty, sub, next(costs)) for pid, qty, sub in items], total)
+              for tid, (_, tanggal, items, total) in zip(trans_ids, accepted)]
+
+    post_or_enqueue(*(sale_journal_entry(tid, tanggal, total, sum(c for *_, c in items))
+                      for tid, tanggal, items, total in costed))
+    record_daily_sales((tanggal, items) for _, tanggal, items, _ in costed)
+
+    for tid, (idx, _, _, total) in zip(trans_ids, accepted):
+        results[idx] = {'index': idx, 'status': 'ok',
+                        'transaction_id': tid, 'total': str(total)}
+    if idempotency:
+        record('sales_batch', *idempotency, results)
+    db.session.commit()
+    return results
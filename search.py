@@ -0,0 +1,117 @@
+# search.py
+#
+# Full-text search with SQLite FTS5. ledger_fts indexes ledger_entries.keterangan
+# and products_fts indexes products.name; both are external-content tables
+# (they store only the index, not a copy of the text) kept in sync by triggers.
+
+import re
+
+from sqlalchemy import text, select, column, table, false
+
+from models import db, Ledger, Product, account_id_of
+
+SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 200
+
+# fts table -> (source table, indexed column)
+FTS_TABLES = {
+    'ledger_fts':   ('ledger_entries', 'keterangan'),
+    'products_fts': ('products',       'name'),
+}
+
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+
+def _fts_ddl():
+    for fts, (src, col) in FTS_TABLES.items():
+        yield 'table', fts, f"""
+            CREATE VIRTUAL TABLE {fts} USING fts5(
+              {col}, content='{src}', content_rowid='id',
+              tokenize='unicode61 remove_diacritics 2')"""
+        yield 'trigger', f"trg_{src}_fts_ins", f"""
+            CREATE TRIGGER trg_{src}_fts_ins AFTER INSERT ON {src} BEGIN
+              INSERT INTO {fts} (rowid, {col}) VALUES (NEW.id, NEW.{col});
+            END"""
+        yield 'trigger', f"trg_{src}_fts_upd", f"""
+            CREATE TRIGGER trg_{src}_fts_upd AFTER UPDATE OF {col} ON {src} BEGIN
+              INSERT INTO {fts} ({fts}, rowid, {col}) VALUES ('delete', OLD.id, OLD.{col});
+              INSERT INTO {fts} (rowid, {col}) VALUES (NEW.id, NEW.{col});
+            END"""
+        yield 'trigger', f"trg_{src}_fts_del", f"""
+            CREATE TRIGGER trg_{src}_fts_del AFTER DELETE ON {src} BEGIN
+              INSERT INTO {fts} ({fts}, rowid, {col}) VALUES ('delete', OLD.id, OLD.{col});
+            END"""
+
+
+def rebuild_search_index():
+    """Rebuild every FTS index from its source table."""
+    for fts in FTS_TABLES:
+        db.session.execute(text(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')"))
+    db.session.commit()
+
+
+def ensure_search_index():
+    """Create missing FTS tables and triggers; rebuild the index if anything was missing."""
+    installed = {(row[0], row[1]) for row in db.session.execute(
+        text("SELECT type, name FROM sqlite_master WHERE type IN ('table', 'trigger')"))}
+    missing = [(name, ddl) for kind, name, ddl in _fts_ddl() if (kind, name) not in installed]
+    for _, ddl in missing:
+        db.session.execute(text(ddl))
+    db.session.commit()
+    if missing:
+        rebuild_search_index()
+    return [name for name, _ in missing]
+
+
+def match_expression(query):
+    """User text -> FTS5 MATCH expression: every word must match as a prefix.
+
+    Words are quoted, so FTS5 operators and punctuation in the input
+    ("#1234", "AND", "-") are searched literally instead of being parsed.
+    Each word is also offered as an exact token, so "1234" ranks
+    'Transaksi #1234' above 'Transaksi #12345'.
+    """
+    return ' AND '.join(f'("{tok}" OR "{tok}"*)' for tok in _TOKEN.findall(query or ''))
+
+
+def matching_ids(fts, query):
+    """SELECT of source-row ids matching ``query``, for use in an IN (...) filter."""
+    fts_t = table(fts, column('rowid'), column(fts))
+    expr  = match_expression(query)
+    if not expr:
+        return select(fts_t.c.rowid).where(false())
+    return select(fts_t.c.rowid).where(fts_t.c[fts].op('MATCH')(expr))
+
+
+def _ranked(fts, query, limit):
+    # bm25 rank first; among equal ranks newest rows first
+    return db.session.execute(text(
+        f"SELECT rowid FROM {fts} WHERE {fts} MATCH :q ORDER BY rank, rowid DESC LIMIT :n"
+    ), {'q': match_expression(query), 'n': limit}).scalars().all()
+
+
+def search_ledger(query, limit=SEARCH_LIMIT, account_name=None):
+    """Ledger rows whose keterangan matches ``query``, best match first."""
+    if not match_expression(query):
+        return []
+    if account_name:
+        # rank within the account: filter inside the FTS query, not after the LIMIT
+        account_id = account_id_of(account_name, create=False)
+        ids = db.session.execute(text(
+            "SELECT f.rowid FROM ledger_fts AS f JOIN ledger_entries AS l ON l.id = f.rowid "
+            "WHERE ledger_fts MATCH :q AND l.account_id = :a "
+            "ORDER BY f.rank, f.rowid DESC LIMIT :n"
+        ), {'q': match_expression(query), 'a': account_id, 'n': limit}).scalars().all()
+    else:
+        ids = _ranked('ledger_fts', query, limit)
+    rows = {r.id: r for r in Ledger.query.filter(Ledger.id.in_(ids))}
+    return [rows[i] for i in ids if i in rows]
+
+
+def search_products(query, limit=SEARCH_LIMIT):
+    """Products whose name matches ``query``, best match first."""
+    if not match_expression(query):
+        return []
+    ids  = _ranked('products_fts', query, limit)
+    rows = {p.id: p for p in Product.query.filter(Product.id.in_(ids))}
+    return [rows[i] for i in ids if i in rows]